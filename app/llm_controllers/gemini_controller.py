@@ -1,72 +1,704 @@
 import json
-import requests
+import copy
+import math
+import asyncio
+import hashlib
+import functools
+import tempfile
+import aiohttp
 import os
 import logging
-from PIL import Image
-from io import BytesIO
-from google import genai
 from fastapi import HTTPException, status
-from sentry_sdk import capture_exception
 from dotenv import load_dotenv
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
+from pydantic import BaseModel, ValidationError
+from app.models import AdInsights, CarouselInsights
+from app.utils.cache import LRUCache, DiskCache, TwoTierCache
+from app.utils.singleflight import SingleFlight
+from app.utils.hash_index import HammingIndex
+from app.utils.telemetry import capture_exception
+from app.utils.brand_rollups import get_brand_rollup_stats, record_brand_insight
+from app.utils.metrics import (
+    analysis_errors,
+    near_duplicate_reuses,
+    observe_request,
+    observe_stage,
+    record_token_usage,
+    registry,
+)
+from app.llm_controllers.json_stream import IncrementalJSONObjectParser
+from app.llm_controllers.prompts import AD_INSIGHTS, CAROUSEL, find_prompt
+from app.llm_controllers.prompt_cache import PromptCache
+from app.llm_controllers.resilience import AIMDLimiter, CallPolicy, CircuitBreaker, CircuitOpenError, HedgePolicy
+from app.llm_controllers.image_processing import (
+    PERCEPTUAL_HASHES,
+    PREPROCESS_SIGNATURE,
+    check_content_length,
+    check_content_type,
+    get_preprocessing_stats,
+    preprocess_image,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-load_dotenv()   
+load_dotenv()
 
-# Initialize Gemini API client
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is not set")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+# Override the Gemini API endpoint, e.g. to point at the local fake in benchmarks/
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+# Connection pool configuration for image downloads
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "20"))
 
-def analyze_image(image_url: str, prompt: str):
+# Limits applied to every Gemini call. A rate of 0 disables that bucket.
+GEMINI_MAX_RPS = float(os.environ.get("GEMINI_MAX_RPS", "30"))
+GEMINI_MAX_TPM = float(os.environ.get("GEMINI_MAX_TPM", "0"))
+GEMINI_ESTIMATED_TOKENS = float(os.environ.get("GEMINI_ESTIMATED_TOKENS", "2000"))
+GEMINI_CONCURRENCY_INITIAL = int(os.environ.get("GEMINI_CONCURRENCY_INITIAL", "16"))
+GEMINI_CONCURRENCY_MIN = int(os.environ.get("GEMINI_CONCURRENCY_MIN", "1"))
+GEMINI_CONCURRENCY_MAX = int(os.environ.get("GEMINI_CONCURRENCY_MAX", "64"))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", "4"))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get("GEMINI_RETRY_MAX_DELAY", "20"))
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_RESET_SECONDS = float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30"))
+
+# Hedged requests: a generate_content call still running after the given
+# percentile of recent latency gets one backup request, and the slower of the
+# two is cancelled. GEMINI_HEDGE_BUDGET caps the extra calls as a fraction of
+# all calls.
+GEMINI_HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "0.95"))
+GEMINI_HEDGE_BUDGET = float(os.environ.get("GEMINI_HEDGE_BUDGET", "0.05"))
+GEMINI_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("GEMINI_HEDGE_MIN_DELAY_SECONDS", "0.05"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+gemini_policy = CallPolicy(
+    requests_per_second=GEMINI_MAX_RPS or None,
+    tokens_per_minute=GEMINI_MAX_TPM or None,
+    concurrency=AIMDLimiter(
+        initial=GEMINI_CONCURRENCY_INITIAL,
+        minimum=GEMINI_CONCURRENCY_MIN,
+        maximum=GEMINI_CONCURRENCY_MAX,
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=GEMINI_BREAKER_THRESHOLD,
+        reset_timeout=GEMINI_BREAKER_RESET_SECONDS,
+    ),
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    base_delay=GEMINI_RETRY_BASE_DELAY,
+    max_delay=GEMINI_RETRY_MAX_DELAY,
+    hedge=HedgePolicy(
+        percentile=GEMINI_HEDGE_PERCENTILE,
+        budget=GEMINI_HEDGE_BUDGET,
+        min_delay=GEMINI_HEDGE_MIN_DELAY_SECONDS,
+        min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+    ) if GEMINI_HEDGE_ENABLED else None,
+)
+
+# Shared clients, created once by init_clients() at app startup
+client: Optional[Any] = None
+http_session: Optional[aiohttp.ClientSession] = None
+
+# Images packed into one model call by the carousel endpoint. Larger packs
+# send the instructions once for more images but make each call slower.
+CAROUSEL_PACK_SIZE = int(os.environ.get("CAROUSEL_PACK_SIZE", "5"))
+CAROUSEL_MAX_PACK_SIZE = int(os.environ.get("CAROUSEL_MAX_PACK_SIZE", "10"))
+
+# Concurrency bounds for the batch ad insights endpoint
+BATCH_DEFAULT_CONCURRENCY = int(os.environ.get("BATCH_DEFAULT_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "32"))
+
+# Result cache configuration. Setting RESULT_CACHE_DIR to an empty string
+# keeps the cache in memory only.
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "adzcrypt", "gemini_results")
+)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+result_cache = TwoTierCache(
+    LRUCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL_SECONDS),
+    DiskCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL_SECONDS)
+    if RESULT_CACHE_DIR else None,
+)
+
+# Coalesce identical in-flight analyses, first by URL and then by image content
+url_flights = SingleFlight("url")
+image_flights = SingleFlight("image")
+
+# Near-duplicate reuse for ad insights: a resized, re-compressed or slightly
+# cropped copy of an analyzed creative is matched on its perceptual hash.
+# Off by default: A/B and price variants that differ only in their text hash
+# within a few bits of each other, and would get another ad's offer, text and CTA.
+# Setting NEAR_DUPLICATE_INDEX_DIR to an empty string keeps the index in memory only.
+NEAR_DUPLICATE_ENABLED = os.environ.get("NEAR_DUPLICATE_ENABLED", "false").lower() == "true"
+NEAR_DUPLICATE_HASH = os.environ.get("NEAR_DUPLICATE_HASH", "phash").lower()
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", "8"))
+NEAR_DUPLICATE_INDEX_DIR = os.environ.get(
+    "NEAR_DUPLICATE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "adzcrypt", "near_duplicates")
+)
+
+if NEAR_DUPLICATE_HASH not in PERCEPTUAL_HASHES:
+    raise ValueError(f"NEAR_DUPLICATE_HASH must be one of {sorted(PERCEPTUAL_HASHES)}, got {NEAR_DUPLICATE_HASH}")
+
+# Built-in prompts come from the template registry in prompts.py
+AD_INSIGHTS_PROMPT = AD_INSIGHTS.text
+CAROUSEL_PROMPT = CAROUSEL.text
+
+# Register built-in prompt prefixes as Gemini cached content so their tokens
+# are not billed in full on every call. The TTL is extended once less than
+# the refresh margin remains; after a failure calls send the prompt inline
+# until the retry interval has passed. Off by default: the built-in prefixes
+# are far below the API's minimum cacheable size (1024 tokens for Gemini 2.5
+# Flash, 4096 for most other models), and prefixes below
+# GEMINI_PROMPT_CACHE_MIN_TOKENS are always sent inline.
+GEMINI_PROMPT_CACHE_ENABLED = os.environ.get("GEMINI_PROMPT_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_PROMPT_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_PROMPT_CACHE_TTL_SECONDS", "3600"))
+GEMINI_PROMPT_CACHE_REFRESH_SECONDS = int(os.environ.get("GEMINI_PROMPT_CACHE_REFRESH_SECONDS", "300"))
+GEMINI_PROMPT_CACHE_RETRY_SECONDS = int(os.environ.get("GEMINI_PROMPT_CACHE_RETRY_SECONDS", "600"))
+GEMINI_PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("GEMINI_PROMPT_CACHE_MIN_TOKENS", "4096"))
+
+prompt_cache = PromptCache(
+    enabled=GEMINI_PROMPT_CACHE_ENABLED,
+    ttl_seconds=GEMINI_PROMPT_CACHE_TTL_SECONDS,
+    refresh_margin_seconds=GEMINI_PROMPT_CACHE_REFRESH_SECONDS,
+    retry_seconds=GEMINI_PROMPT_CACHE_RETRY_SECONDS,
+    min_tokens=GEMINI_PROMPT_CACHE_MIN_TOKENS,
+)
+
+
+async def init_clients(gemini_client: Optional[Any] = None):
     """
-    Analyze an image using Gemini API and return structured analysis.
-    
+    Create the shared Gemini client and pooled HTTP session.
+
+    Called once from the FastAPI lifespan so every request reuses the same
+    keep-alive connections.
+
     Args:
-        image_url: URL of the image to analyze
-        prompt: Optional custom prompt for the image analysis
-        
+        gemini_client: Optional client to use instead of genai.Client, e.g. a local fake
+    """
+    global client, http_session
+
+    if gemini_client is not None:
+        client = gemini_client
+    elif client is None:
+        if not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY environment variable is not set")
+        # Imported here because google.genai is the heaviest import in the app
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+        client = genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_MAX_CONNECTIONS,
+            limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    logger.info("Initialized Gemini client and HTTP session")
+
+
+async def close_clients():
+    """
+    Close the pooled HTTP session created by init_clients() and delete the cached prompts.
+    """
+    global http_session
+
+    if client is not None:
+        await prompt_cache.close(client)
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+    logger.info("Closed HTTP session")
+
+
+async def _ensure_clients():
+    # Serverless runtimes may not run the lifespan, so create clients on first use
+    if client is None or http_session is None or http_session.closed:
+        await init_clients()
+
+
+def get_cache_stats():
+    """
+    Get hit/miss counters for the analysis result cache.
+
     Returns:
-        dict: Structured analysis of the image
+        dict: Cache statistics for the memory and disk tiers
     """
-    try:
-        # Download the image from URL
-        response = requests.get(image_url)
-        if response.status_code != 200:
+    return result_cache.stats()
+
+
+def get_stats():
+    """
+    Get monitoring counters for the analysis pipeline.
+
+    Returns:
+        dict: Result cache, request coalescing, image preprocessing, Gemini call
+        policy, near-duplicate index, cached prompt and brand rollup statistics
+    """
+    return {
+        "cache": result_cache.stats(),
+        "coalescing": {
+            "url": url_flights.stats(),
+            "image": image_flights.stats(),
+        },
+        "preprocessing": get_preprocessing_stats(),
+        "gemini": gemini_policy.stats(),
+        "near_duplicates": ad_insights_index.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "brand_rollups": get_brand_rollup_stats(),
+    }
+
+
+def _metric_samples():
+    """Export the pipeline counters from get_stats() to /metrics at scrape time."""
+    cache = result_cache.stats()
+    gemini = gemini_policy.stats()
+    concurrency = gemini["concurrency"]
+    breaker = gemini["circuit_breaker"]
+    samples = [
+        ("result_cache_hits_total", "counter", "Analysis result cache hits", {}, cache["hits"]),
+        ("result_cache_misses_total", "counter", "Analysis result cache misses", {}, cache["misses"]),
+        ("result_cache_bypassed_total", "counter", "Analyses that skipped the result cache", {}, cache["bypassed"]),
+        ("result_cache_entries", "gauge", "Entries in the in-memory result cache", {}, cache["memory"]["entries"]),
+        ("gemini_calls_total", "counter", "Gemini calls made through the call policy", {}, gemini["calls"]),
+        ("gemini_retries_total", "counter", "Gemini call attempts that were retried", {}, gemini["retries"]),
+        ("gemini_failures_total", "counter", "Gemini calls that failed after all attempts", {}, gemini["failures"]),
+        ("gemini_throttled_total", "counter", "Gemini calls throttled with 429", {}, concurrency["throttled"]),
+        ("gemini_concurrency_limit", "gauge", "Current adaptive Gemini concurrency limit", {}, concurrency["limit"]),
+        ("gemini_in_flight", "gauge", "Gemini calls currently in flight", {}, concurrency["in_flight"]),
+        ("gemini_circuit_open", "gauge", "1 when the Gemini circuit breaker is open", {}, int(breaker["state"] == CircuitBreaker.OPEN)),
+        ("gemini_circuit_rejected_total", "counter", "Calls rejected by the open circuit breaker", {}, breaker["rejected"]),
+    ]
+    hedging = gemini["hedging"]
+    if hedging is not None:
+        samples.append(("gemini_hedges_fired_total", "counter", "Backup Gemini requests sent for slow calls", {}, hedging["fired"]))
+        samples.append(("gemini_hedges_won_total", "counter", "Hedged calls answered by the backup request", {}, hedging["won"]))
+        samples.append(("gemini_hedges_over_budget_total", "counter", "Slow calls not hedged because the budget was spent", {}, hedging["over_budget"]))
+    if cache["disk"] is not None:
+        samples.append(("result_cache_disk_bytes", "gauge", "Size of the on-disk result cache", {}, cache["disk"]["bytes"]))
+    for name, flights in (("url", url_flights), ("image", image_flights)):
+        flight_stats = flights.stats()
+        samples.append(("coalesced_requests_total", "counter", "Requests that joined an in-flight identical analysis", {"level": name}, flight_stats["coalesced"]))
+        samples.append(("coalesced_in_flight", "gauge", "Distinct analyses currently in flight", {"level": name}, flight_stats["in_flight"]))
+    samples.append(("near_duplicate_index_entries", "gauge", "Images in the near-duplicate index", {}, ad_insights_index.stats()["entries"]))
+    prompts = prompt_cache.stats()
+    samples.append(("prompt_cache_active", "gauge", "Prompt prefixes currently registered as cached content", {}, prompts["active"]))
+    for outcome in ("created", "refreshed", "referenced", "inline", "failures", "invalidated", "below_minimum"):
+        samples.append(("prompt_cache_events_total", "counter", "Cached prompt prefix events by outcome", {"outcome": outcome}, prompts[outcome]))
+    rollups = get_brand_rollup_stats()
+    if rollups is not None:
+        samples.append(("brand_rollup_queued", "gauge", "Analyses waiting to be applied to the brand rollups", {}, rollups["queued"]))
+        for outcome in ("applied", "unchanged", "dropped", "failed"):
+            samples.append(("brand_rollup_analyses_total", "counter", "Analyses recorded for the brand rollups by outcome", {"outcome": outcome}, rollups[outcome]))
+    preprocessing = get_preprocessing_stats()
+    samples.append(("preprocessed_images_total", "counter", "Images run through preprocessing", {}, preprocessing["images"]))
+    samples.append(("preprocessed_bytes_saved_total", "counter", "Upload bytes saved by image preprocessing", {}, preprocessing["bytes_saved"]))
+    return samples
+
+
+registry.add_collector(_metric_samples)
+
+
+def _cache_key(image_bytes: bytes, prompt: str, model: str) -> str:
+    """Build a content-addressed cache key from the image bytes, prompt and model."""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((prompt or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+async def _download_image(image_url: str) -> bytes:
+    """
+    Download the raw image bytes from a URL over the shared HTTP session.
+
+    The body is streamed with a byte cap so oversized or non-image responses
+    are rejected before they are buffered in full.
+    """
+    with observe_stage("download"):
+        try:
+            async with http_session.get(image_url) as response:
+                if response.status != 200:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Failed to download image from URL: {image_url}"
+                    )
+                check_content_type(response.headers.get("Content-Type"), image_url)
+                check_content_length(response.content_length, image_url)
+
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer.extend(chunk)
+                    check_content_length(len(buffer), image_url)
+                content = bytes(buffer)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to download image from URL: {image_url}"
+                detail=f"Failed to download image from URL: {image_url} ({type(e).__name__})"
             )
-        logger.info("Downloaded image")
-        logger.info(f"The client is {client}")
-        # Open the image
-        image = Image.open(BytesIO(response.content))
-
-        # Generate response using Gemini API
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt, image]
+    logger.info("Downloaded image")
+    return content
+
+
+def _parse_json_response(response_text: str) -> dict:
+    """Extract the JSON object from a Gemini text response."""
+    response_text = response_text.strip()
+    start = response_text.find("{")
+    end = response_text.rfind("}")
+
+    if start == -1 or end == -1:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to parse Gemini API response"
         )
-        logger.info(f"Generated response: {response}")
-        # Extract response content
-        response_text = response.text.strip()
-        start = response_text.find("{")
-        end = response_text.rfind("}")
-        
-        if start == -1 or end == -1:
+
+    return json.loads(response_text[start : end + 1])
+
+
+async def _image_part(image_bytes: bytes):
+    """Decode and shrink the image off the event loop and wrap it for the Gemini API."""
+    from google.genai import types
+
+    with observe_stage("preprocess"):
+        image = await asyncio.to_thread(preprocess_image, image_bytes)
+    return types.Part.from_bytes(data=image.data, mime_type=image.mime_type)
+
+
+def _user_content(*items: Any):
+    """
+    Wrap text and parts in one explicit user Content.
+
+    A bare Part in a contents list is coerced into an empty Content by the
+    pinned pydantic, which silently drops the image from the request. None
+    items, such as a missing custom prompt, are skipped.
+    """
+    from google.genai import types
+
+    parts = [types.Part.from_text(text=item) if isinstance(item, str) else item for item in items if item is not None]
+    return types.Content(role="user", parts=parts)
+
+
+async def _generate_content(
+    prompt: str,
+    items: Sequence[Any],
+    config_options: Optional[Dict[str, Any]] = None,
+    estimated_tokens: float = GEMINI_ESTIMATED_TOKENS,
+) -> Any:
+    """
+    Call generate_content with the prompt followed by items.
+
+    A registered prompt template is referenced as cached content instead of
+    being sent inline. If the API no longer recognizes the cached content,
+    e.g. because it expired early, the call is repeated with the prompt inline.
+
+    Args:
+        prompt: Instructions sent before the items
+        items: Text and image parts following the prompt
+        config_options: GenerateContentConfig fields, e.g. the response schema
+        estimated_tokens: Tokens charged to the tokens-per-minute bucket before the call
+
+    Returns:
+        Any: The Gemini API response
+    """
+    from google.genai import types
+    from google.genai import errors as genai_errors
+
+    template = find_prompt(prompt)
+    cached_content = await prompt_cache.resolve(client, GEMINI_MODEL, template)
+    # Latency grows with the number of images, so each prompt and image count is hedged separately
+    images = sum(1 for item in items if not isinstance(item, str))
+    hedge_key = f"{template.name if template is not None else 'custom'}:{images}"
+
+    def request(cached_content: Optional[str]) -> Callable[[], Awaitable[Any]]:
+        options = dict(config_options or {})
+        if cached_content is not None:
+            contents = _user_content(*items)
+            options["cached_content"] = cached_content
+        else:
+            contents = _user_content(prompt, *items)
+        config = types.GenerateContentConfig(**options) if options else None
+        return lambda: client.aio.models.generate_content(model=GEMINI_MODEL, contents=contents, config=config)
+
+    try:
+        return await call_gemini(request(cached_content), estimated_tokens=estimated_tokens, hedge_key=hedge_key)
+    except genai_errors.ClientError as e:
+        if cached_content is None or e.code not in (403, 404):
+            raise
+        logger.warning(f"Cached prompt {cached_content} was rejected ({e.code}), retrying with the prompt inline")
+        prompt_cache.invalidate(GEMINI_MODEL, template, cached_content)
+        return await call_gemini(request(None), estimated_tokens=estimated_tokens, hedge_key=hedge_key)
+
+
+def _validate_response(response_text: str, response_schema: Type[BaseModel]) -> dict:
+    """Validate schema-constrained JSON output and return it with its API keys."""
+    try:
+        return response_schema.model_validate_json(response_text).model_dump(by_alias=True)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Gemini API response did not match the {response_schema.__name__} schema: {e.error_count()} errors"
+        )
+
+
+def _add_property_ordering(schema: Any):
+    """Pin the output key order to the field order, as the SDK does for model classes."""
+    if isinstance(schema, dict):
+        if isinstance(schema.get("properties"), dict):
+            schema["propertyOrdering"] = list(schema["properties"])
+        for value in schema.values():
+            _add_property_ordering(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            _add_property_ordering(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _model_json_schema(response_schema: Type[BaseModel]) -> dict:
+    schema = response_schema.model_json_schema()
+    _add_property_ordering(schema)
+    return schema
+
+
+def _json_schema(response_schema: Type[BaseModel]) -> dict:
+    """
+    JSON schema for a response model, keyed by its aliases.
+
+    The SDK is given this dict rather than the model class because pydantic
+    2.4 cannot serialize a GenerateContentConfig holding a class. A fresh
+    copy is returned each time since the SDK rewrites the dict in place.
+    """
+    return copy.deepcopy(_model_json_schema(response_schema))
+
+
+def _total_tokens(response) -> Optional[float]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+async def call_gemini(
+    fn: Callable[[], Awaitable[Any]],
+    estimated_tokens: float = GEMINI_ESTIMATED_TOKENS,
+    hedge_key: Optional[str] = None,
+) -> Any:
+    """
+    Make a Gemini API call through the shared rate limiter, retry policy and circuit breaker.
+
+    Args:
+        fn: Coroutine factory making one attempt, e.g. lambda: client.aio.models.generate_content(...)
+        estimated_tokens: Tokens charged to the tokens-per-minute bucket before the call
+        hedge_key: Calls with comparable latency, for hedging slow attempts when enabled.
+            None for calls that must not be sent twice, such as streams.
+
+    Returns:
+        Any: The Gemini API response
+    """
+    try:
+        return await gemini_policy.call(
+            fn, estimated_tokens=estimated_tokens, actual_tokens=_total_tokens, hedge_key=hedge_key
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Gemini API is temporarily unavailable, try again later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except Exception as e:
+        from google.genai import errors as genai_errors
+
+        if not isinstance(e, genai_errors.APIError):
+            raise
+        if e.code == 429:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to parse Gemini API response"
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Gemini API quota exhausted, try again later",
             )
-            
-        details = json.loads(response_text[start : end + 1])
-                    
+        if e.code is not None and e.code >= 500:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Gemini API error: {e.message}",
+            )
+        raise
+
+
+def _log_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    record_token_usage(usage)
+    if usage is not None:
+        logger.info(
+            f"Gemini usage: prompt_tokens={usage.prompt_token_count} "
+            f"output_tokens={usage.candidates_token_count} total_tokens={usage.total_token_count}"
+        )
+
+
+async def _generate_details(image_bytes: bytes, prompt: str, response_schema: Optional[Type[BaseModel]] = None) -> dict:
+    """
+    Run the Gemini call for an image and parse the JSON it returns.
+
+    With a response_schema the model is constrained to JSON matching it and
+    the output is validated instead of being sliced out of free text.
+    """
+    image_part = await _image_part(image_bytes)
+
+    config_options = None
+    if response_schema is not None:
+        config_options = {
+            "response_mime_type": "application/json",
+            "response_schema": _json_schema(response_schema),
+        }
+
+    # Generate response using Gemini API
+    with observe_stage("gemini"):
+        response = await _generate_content(prompt, [image_part], config_options)
+    _log_usage(response)
+
+    with observe_stage("parse"):
+        if response_schema is not None:
+            return _validate_response(response.text, response_schema)
+        return _parse_json_response(response.text)
+
+
+async def _generate_and_store(
+    key: str,
+    image_bytes: bytes,
+    prompt: str,
+    response_schema: Optional[Type[BaseModel]],
+    index: Optional[HammingIndex] = None,
+    image_hash: Optional[int] = None,
+) -> dict:
+    details = await _generate_details(image_bytes, prompt, response_schema)
+    await asyncio.to_thread(result_cache.set, key, details)
+    if index is not None and image_hash is not None:
+        await asyncio.to_thread(index.add, image_hash, key)
+    return details
+
+
+async def _near_duplicate_details(index: HammingIndex, image_hash: int, key: str, image_url: str) -> Optional[dict]:
+    """
+    Reuse the cached result of a perceptually similar image, if one is indexed.
+
+    The reused result is also stored under this image's own key, so the next
+    request for the same bytes is an exact cache hit.
+    """
+    matches = await asyncio.to_thread(index.search, image_hash, NEAR_DUPLICATE_MAX_DISTANCE)
+    for distance, match_key in matches:
+        if match_key == key:
+            continue
+        details = await asyncio.to_thread(result_cache.get, match_key)
+        if details is None:
+            # The result aged out of the cache; try the next closest image
+            continue
+        logger.info(f"Reusing near-duplicate result for {image_url} (distance {distance})")
+        near_duplicate_reuses.inc(distance=distance)
+        await asyncio.to_thread(result_cache.set, key, details)
         return details
-        
+    return None
+
+
+def _perceptual_hash(image_bytes: bytes) -> int:
+    with observe_stage("phash"):
+        return PERCEPTUAL_HASHES[NEAR_DUPLICATE_HASH](image_bytes)
+
+
+def _model_signature(response_schema: Optional[Type[BaseModel]] = None) -> str:
+    """Identify everything besides the prompt and image that shapes a result."""
+    schema_name = response_schema.__name__ if response_schema is not None else "text"
+    return f"{GEMINI_MODEL}|{PREPROCESS_SIGNATURE}|{schema_name}"
+
+
+async def _fetch_details(
+    image_url: str,
+    prompt: str,
+    use_cache: bool,
+    response_schema: Optional[Type[BaseModel]] = None,
+    index: Optional[HammingIndex] = None,
+) -> dict:
+    """
+    Download an image and analyze it, consulting the result cache unless bypassed.
+
+    With an index, a cache miss falls back to the result of a perceptually
+    similar image before calling Gemini.
+    """
+    image_bytes = await _download_image(image_url)
+    key = _cache_key(image_bytes, prompt, _model_signature(response_schema))
+
+    # Different URLs can serve the same bytes, so the model call is coalesced
+    # again on the content hash.
+    if not use_cache:
+        result_cache.bypassed += 1
+        return await image_flights.do(("fresh", key), lambda: _generate_details(image_bytes, prompt, response_schema))
+
+    details = await asyncio.to_thread(result_cache.get, key)
+    if details is not None:
+        logger.info(f"Result cache hit for {image_url}")
+        return details
+
+    image_hash = None
+    if index is not None:
+        image_hash = await asyncio.to_thread(_perceptual_hash, image_bytes)
+        details = await _near_duplicate_details(index, image_hash, key, image_url)
+        if details is not None:
+            return details
+
+    return await image_flights.do(
+        key, lambda: _generate_and_store(key, image_bytes, prompt, response_schema, index, image_hash)
+    )
+
+
+async def _cached_details(
+    image_url: str,
+    prompt: str,
+    use_cache: bool,
+    response_schema: Optional[Type[BaseModel]] = None,
+    index: Optional[HammingIndex] = None,
+) -> dict:
+    """
+    Return the analysis for an image URL, served from the result cache when possible.
+
+    Concurrent identical requests share one download and one Gemini call.
+    """
+    await _ensure_clients()
+    key = (image_url, prompt, _model_signature(response_schema), use_cache)
+    details = await url_flights.do(key, lambda: _fetch_details(image_url, prompt, use_cache, response_schema, index))
+    # The result is shared with coalesced callers and the cache
+    return copy.deepcopy(details)
+
+
+async def analyze_image(image_url: str, prompt: str, use_cache: bool = True):
+    """
+    Analyze an image using Gemini API and return structured analysis.
+
+    Args:
+        image_url: URL of the image to analyze
+        prompt: Optional custom prompt for the image analysis
+        use_cache: Whether to serve and store the result in the result cache
+
+    Returns:
+        dict: Structured analysis of the image
+    """
+    try:
+        with observe_request("analyze"):
+            return await _cached_details(image_url, prompt, use_cache)
+
     except HTTPException as http_ex:
         capture_exception(http_ex)
         raise http_ex
@@ -75,80 +707,143 @@ def analyze_image(image_url: str, prompt: str):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to analyze image: {str(e)}"
-        ) 
-    
+        )
+
 
-def get_ad_details(image_url: str, brand_id: int = None):
+async def analyze_image_stream(image_url: str, prompt: str, use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Analyze an image using Gemini API, streaming the response as it is generated.
+
+    Args:
+        image_url: URL of the image to analyze
+        prompt: Optional custom prompt for the image analysis
+        use_cache: Whether to serve and store the result in the result cache
+
+    Yields:
+        tuple: (event, data) where event is "token" for raw text chunks, "key" for
+        each completed top-level {key: value}, "result" for the parsed object,
+        or "error" for a failure
+    """
+    try:
+        await _ensure_clients()
+        image_bytes = await _download_image(image_url)
+        key = _cache_key(image_bytes, prompt, _model_signature())
+
+        if use_cache:
+            details = await asyncio.to_thread(result_cache.get, key)
+            if details is not None:
+                logger.info(f"Result cache hit for {image_url}")
+                details = copy.deepcopy(details)
+                for name, value in details.items():
+                    yield "key", {name: value}
+                yield "result", details
+                return
+        else:
+            result_cache.bypassed += 1
+
+        image_part = await _image_part(image_bytes)
+        parser = IncrementalJSONObjectParser()
+        chunks = []
+        usage_chunk = None
+        # The gemini stage includes the time the client spends reading tokens
+        with observe_stage("gemini"):
+            stream = await call_gemini(lambda: client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=_user_content(prompt, image_part),
+            ))
+            async for chunk in stream:
+                if getattr(chunk, "usage_metadata", None) is not None:
+                    usage_chunk = chunk
+                text = chunk.text or ""
+                if not text:
+                    continue
+                chunks.append(text)
+                yield "token", text
+                for name, value in parser.feed(text):
+                    yield "key", {name: value}
+        if usage_chunk is not None:
+            _log_usage(usage_chunk)
+
+        details = parser.result if parser.done else None
+        if details is None:
+            with observe_stage("parse"):
+                details = _parse_json_response("".join(chunks))
+        if use_cache:
+            await asyncio.to_thread(result_cache.set, key, details)
+        yield "result", details
+
+    except HTTPException as http_ex:
+        capture_exception(http_ex)
+        analysis_errors.inc(operation="analyze_stream", status_code=http_ex.status_code)
+        yield "error", {"status_code": http_ex.status_code, "detail": http_ex.detail}
+    except Exception as e:
+        capture_exception(e)
+        analysis_errors.inc(operation="analyze_stream", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        yield "error", {
+            "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "detail": f"Failed to analyze image: {str(e)}",
+        }
+
+
+def _near_duplicate_index(prompt: str, response_schema: Type[BaseModel]) -> HammingIndex:
+    """Index for one prompt and schema; a model or preprocessing change starts a new index."""
+    scope = hashlib.sha256(
+        f"{_model_signature(response_schema)}|{NEAR_DUPLICATE_HASH}|{prompt}".encode("utf-8")
+    ).hexdigest()[:16]
+    path = os.path.join(NEAR_DUPLICATE_INDEX_DIR, f"{scope}.json") if NEAR_DUPLICATE_INDEX_DIR else None
+    return HammingIndex(path)
+
+
+# Perceptual hashes of analyzed ad creatives, mapped to their result cache keys
+ad_insights_index = _near_duplicate_index(AD_INSIGHTS_PROMPT, AdInsights)
+
+
+async def load_near_duplicate_index():
+    """
+    Load the near-duplicate index from disk. Called from the FastAPI lifespan;
+    the index is otherwise loaded on first use.
+    """
+    if NEAR_DUPLICATE_ENABLED:
+        await asyncio.to_thread(ad_insights_index.load)
+
+
+async def save_near_duplicate_index():
+    """
+    Compact the near-duplicate index into a snapshot so the next startup loads it in one pass.
+    """
+    if NEAR_DUPLICATE_ENABLED:
+        await asyncio.to_thread(ad_insights_index.save)
+
+
+async def get_ad_details(image_url: str, brand_id: int = None, use_cache: bool = True):
     """
     Analyze an image using Gemini API and return structured analysis.
-    
+
     Args:
         image_url: URL of the image to analyze
         brand_id: Optional brand ID associated with the image
-        
+        use_cache: Whether to serve and store the result in the result cache
+
     Returns:
         dict: Structured analysis of the image
     """
     try:
-        # Download the image from URL
-        response = requests.get(image_url)
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to download image from URL: {image_url}"
+        with observe_request("get_ad_insights"):
+            details = await _cached_details(
+                image_url,
+                AD_INSIGHTS_PROMPT,
+                use_cache,
+                response_schema=AdInsights,
+                index=ad_insights_index if NEAR_DUPLICATE_ENABLED else None,
             )
-        logger.info("Downloaded image")
-        # Open the image
-        image = Image.open(BytesIO(response.content))
-        
-        # Define the default prompt for image analysis
-        default_prompt = (
-            "Analyze this ad image for key marketing elements. Provide a structured JSON response with the following keys. "
-            "Ensure each key is present in the JSON output. If a feature cannot be confidently identified, use 'None' as the value.\n\n"
-            "Product Name: Extract only the **brand name and product type** (e.g., 'Himalaya Shampoo', 'Nike Shoes', 'Samsung TV'). Do not include extra details.\n"
-            "Position of product: Provide the exact placement of the product (e.g., center, top-right, bottom-left, etc.).\n"
-            "Position of logo: Provide the exact placement of the brand logo (e.g., top-left, top-right, center, etc.).\n"
-            "Image Entities: Identify the key objects, people, or concepts visually present in the image (as a list of strings), ensuring that any line breaks (`\\n`) are replaced with spaces.\n"
-            "Image Text Entities: Extract all discernible text from the image (as a list of strings), ensuring that any line breaks (`\\n`) are replaced with spaces.\n"
-            "Offer in Adv: Extract the full price drop information in a clear format: 'Price slashed from ₹100 to ₹50'. Ensure that both the original and discounted prices are included with the correct currency symbol (₹). If a discount percentage (e.g., 'Flat 50% off') or special deals (e.g., 'Buy One Get One Free') are present, extract them fully and accurately. If no offer is present, state 'None'."
-            "Performance Claim: If the ad makes any performance-related claims (e.g., 'Lasts 24 hours', 'Fastest delivery', '95% customer satisfaction'), extract the claim text. If none, use 'None'.\n"
-            "Contrast in Adv: Assess the overall contrast in the ad (High, Medium, Low, None).\n"
-            "Gender: Predict the primary target gender for this ad (Male, Female, Unisex, Not Applicable).\n"
-            "Headline Size: Determine the approximate size of the main headline relative to other text (Small, Medium, Large, None).\n"
-            "Subheadline Size: Determine the approximate size of the subheadline(s) relative to other text (Small, Medium, Large, None).\n"
-            "CTA Button: If a call-to-action button is present, extract the text on it. If not, use 'None'.\n"
-            "Engagement Prediction: Predict the likely level of user engagement with this ad (Likely, Neutral, Unlikely, None).\n"
-            "Brand Keywords: Based on the visual and textual content, identify potential keywords associated with the brand or product (as a list of strings), ensuring that any line breaks (`\\n`) are replaced with spaces.\n"
-            "Overall Sentiment: Describe the overall feeling or emotion conveyed by the ad (e.g., positive, neutral, exciting, informative, None).\n"
-            "Key Message: Summarize the main message the ad is trying to communicate in one concise sentence (or 'None' if unclear).\n"
-            "Recommendation: Deliver a precise, impactful recommendation to boost brand growth, customer engagement, and preference."
-        )
-        logger.info(f"The key is {GEMINI_API_KEY}")
-        # Generate response using Gemini API
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[default_prompt, image]
-        )
 
-        # Extract response content
-        response_text = response.text.strip()
-        start = response_text.find("{")
-        end = response_text.rfind("}")
-        
-        if start == -1 or end == -1:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to parse Gemini API response"
-            )
-            
-        details = json.loads(response_text[start : end + 1])
-        
         # Add brand_id to the response if provided
         if brand_id:
             details["brand_id"] = brand_id
-            
+            record_brand_insight(brand_id, image_url, details)
+
         return details
-        
+
     except HTTPException as http_ex:
         capture_exception(http_ex)
         raise http_ex
@@ -157,4 +852,199 @@ def get_ad_details(image_url: str, brand_id: int = None):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to analyze image: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+
+async def _generate_pack(images: Sequence[bytes]) -> dict:
+    """
+    Analyze a pack of related images in one Gemini call.
+
+    The instructions are sent once, followed by each image under an
+    "Image N:" label, and the model returns per-image insights plus a
+    comparison across the pack.
+    """
+    parts = await asyncio.gather(*(_image_part(image_bytes) for image_bytes in images))
+    items: List[Any] = []
+    for number, part in enumerate(parts, start=1):
+        items.extend([f"Image {number}:", part])
+
+    config_options = {
+        "response_mime_type": "application/json",
+        "response_schema": _json_schema(CarouselInsights),
+    }
+    with observe_stage("gemini"):
+        response = await _generate_content(
+            CAROUSEL_PROMPT,
+            items,
+            config_options,
+            estimated_tokens=GEMINI_ESTIMATED_TOKENS * len(images),
+        )
+    _log_usage(response)
+
+    with observe_stage("parse"):
+        details = _validate_response(response.text, CarouselInsights)
+    if len(details["Images"]) != len(images):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Gemini returned insights for {len(details['Images'])} of {len(images)} images",
+        )
+    return details
+
+
+async def _pack_details(images: Sequence[bytes], use_cache: bool) -> dict:
+    """
+    Return the analysis for a pack of images, served from the result cache when possible.
+
+    The cache key covers every image in order, so the same images packed
+    differently are analyzed again.
+    """
+    digests = b"".join(hashlib.sha256(image_bytes).digest() for image_bytes in images)
+    key = _cache_key(digests, CAROUSEL_PROMPT, _model_signature(CarouselInsights))
+
+    if not use_cache:
+        result_cache.bypassed += 1
+        return await image_flights.do(("fresh", key), lambda: _generate_pack(images))
+
+    details = await asyncio.to_thread(result_cache.get, key)
+    if details is not None:
+        logger.info(f"Result cache hit for a pack of {len(images)} images")
+        return details
+
+    async def generate_and_store() -> dict:
+        details = await _generate_pack(images)
+        await asyncio.to_thread(result_cache.set, key, details)
+        return details
+
+    return await image_flights.do(key, generate_and_store)
+
+
+def _global_comparison(comparison: Dict[str, Any], indexes: List[int]) -> Dict[str, Any]:
+    """Translate the 1-based image numbers of a pack's comparison into indexes into the request."""
+    def to_index(number: int) -> Optional[int]:
+        return indexes[number - 1] if 1 <= number <= len(indexes) else None
+
+    comparison = dict(comparison)
+    comparison["Image Indexes"] = indexes
+    comparison["Strongest Variant"] = to_index(comparison["Strongest Variant"])
+    comparison["Ranking"] = [index for index in map(to_index, comparison["Ranking"]) if index is not None]
+    return comparison
+
+
+async def get_carousel_details(
+    image_urls: Sequence[str],
+    brand_id: int = None,
+    use_cache: bool = True,
+    pack_size: Optional[int] = None,
+):
+    """
+    Analyze the images of a carousel ad or variant set, several images per Gemini call.
+
+    Images are split into packs of pack_size and each pack is analyzed in a
+    single call that carries the instructions once, which costs fewer input
+    tokens than one call per image and lets the model compare the images.
+
+    Args:
+        image_urls: URLs of the images, in carousel order
+        brand_id: Optional brand ID associated with the images
+        use_cache: Whether to serve and store the results in the result cache
+        pack_size: Images per Gemini call, capped at CAROUSEL_MAX_PACK_SIZE
+
+    Returns:
+        dict: {"images": per-image insights in input order, each with its
+        image_url, "comparisons": one comparison per pack, with Strongest
+        Variant, Ranking and Image Indexes as 0-based indexes into image_urls}
+    """
+    try:
+        with observe_request("get_carousel_insights"):
+            await _ensure_clients()
+            pack_size = max(1, min(pack_size or CAROUSEL_PACK_SIZE, CAROUSEL_MAX_PACK_SIZE))
+            images = await asyncio.gather(*(_download_image(image_url) for image_url in image_urls))
+            packs = [
+                list(range(start, min(start + pack_size, len(images))))
+                for start in range(0, len(images), pack_size)
+            ]
+            results = await asyncio.gather(*(
+                _pack_details([images[index] for index in pack], use_cache) for pack in packs
+            ))
+
+        insights = []
+        comparisons = []
+        for pack, details in zip(packs, results):
+            # The result is shared with coalesced callers and the cache
+            details = copy.deepcopy(details)
+            for index, image_insights in zip(pack, details["Images"]):
+                image_insights["image_url"] = image_urls[index]
+                insights.append(image_insights)
+            comparisons.append(_global_comparison(details["Comparison"], pack))
+
+        result = {"images": insights, "comparisons": comparisons, "pack_size": pack_size}
+
+        # Add brand_id to the response if provided
+        if brand_id:
+            result["brand_id"] = brand_id
+            for image_insights in insights:
+                record_brand_insight(brand_id, image_insights["image_url"], image_insights)
+
+        return result
+
+    except HTTPException as http_ex:
+        capture_exception(http_ex)
+        raise http_ex
+    except Exception as e:
+        capture_exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to analyze carousel: {str(e)}"
+        )
+
+
+async def get_ad_details_batch(items: Sequence[Any], concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyze a batch of ad images with bounded concurrency.
+
+    Results are yielded as soon as each image finishes, so the order follows
+    completion rather than input order. A failed image yields an error entry
+    instead of failing the batch.
+
+    Args:
+        items: AdInsightsPayload-like objects with image_url, brand_id and use_cache
+        concurrency: Maximum number of images analyzed at the same time
+
+    Yields:
+        dict: {"index": int, "result": dict or None, "error": dict or None}
+    """
+    concurrency = max(1, min(concurrency or BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, item: Any) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await get_ad_details(
+                    image_url=item.image_url,
+                    brand_id=item.brand_id,
+                    use_cache=item.use_cache,
+                )
+                return {"index": index, "result": result, "error": None}
+            except HTTPException as http_ex:
+                logger.error(f"Batch item {index} failed: {http_ex.detail}")
+                return {
+                    "index": index,
+                    "result": None,
+                    "error": {"status_code": http_ex.status_code, "detail": http_ex.detail},
+                }
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+                return {
+                    "index": index,
+                    "result": None,
+                    "error": {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": str(e)},
+                }
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Stop outstanding work if the client disconnects mid-stream
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,148 @@
+import os
+import tempfile
+import logging
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+from app.utils.job_queue import JobQueue, SQLiteJobBackend, FirestoreJobBackend
+from app.llm_controllers.gemini_controller import analyze_image, get_ad_details
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+load_dotenv()
+
+# Job queue configuration. JOB_BACKEND is "sqlite" or "firestore".
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "sqlite").lower()
+JOB_DB_PATH = os.environ.get(
+    "JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "adzcrypt", "jobs.sqlite3")
+)
+JOB_COLLECTION = os.environ.get("JOB_COLLECTION", "gemini_jobs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", "2"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+
+job_queue: Optional[JobQueue] = None
+
+
+async def _run_analyze(payload: Dict[str, Any]):
+    return await analyze_image(
+        image_url=payload["image_url"],
+        prompt=payload.get("prompt"),
+        use_cache=payload.get("use_cache", True),
+    )
+
+
+async def _run_ad_insights(payload: Dict[str, Any]):
+    return await get_ad_details(
+        image_url=payload["image_url"],
+        brand_id=payload.get("brand_id"),
+        use_cache=payload.get("use_cache", True),
+    )
+
+
+JOB_HANDLERS = {
+    "analyze": _run_analyze,
+    "get_ad_insights": _run_ad_insights,
+}
+
+
+def _create_backend():
+    if JOB_BACKEND == "sqlite":
+        return SQLiteJobBackend(JOB_DB_PATH)
+    if JOB_BACKEND == "firestore":
+        return FirestoreJobBackend(JOB_COLLECTION)
+    raise ValueError(f"Unknown JOB_BACKEND: {JOB_BACKEND}")
+
+
+async def start_jobs():
+    """
+    Create the job backend and start the worker pool.
+
+    Jobs left queued or running by a previous process are picked up again.
+    """
+    global job_queue
+
+    if job_queue is not None:
+        return
+    job_queue = JobQueue(
+        _create_backend(),
+        JOB_HANDLERS,
+        workers=JOB_WORKERS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        retry_backoff=JOB_RETRY_BACKOFF_SECONDS,
+        lease_seconds=JOB_LEASE_SECONDS,
+    )
+    await job_queue.start()
+
+
+async def stop_jobs():
+    """
+    Stop the worker pool and close the job backend.
+    """
+    global job_queue
+
+    if job_queue is not None:
+        await job_queue.stop()
+    job_queue = None
+
+
+def _format_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+async def submit_job(kind: str, payload: Dict[str, Any]):
+    """
+    Queue an analysis to run in the background.
+
+    Args:
+        kind: "analyze" or "get_ad_insights"
+        payload: Arguments for the analysis
+
+    Returns:
+        dict: The queued job, including its job_id
+    """
+    if job_queue is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job queue is not running"
+        )
+    job = await job_queue.enqueue(kind, payload)
+    logger.info(f"Queued {kind} job {job['id']}")
+    return _format_job(job)
+
+
+async def get_job(job_id: str):
+    """
+    Get the status and result of a background analysis.
+
+    Args:
+        job_id: ID returned by submit_job
+
+    Returns:
+        dict: Job status, attempts, and result or error
+    """
+    if job_queue is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job queue is not running"
+        )
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job not found: {job_id}"
+        )
+    return _format_job(job)
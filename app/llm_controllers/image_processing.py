@@ -0,0 +1,289 @@
+import os
+import math
+import logging
+import threading
+from io import BytesIO
+from dataclasses import dataclass
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+load_dotenv()
+
+# Preprocessing configuration
+IMAGE_PREPROCESS_ENABLED = os.environ.get("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1536"))
+IMAGE_OUTPUT_FORMAT = os.environ.get("IMAGE_OUTPUT_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.environ.get("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+
+_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+}
+
+if IMAGE_OUTPUT_FORMAT not in ("JPEG", "WEBP"):
+    raise ValueError(f"IMAGE_OUTPUT_FORMAT must be JPEG or WEBP, got {IMAGE_OUTPUT_FORMAT}")
+
+# Changes whenever a setting that affects what the model sees changes, so it
+# can be folded into result cache keys.
+PREPROCESS_SIGNATURE = (
+    f"{IMAGE_OUTPUT_FORMAT}:{IMAGE_MAX_SIDE}:{IMAGE_QUALITY}" if IMAGE_PREPROCESS_ENABLED else "raw"
+)
+
+# Content types accepted from image hosts. Some object stores label every
+# file as octet-stream, so that is let through and checked by PIL instead.
+_ALLOWED_CONTENT_TYPES = ("image/", "application/octet-stream", "binary/octet-stream")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "images": 0,
+    "resized": 0,
+    "original_bytes": 0,
+    "processed_bytes": 0,
+    "bytes_saved": 0,
+}
+
+
+@dataclass
+class PreprocessedImage:
+    """
+    An image ready to be sent to the model, with the size metrics of the preprocessing step.
+    """
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def get_preprocessing_stats():
+    """
+    Get cumulative byte counters for the preprocessing stage.
+
+    Returns:
+        dict: Image counts and original/processed/saved byte totals
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def check_content_type(content_type: str, image_url: str):
+    """
+    Reject downloads whose content type is clearly not an image.
+
+    Args:
+        content_type (str): Content-Type header of the response
+        image_url (str): URL the response came from, for the error message
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type and not content_type.startswith(_ALLOWED_CONTENT_TYPES):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"URL did not return an image ({content_type}): {image_url}"
+        )
+
+
+def check_content_length(content_length: int, image_url: str):
+    """
+    Reject downloads larger than IMAGE_MAX_DOWNLOAD_BYTES.
+
+    Args:
+        content_length (int): Number of bytes announced or received so far
+        image_url (str): URL the response came from, for the error message
+    """
+    if content_length is not None and content_length > IMAGE_MAX_DOWNLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image exceeds the {IMAGE_MAX_DOWNLOAD_BYTES} byte limit: {image_url}"
+        )
+
+
+def _flatten_to_rgb(image):
+    """Convert to RGB, compositing any transparency onto a white background."""
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def preprocess_image(image_bytes: bytes) -> PreprocessedImage:
+    """
+    Shrink an image before it is uploaded to the model.
+
+    The longest side is capped at IMAGE_MAX_SIDE and the image is re-encoded
+    as an RGB JPEG or WebP at IMAGE_QUALITY. JPEG sources are decoded in draft
+    mode so the decoder scales down while reading instead of materialising
+    the full-resolution bitmap. The original bytes are kept when they are
+    already small enough and smaller than the re-encoded image.
+
+    Args:
+        image_bytes (bytes): Raw downloaded image
+
+    Returns:
+        PreprocessedImage: Bytes and MIME type to send to the model
+    """
+    # PIL is imported on first use to keep it off the cold-start path
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        source_format = image.format
+        # Decide on the size before draft mode shrinks the decoded bitmap
+        needs_resize = max(image.size) > IMAGE_MAX_SIDE
+        if IMAGE_PREPROCESS_ENABLED and source_format == "JPEG":
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers IMAGE_MAX_SIDE
+            image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Downloaded file is not a supported image: {str(e)}"
+        )
+
+    original_size = len(image_bytes)
+
+    if not IMAGE_PREPROCESS_ENABLED:
+        result = PreprocessedImage(
+            data=image_bytes,
+            mime_type=_MIME_TYPES.get(source_format, "image/jpeg"),
+            width=image.width,
+            height=image.height,
+            original_bytes=original_size,
+        )
+    else:
+        if needs_resize:
+            image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+        image = _flatten_to_rgb(image)
+
+        buffer = BytesIO()
+        image.save(buffer, format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+        processed = buffer.getvalue()
+
+        if not needs_resize and source_format in ("JPEG", "WEBP") and original_size <= len(processed):
+            # Re-encoding would only make an already compact image bigger
+            result = PreprocessedImage(
+                data=image_bytes,
+                mime_type=_MIME_TYPES[source_format],
+                width=image.width,
+                height=image.height,
+                original_bytes=original_size,
+            )
+        else:
+            result = PreprocessedImage(
+                data=processed,
+                mime_type=_MIME_TYPES[IMAGE_OUTPUT_FORMAT],
+                width=image.width,
+                height=image.height,
+                original_bytes=original_size,
+            )
+
+    with _stats_lock:
+        _stats["images"] += 1
+        if needs_resize and IMAGE_PREPROCESS_ENABLED:
+            _stats["resized"] += 1
+        _stats["original_bytes"] += original_size
+        _stats["processed_bytes"] += len(result.data)
+        _stats["bytes_saved"] += result.bytes_saved
+
+    logger.info(
+        f"Preprocessed image {source_format} {original_size}B -> {result.mime_type} "
+        f"{len(result.data)}B ({result.width}x{result.height}), saved {result.bytes_saved}B"
+    )
+    return result
+
+
+# DCT basis for pHash: 8 low-frequency coefficients over a 32 pixel axis
+_PHASH_SIZE = 32
+_PHASH_LOW = 8
+_DCT_BASIS = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * _PHASH_SIZE)) for x in range(_PHASH_SIZE)]
+    for u in range(_PHASH_LOW)
+]
+
+
+def _grayscale_pixels(image_bytes: bytes, width: int, height: int):
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        if image.format == "JPEG":
+            # Only a thumbnail is needed, so let libjpeg decode at the smallest scale
+            image.draft("L", (width * 4, height * 4))
+        image = _flatten_to_rgb(image).convert("L").resize((width, height), Image.BILINEAR)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Downloaded file is not a supported image: {str(e)}"
+        )
+    return list(image.getdata())
+
+
+def dhash(image_bytes: bytes) -> int:
+    """
+    64-bit difference hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour.
+
+    Args:
+        image_bytes (bytes): Raw image
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer
+    """
+    pixels = _grayscale_pixels(image_bytes, 9, 8)
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def phash(image_bytes: bytes) -> int:
+    """
+    64-bit perceptual hash: the signs of the 8x8 lowest DCT frequencies of a 32x32 thumbnail relative to their median.
+
+    More robust than dhash to re-compression, colour shifts and small crops.
+
+    Args:
+        image_bytes (bytes): Raw image
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer
+    """
+    pixels = _grayscale_pixels(image_bytes, _PHASH_SIZE, _PHASH_SIZE)
+    rows = [pixels[y * _PHASH_SIZE:(y + 1) * _PHASH_SIZE] for y in range(_PHASH_SIZE)]
+    # Separable DCT-II, keeping only the low frequencies: rows first, then columns
+    row_coefficients = [[sum(b * p for b, p in zip(basis, row)) for basis in _DCT_BASIS] for row in rows]
+    coefficients = [
+        sum(basis[y] * row_coefficients[y][u] for y in range(_PHASH_SIZE))
+        for basis in _DCT_BASIS
+        for u in range(_PHASH_LOW)
+    ]
+    # The DC term only reflects overall brightness
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+PERCEPTUAL_HASHES = {
+    "dhash": dhash,
+    "phash": phash,
+}
@@ -0,0 +1,103 @@
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONObjectParser:
+    """
+    Parse a JSON object that arrives in text chunks, emitting top-level keys as soon as each one is complete.
+
+    Text before the opening brace, such as a markdown code fence, is ignored.
+    Only the lexical state (nesting depth and whether we are inside a string)
+    is tracked while scanning, and each finished "key": value member is
+    decoded on its own with json.loads.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._object_start: Optional[int] = None
+        self._member_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+        self.result: Optional[dict] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Add a chunk of text.
+
+        Args:
+            text (str): Next piece of the model output
+
+        Returns:
+            List[Tuple[str, Any]]: Top-level (key, value) pairs completed by this chunk
+        """
+        if self.done:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+
+            if self._object_start is None:
+                if char == "{":
+                    self._object_start = self._pos
+                    self._member_start = self._pos + 1
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    member = self._parse_member(buffer[self._member_start:self._pos])
+                    if member is not None:
+                        completed.append(member)
+                    self._finish(buffer[self._object_start:self._pos + 1])
+                    self._pos += 1
+                    break
+            elif char == "," and self._depth == 1:
+                member = self._parse_member(buffer[self._member_start:self._pos])
+                if member is not None:
+                    completed.append(member)
+                self._member_start = self._pos + 1
+
+            self._pos += 1
+
+        return completed
+
+    def _parse_member(self, text: str) -> Optional[Tuple[str, Any]]:
+        if not text.strip():
+            return None
+        try:
+            member = json.loads("{" + text + "}")
+        except ValueError:
+            logger.warning(f"Could not parse streamed JSON member: {text[:100]}")
+            return None
+        return next(iter(member.items()), None)
+
+    def _finish(self, text: str):
+        self.done = True
+        try:
+            self.result = json.loads(text)
+        except ValueError as e:
+            logger.warning(f"Could not parse streamed JSON object: {str(e)}")
+            self.result = None
@@ -0,0 +1,195 @@
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from app.utils.singleflight import SingleFlight
+from app.llm_controllers.prompts import PromptTemplate
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class PromptCache:
+    """
+    Registers fixed prompt prefixes with the Gemini API as cached content.
+
+    resolve() returns the cached content name to reference in place of the
+    prompt text. The first call for a model and template creates the cached
+    content; later calls reuse it and extend its TTL once less than
+    refresh_margin_seconds remains. Concurrent creates and refreshes are
+    coalesced.
+
+    Before the first create, the prefix is counted with count_tokens; a
+    prefix below min_tokens, the model's minimum cacheable size, is always
+    sent inline and never submitted for caching. Other failures are best
+    effort: when a create or refresh fails, resolve() returns None so the
+    caller sends the prompt inline, and no new attempt is made for
+    retry_seconds.
+
+    Args:
+        enabled (bool): Whether to use cached content at all
+        ttl_seconds (int): TTL requested for each cached content
+        refresh_margin_seconds (int): Remaining lifetime below which the TTL is extended
+        retry_seconds (int): Wait after a failure before trying to cache that prefix again
+        min_tokens (int): Smallest prefix worth caching, 0 to skip the token count
+        clock (Callable[[], float]): Monotonic time source in seconds
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        ttl_seconds: int = 3600,
+        refresh_margin_seconds: int = 300,
+        retry_seconds: int = 600,
+        min_tokens: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds // 2)
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self._clock = clock
+        # (model, template digest) -> {"name": str, "expires_at": monotonic time}
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._unavailable_until: Dict[Tuple[str, str], float] = {}
+        # Prefixes counted below min_tokens; they cannot become cacheable without a text change
+        self._too_small: Set[Tuple[str, str]] = set()
+        self._counted: Set[Tuple[str, str]] = set()
+        self._flights = SingleFlight("prompt_cache")
+        self.created = 0
+        self.refreshed = 0
+        self.referenced = 0
+        self.inline = 0
+        self.failures = 0
+        self.invalidated = 0
+        self.below_minimum = 0
+
+    async def resolve(self, client: Any, model: str, template: Optional[PromptTemplate]) -> Optional[str]:
+        """
+        Get the cached content name for a prompt prefix, creating or refreshing it as needed.
+
+        Args:
+            client: google.genai Client
+            model (str): Model the cached content is created for
+            template (Optional[PromptTemplate]): Prompt prefix, None for a custom prompt
+
+        Returns:
+            Optional[str]: Cached content name, or None to send the prompt inline
+        """
+        if not self.enabled or template is None or not template.cacheable:
+            return None
+
+        key = (model, template.digest)
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry["expires_at"] - self.refresh_margin_seconds:
+            self.referenced += 1
+            return entry["name"]
+        if key in self._too_small or self._unavailable_until.get(key, 0.0) > now:
+            self.inline += 1
+            return None
+
+        name = await self._flights.do(key, lambda: self._try_register(client, model, template, key))
+        if name is None:
+            self.inline += 1
+            return None
+        self.referenced += 1
+        return name
+
+    async def _try_register(
+        self, client: Any, model: str, template: PromptTemplate, key: Tuple[str, str]
+    ) -> Optional[str]:
+        try:
+            return await self._register(client, model, template, key)
+        except Exception as e:
+            logger.warning(
+                f"Prompt caching unavailable for {template.name} on {model}, sending it inline: {str(e)}"
+            )
+            self.failures += 1
+            self._entries.pop(key, None)
+            self._unavailable_until[key] = self._clock() + self.retry_seconds
+            return None
+
+    async def _register(
+        self, client: Any, model: str, template: PromptTemplate, key: Tuple[str, str]
+    ) -> Optional[str]:
+        from google.genai import types
+        from google.genai import errors as genai_errors
+
+        started = self._clock()
+        ttl = f"{self.ttl_seconds}s"
+        entry = self._entries.get(key)
+        if entry is not None and started < entry["expires_at"]:
+            try:
+                await client.aio.caches.update(name=entry["name"], config=types.UpdateCachedContentConfig(ttl=ttl))
+                self.refreshed += 1
+                entry["expires_at"] = started + self.ttl_seconds
+                logger.info(f"Extended cached prompt {template.name} ({entry['name']})")
+                return entry["name"]
+            except genai_errors.ClientError as e:
+                # Expired or deleted on the server side; create a new one below
+                logger.info(f"Could not extend cached prompt {template.name}, recreating it: {e.message}")
+
+        contents = types.Content(role="user", parts=[types.Part.from_text(text=template.text)])
+        if self.min_tokens and key not in self._counted:
+            counted = await client.aio.models.count_tokens(model=model, contents=contents)
+            self._counted.add(key)
+            if (counted.total_tokens or 0) < self.min_tokens:
+                self._too_small.add(key)
+                self.below_minimum += 1
+                logger.info(
+                    f"Prompt {template.name} is {counted.total_tokens} tokens, below the {self.min_tokens} "
+                    f"token caching minimum for {model}; sending it inline"
+                )
+                return None
+
+        cached = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=contents,
+                display_name=f"adzcrypt-{template.name}-{template.digest}",
+                ttl=ttl,
+            ),
+        )
+        self.created += 1
+        # Timed from before the request, so the local expiry is never later than the server's
+        self._entries[key] = {"name": cached.name, "expires_at": started + self.ttl_seconds}
+        self._unavailable_until.pop(key, None)
+        logger.info(f"Cached prompt {template.name} as {cached.name} for {self.ttl_seconds}s")
+        return cached.name
+
+    def invalidate(self, model: str, template: PromptTemplate, name: str):
+        """
+        Forget a cached content the API no longer recognizes, so the next resolve() recreates it.
+        """
+        key = (model, template.digest)
+        entry = self._entries.get(key)
+        if entry is not None and entry["name"] == name:
+            del self._entries[key]
+            self.invalidated += 1
+
+    async def close(self, client: Any):
+        """
+        Delete the cached contents created by this process instead of waiting for them to expire.
+        """
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            try:
+                await client.aio.caches.delete(name=entry["name"])
+            except Exception as e:
+                logger.warning(f"Failed to delete cached prompt {entry['name']}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cached content counters."""
+        return {
+            "enabled": self.enabled,
+            "active": len(self._entries),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "referenced": self.referenced,
+            "inline": self.inline,
+            "failures": self.failures,
+            "invalidated": self.invalidated,
+            "below_minimum": self.below_minimum,
+        }
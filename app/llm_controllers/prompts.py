@@ -0,0 +1,98 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    A named prompt, built once when the module is imported.
+
+    Templates marked cacheable are fixed instruction prefixes that the
+    controller may register with the model API as cached content instead of
+    sending the text on every call.
+    """
+    name: str
+    text: str
+    cacheable: bool = True
+    digest: str = field(init=False)
+
+    def __post_init__(self):
+        # Identifies this exact text, so an edited template gets a new cached content
+        object.__setattr__(self, "digest", hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:16])
+
+
+_templates: Dict[str, PromptTemplate] = {}
+_templates_by_text: Dict[str, PromptTemplate] = {}
+
+
+def register_prompt(name: str, text: str, cacheable: bool = True) -> PromptTemplate:
+    """
+    Add a template to the registry.
+
+    Args:
+        name (str): Unique template name
+        text (str): Prompt text
+        cacheable (bool): Whether the text may be registered as cached content
+
+    Returns:
+        PromptTemplate: The registered template
+
+    Raises:
+        ValueError: If a template with this name is already registered
+    """
+    if name in _templates:
+        raise ValueError(f"Prompt template {name} is already registered")
+    template = PromptTemplate(name, text, cacheable)
+    _templates[name] = template
+    _templates_by_text.setdefault(text, template)
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    """
+    Get a registered template by name.
+
+    Raises:
+        KeyError: If no template has this name
+    """
+    return _templates[name]
+
+
+def find_prompt(text: Optional[str]) -> Optional[PromptTemplate]:
+    """
+    Get the registered template with exactly this text, e.g. to tell a built-in prompt from a custom one.
+
+    Returns:
+        Optional[PromptTemplate]: The template, or None for unregistered text
+    """
+    return _templates_by_text.get(text) if text else None
+
+
+# Instructions for ad insights. The keys and allowed values come from the
+# AdInsights response schema, so the prompt only carries extraction guidance.
+AD_INSIGHTS = register_prompt("ad_insights", (
+    "Analyze this ad image for its key marketing elements and fill in every field. "
+    "Use 'None' for anything that cannot be confidently identified, and replace line breaks in extracted text with spaces.\n"
+    "Product Name: brand name and product type only (e.g. 'Nike Shoes').\n"
+    "Positions: placement such as center, top-right or bottom-left.\n"
+    "Image Entities: key objects, people or concepts shown. Image Text Entities: all discernible text.\n"
+    "Offer in Adv: the full offer, with original and discounted prices and currency symbol "
+    "(e.g. 'Price slashed from ₹100 to ₹50'), percentage discounts or deals such as 'Buy One Get One Free'.\n"
+    "Performance Claim: claim text such as 'Lasts 24 hours'.\n"
+    "Gender: primary target gender. Headline and subheadline sizes are relative to other text.\n"
+    "CTA Button: the button text. Brand Keywords: keywords for the brand or product.\n"
+    "Overall Sentiment: the feeling conveyed (e.g. positive, exciting, informative). Key Message: one concise sentence.\n"
+    "Recommendation: one precise, impactful recommendation to boost brand growth, engagement and preference."
+))
+
+# Instructions for a pack of related images, sent once per call rather than once per image
+CAROUSEL = register_prompt("carousel", (
+    "The images below, labelled Image 1, Image 2 and so on, belong to one carousel ad or A/B variant set. "
+    "Fill 'Images' with exactly one entry per image, in the order given, following these instructions for each image:\n"
+    + AD_INSIGHTS.text + "\n"
+    "Then fill 'Comparison' for the set as a whole. Strongest Variant: the number of the image most likely to perform best. "
+    "Ranking: every image number, strongest first. Consistent Elements: what all images share. "
+    "Key Differences: the differences that matter most for performance. "
+    "Recommendation: one recommendation for the set."
+))
@@ -0,0 +1,543 @@
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# HTTP status codes from the model API that are worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the circuit breaker is open and calls are being rejected.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit breaker is open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum burst size
+        clock (Callable[[], float]): Monotonic time source in seconds
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """
+        Wait until amount tokens are available and take them.
+
+        Waiters are served in arrival order.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self.waits += 1
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """
+        Charge (positive) or refund (negative) tokens after the fact.
+
+        Used to correct an up-front estimate once the real cost is known. The
+        balance may go negative, which delays later callers.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "available": round(self.tokens, 2),
+            "waits": self.waits,
+        }
+
+
+class AIMDLimiter:
+    """
+    An adaptive concurrency limit: additive increase on success, multiplicative decrease on throttling.
+
+    Args:
+        initial (int): Starting concurrency limit
+        minimum (int): Lowest the limit may fall to
+        maximum (int): Highest the limit may grow to
+        backoff (float): Factor applied to the limit when throttled
+        cooldown (float): Minimum seconds between two decreases, so one burst of 429s halves the limit once
+        clock (Callable[[], float]): Monotonic time source in seconds
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 64,
+        backoff: float = 0.5,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = maximum
+        self.limit = float(min(max(initial, self.minimum), maximum))
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = -math.inf
+        self._condition = asyncio.Condition()
+        self.throttled = 0
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        self.throttled += 1
+        now = self._clock()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+            logger.warning(f"Throttled by the model API, concurrency limit lowered to {int(self.limit)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "throttled": self.throttled,
+        }
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls for reset_timeout seconds. It then lets a single probe
+    through (half-open); success closes it, failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds the breaker stays open before a probe
+        clock (Callable[[], float]): Monotonic time source in seconds
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError if the call must not be made.
+
+        Returns:
+            bool: True if this call is the half-open probe, which the caller must
+            settle with record_success, record_failure or record_ignored
+        """
+        if self.state == self.OPEN:
+            elapsed = self._clock() - self._opened_at
+            if elapsed < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.reset_timeout - elapsed)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(1.0)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.error(f"Circuit breaker opened after {self.failures} failures")
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+
+    def record_ignored(self):
+        """Release a half-open probe whose outcome says nothing about the dependency's health."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class HedgePolicy:
+    """
+    Send a backup copy of a slow call and keep whichever copy finishes first.
+
+    A call that has not returned after the given percentile of recent
+    latencies gets one identical backup request; the first successful result
+    wins and the other request is cancelled. Latencies are tracked per key,
+    so calls of different sizes do not share a threshold, and no call is
+    hedged until its key has min_samples observations. A request cancelled
+    because the other one won is recorded with the time it ran so far, a lower
+    bound on its latency, so slow requests still raise the threshold.
+
+    Extra load is capped by an allowance that grows by budget per call, up to
+    burst, and each hedge spends one, so over time at most budget extra calls
+    are made per call even when the model API slows down for everyone.
+
+    Args:
+        percentile (float): Quantile of recent latency after which to hedge, e.g. 0.95
+        budget (float): Maximum hedges per call, e.g. 0.05 for 5% extra calls
+        burst (float): Most hedges that can be saved up while calls are fast
+        min_delay (float): Shortest wait in seconds before hedging
+        min_samples (int): Latencies needed for a key before it is hedged
+        window_size (int): Recent latencies kept per key
+        clock (Callable[[], float]): Monotonic time source in seconds
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.05,
+        burst: float = 10.0,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        window_size: int = 512,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = max(1.0, burst)
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self._clock = clock
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._allowance = 0.0
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.over_budget = 0
+
+    def delay(self, key: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging a call with this key.
+
+        Returns:
+            Optional[float]: The delay, or None while the key has too few samples
+        """
+        recent = self._latencies.get(key)
+        if recent is None or len(recent) < self.min_samples:
+            return None
+        ordered = sorted(recent)
+        index = min(len(ordered) - 1, int(math.ceil(self.percentile * len(ordered))) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def record(self, key: str, latency: float):
+        """Add the latency of a completed request, or a lower bound for a cancelled one."""
+        recent = self._latencies.get(key)
+        if recent is None:
+            recent = self._latencies[key] = deque(maxlen=self.window_size)
+        recent.append(latency)
+
+    def _take_allowance(self) -> bool:
+        if self._allowance < 1.0:
+            self.over_budget += 1
+            return False
+        self._allowance -= 1.0
+        return True
+
+    async def _timed(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        start = self._clock()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Leaving out the losers would censor exactly the slow tail the threshold is taken from
+            self.record(key, self._clock() - start)
+            raise
+        self.record(key, self._clock() - start)
+        return result
+
+    async def call(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        on_hedge: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """
+        Run fn(), sending a second fn() if the first is slower than the hedge delay.
+
+        Args:
+            key: Groups calls with comparable latency, e.g. the prompt and image count
+            fn: Coroutine factory making one request
+            on_hedge: Called when a backup request is sent, e.g. to charge rate limits
+
+        Returns:
+            Any: The first successful result. If every request fails, the first
+            request's error is raised.
+        """
+        self.calls += 1
+        self._allowance = min(self.burst, self._allowance + self.budget)
+        delay = self.delay(key)
+        if delay is None:
+            return await self._timed(key, fn)
+
+        primary = asyncio.ensure_future(self._timed(key, fn))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._take_allowance():
+                return await primary
+
+            self.fired += 1
+            if on_hedge is not None:
+                on_hedge()
+            logger.info(f"Hedging a model call still running after {delay:.2f}s")
+            backup = asyncio.ensure_future(self._timed(key, fn))
+            tasks.append(backup)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is backup:
+                            self.won += 1
+                        return task.result()
+            # Both requests failed
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "over_budget": self.over_budget,
+            "delays": {key: self.delay(key) for key in self._latencies},
+        }
+
+
+def classify_error(exc: BaseException) -> Tuple[bool, bool]:
+    """
+    Classify a model API error.
+
+    Returns:
+        Tuple[bool, bool]: (retryable, throttled)
+    """
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES, code == 429
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True, False
+    # Transport errors from the SDK's HTTP client (httpx) are transient
+    module = type(exc).__module__ or ""
+    if module.startswith(("httpx", "httpcore", "aiohttp")):
+        return True, False
+    return False, False
+
+
+class CallPolicy:
+    """
+    Rate limiting, adaptive concurrency, retries and circuit breaking around an async call.
+
+    Args:
+        requests_per_second (Optional[float]): Request rate limit, None to disable
+        tokens_per_minute (Optional[float]): Token rate limit, None to disable
+        concurrency (AIMDLimiter): Adaptive concurrency limit
+        breaker (CircuitBreaker): Circuit breaker
+        max_attempts (int): Attempts per call including the first
+        base_delay (float): Base retry delay in seconds
+        max_delay (float): Cap on a single retry delay
+        hedge (Optional[HedgePolicy]): Hedging for attempts made with a hedge key, None to disable
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float],
+        tokens_per_minute: Optional[float],
+        concurrency: AIMDLimiter,
+        breaker: CircuitBreaker,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        hedge: Optional[HedgePolicy] = None,
+    ):
+        self.request_bucket = (
+            TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        )
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        estimated_tokens: float = 0,
+        actual_tokens: Optional[Callable[[Any], Optional[float]]] = None,
+        hedge_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Run fn() under the policy.
+
+        Args:
+            fn: Coroutine factory making one attempt
+            estimated_tokens: Tokens charged to the token bucket before each attempt
+            actual_tokens: Returns the real token count from a result, to correct the estimate
+            hedge_key: Hedge slow attempts, comparing them with earlier calls with this key.
+                Only for idempotent calls; None never hedges.
+
+        Returns:
+            Any: The result of the first successful attempt
+        """
+        self.calls += 1
+        for attempt in range(1, self.max_attempts + 1):
+            probe = self.breaker.before_call()
+            try:
+                if self.request_bucket is not None:
+                    await self.request_bucket.acquire(1)
+                if self.token_bucket is not None and estimated_tokens:
+                    await self.token_bucket.acquire(estimated_tokens)
+                await self.concurrency.acquire()
+            except BaseException:
+                # Cancelled while waiting for a limiter; a probe that never ran must not stay in flight
+                if probe:
+                    self.breaker.record_ignored()
+                raise
+
+            try:
+                if self.hedge is not None and hedge_key is not None:
+                    result = await self.hedge.call(hedge_key, fn, on_hedge=lambda: self._charge_hedge(estimated_tokens))
+                else:
+                    result = await fn()
+            except asyncio.CancelledError:
+                if probe:
+                    self.breaker.record_ignored()
+                raise
+            except Exception as e:
+                retryable, throttled = classify_error(e)
+                if throttled:
+                    # Quota pressure is handled by the concurrency limit, not the breaker
+                    self.concurrency.on_throttle()
+                    if probe:
+                        self.breaker.record_ignored()
+                elif retryable:
+                    self.breaker.record_failure()
+                elif probe:
+                    self.breaker.record_ignored()
+
+                if not retryable or attempt == self.max_attempts:
+                    self.failures += 1
+                    raise
+                error = e
+            else:
+                self.concurrency.on_success()
+                self.breaker.record_success()
+                if self.token_bucket is not None and actual_tokens is not None:
+                    actual = actual_tokens(result)
+                    if actual is not None:
+                        self.token_bucket.adjust(actual - estimated_tokens)
+                return result
+            finally:
+                await self.concurrency.release()
+
+            self.retries += 1
+            delay = self.retry_delay(attempt)
+            logger.warning(f"Model call attempt {attempt} failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _charge_hedge(self, estimated_tokens: float):
+        # A backup request shares the attempt's concurrency slot but still counts against the rate limits
+        if self.request_bucket is not None:
+            self.request_bucket.adjust(1)
+        if self.token_bucket is not None and estimated_tokens:
+            self.token_bucket.adjust(estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return limiter, breaker, retry and hedging state for monitoring."""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "request_bucket": self.request_bucket.stats() if self.request_bucket is not None else None,
+            "token_bucket": self.token_bucket.stats() if self.token_bucket is not None else None,
+            "concurrency": self.concurrency.stats(),
+            "circuit_breaker": self.breaker.stats(),
+            "hedging": self.hedge.stats() if self.hedge is not None else None,
+        }
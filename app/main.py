@@ -1,6 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import geminiLLM
+from app.routers import geminiLLM, firestoreData
+from app.llm_controllers.gemini_controller import (
+    init_clients,
+    close_clients,
+    load_near_duplicate_index,
+    save_near_duplicate_index,
+)
+from app.llm_controllers.gemini_jobs import start_jobs, stop_jobs
+from app.utils.firestore_batch import close_batched_writer
+from app.utils.brand_rollups import close_brand_rollups
+from app.utils.telemetry import init_sentry
+from app.utils.metrics import registry
+import asyncio
 import os
 import logging
 from dotenv import load_dotenv
@@ -14,7 +28,25 @@ logging.basicConfig(
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="Service-API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy clients are created here or on first use, never at import time
+    init_sentry()
+    # Create the shared Gemini client and pooled HTTP session once per worker
+    await init_clients()
+    # Perceptual hashes of analyzed creatives, for near-duplicate reuse
+    await load_near_duplicate_index()
+    # Background workers for analyses submitted with async_mode
+    await start_jobs()
+    yield
+    await stop_jobs()
+    await close_clients()
+    await save_near_duplicate_index()
+    # Apply queued brand rollup updates, then commit any write-behind Firestore writes before the worker exits
+    await asyncio.to_thread(close_brand_rollups)
+    await asyncio.to_thread(close_batched_writer)
+
+app = FastAPI(title="Service-API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -27,7 +59,13 @@ app.add_middleware(
 
 # Include routers
 app.include_router(geminiLLM.gemini_router, prefix="/api/gemini", tags=["Gemini LLM Image Analysis"])
+app.include_router(firestoreData.firestore_router, prefix="/api/firestore", tags=["Firestore Data"])
 
 @app.get("/")
 async def root():
-    return {"message": "Navigate to /docs for API documentation."} 
\ No newline at end of file
+    return {"message": "Navigate to /docs for API documentation."} 
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """Stage latencies, token usage and pipeline counters in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
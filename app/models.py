@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 class AdInsightsPayload(BaseModel):
     """
@@ -15,6 +15,14 @@ class AdInsightsPayload(BaseModel):
         example=1,
         description="Optional brand ID associated with the image"
     )
+    use_cache: bool = Field(
+        True,
+        description="Serve the result from the analysis cache when available. Set to false to force a fresh analysis."
+    )
+    async_mode: bool = Field(
+        False,
+        description="Queue the analysis and return a job ID immediately. Poll GET /api/gemini/jobs/{job_id} for the result."
+    )
     
     class Config:   
         json_schema_extra = {
@@ -24,6 +32,35 @@ class AdInsightsPayload(BaseModel):
             }
         }
 
+class AdInsightsBatchPayload(BaseModel):
+    """
+    A class to represent the payload for the GeminiLLM batch ad insights endpoint.
+    """
+    items: List[AdInsightsPayload] = Field(
+        ...,
+        min_length=1,
+        description="Ad images to analyze. Results are streamed back as NDJSON in completion order."
+    )
+    concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        example=8,
+        description="Maximum number of images analyzed at the same time. Defaults to the server setting."
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "image_url": "https://c8.alamy.com/comp/W63879/hot-sauce-product-ads-with-chili-peppers-in-fire-shape-3d-illustration-W63879.jpg",
+                        "brand_id": 1
+                    }
+                ],
+                "concurrency": 8
+            }
+        }
+
 class ImageAnalysisPayload(BaseModel):
     """
     A class to represent the payload for the GeminiLLM image analysis endpoint.
@@ -43,6 +80,14 @@ class ImageAnalysisPayload(BaseModel):
         example="Analyze this advertisement image and provide insights about the marketing strategy.",
         description="Optional custom prompt for the image analysis. If not provided, a default marketing analysis prompt will be used."
     )
+    use_cache: bool = Field(
+        True,
+        description="Serve the result from the analysis cache when available. Set to false to force a fresh analysis."
+    )
+    async_mode: bool = Field(
+        False,
+        description="Queue the analysis and return a job ID immediately. Poll GET /api/gemini/jobs/{job_id} for the result."
+    )
     
     class Config:
         json_schema_extra = {
@@ -50,4 +95,96 @@ class ImageAnalysisPayload(BaseModel):
                 "image_url": "https://firebasestorage.googleapis.com/v0/b/brand-management-2logld.appspot.com/o/generated-images%2F1%2Ffashion_studio_images%2F1742733413718-esuhal.jpg?alt=media&token=238331b8-e4fa-46a9-b45a-d2242992fbd0",
                 "prompt": "Analyze this advertisement image and provide insights about the marketing strategy."
             }
-        } 
\ No newline at end of file
+        } 
+
+class AdInsights(BaseModel):
+    """
+    A class to represent the structured ad insights returned by Gemini.
+
+    Field aliases are the JSON keys of the API response. The model is also
+    sent to Gemini as the response schema, so 'None' is used as a string
+    sentinel for features that cannot be identified.
+    """
+    product_name: str = Field(..., alias="Product Name")
+    position_of_product: str = Field(..., alias="Position of product")
+    position_of_logo: str = Field(..., alias="Position of logo")
+    image_entities: List[str] = Field(..., alias="Image Entities")
+    image_text_entities: List[str] = Field(..., alias="Image Text Entities")
+    offer_in_adv: str = Field(..., alias="Offer in Adv")
+    performance_claim: str = Field(..., alias="Performance Claim")
+    contrast_in_adv: Literal["High", "Medium", "Low", "None"] = Field(..., alias="Contrast in Adv")
+    gender: Literal["Male", "Female", "Unisex", "Not Applicable"] = Field(..., alias="Gender")
+    headline_size: Literal["Small", "Medium", "Large", "None"] = Field(..., alias="Headline Size")
+    subheadline_size: Literal["Small", "Medium", "Large", "None"] = Field(..., alias="Subheadline Size")
+    cta_button: str = Field(..., alias="CTA Button")
+    engagement_prediction: Literal["Likely", "Neutral", "Unlikely", "None"] = Field(..., alias="Engagement Prediction")
+    brand_keywords: List[str] = Field(..., alias="Brand Keywords")
+    overall_sentiment: str = Field(..., alias="Overall Sentiment")
+    key_message: str = Field(..., alias="Key Message")
+    recommendation: str = Field(..., alias="Recommendation")
+
+    class Config:
+        populate_by_name = True
+
+
+class CarouselPayload(BaseModel):
+    """
+    A class to represent the payload for the GeminiLLM carousel/variant insights endpoint.
+    """
+    image_urls: List[str] = Field(
+        ...,
+        min_length=2,
+        max_length=10,
+        description="Images of one carousel or A/B variant set, in display order"
+    )
+    brand_id: Optional[int] = Field(
+        None,
+        example=1,
+        description="Optional brand ID associated with the images"
+    )
+    use_cache: bool = Field(
+        True,
+        description="Serve the result from the analysis cache when available. Set to false to force a fresh analysis."
+    )
+    pack_size: Optional[int] = Field(
+        None,
+        ge=1,
+        example=5,
+        description="Images analyzed per model call. Defaults to the server setting."
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "image_urls": [
+                    "https://c8.alamy.com/comp/W63879/hot-sauce-product-ads-with-chili-peppers-in-fire-shape-3d-illustration-W63879.jpg",
+                    "https://c8.alamy.com/comp/W63879/hot-sauce-product-ads-with-chili-peppers-in-fire-shape-3d-illustration-W63879.jpg"
+                ],
+                "brand_id": 1
+            }
+        }
+
+class VariantComparison(BaseModel):
+    """
+    A class to represent Gemini's comparison of the images in one carousel or variant set.
+
+    Image numbers are 1-based positions within the set sent to the model.
+    """
+    strongest_variant: int = Field(..., alias="Strongest Variant")
+    ranking: List[int] = Field(..., alias="Ranking")
+    consistent_elements: List[str] = Field(..., alias="Consistent Elements")
+    key_differences: List[str] = Field(..., alias="Key Differences")
+    recommendation: str = Field(..., alias="Recommendation")
+
+    class Config:
+        populate_by_name = True
+
+class CarouselInsights(BaseModel):
+    """
+    A class to represent the structured insights for several images returned by one Gemini call.
+    """
+    images: List[AdInsights] = Field(..., alias="Images")
+    comparison: VariantComparison = Field(..., alias="Comparison")
+
+    class Config:
+        populate_by_name = True
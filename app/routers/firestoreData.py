@@ -0,0 +1,91 @@
+import os
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from app.utils.telemetry import capture_exception
+from dotenv import load_dotenv
+import logging
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+firestore_router = APIRouter()
+
+# Collections that may be streamed through the API
+STREAMABLE_COLLECTIONS = {
+    name.strip() for name in os.environ.get("STREAMABLE_COLLECTIONS", "brands").split(",") if name.strip()
+}
+
+_OPERATORS = {"==", "!=", "<", "<=", ">", ">=", "in", "not-in", "array-contains", "array-contains-any"}
+
+
+def _parse_where(clause: str):
+    """Parse "field:operator:value" where the value is JSON when it parses, else a string."""
+    parts = clause.split(":", 2)
+    if len(parts) != 3 or parts[1] not in _OPERATORS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid where clause '{clause}', expected field:operator:value"
+        )
+    field, operator, raw_value = parts
+    try:
+        value = json.loads(raw_value)
+    except ValueError:
+        value = raw_value
+    return field, operator, value
+
+
+@firestore_router.get('/{collection}/stream', status_code=status.HTTP_200_OK)
+def stream_documents(
+    collection: str,
+    where: Optional[List[str]] = Query(None, description="Filter as field:operator:value, e.g. brand_id:==:1. Repeatable."),
+    order_by: Optional[List[str]] = Query(None, description="Field to order by, prefix with - for descending. Repeatable."),
+    fields: Optional[List[str]] = Query(None, description="Only return these fields. Repeatable."),
+    page_size: int = Query(500, ge=1, le=1000, description="Documents fetched per Firestore round trip"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of documents to return"),
+    start_after: Optional[str] = Query(None, description="Document ID to resume after"),
+):
+    """
+    Stream documents from a Firestore collection as NDJSON.
+
+    Args:
+        collection: Collection name, must be listed in STREAMABLE_COLLECTIONS
+
+    Returns:
+        StreamingResponse: One JSON document per line. A failure after streaming
+        has started is reported as a final {"error": ...} line.
+    """
+    if collection not in STREAMABLE_COLLECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Collection not available for streaming: {collection}"
+        )
+    filters = [_parse_where(clause) for clause in where or []]
+
+    # Imported here so Firebase is only initialized when this endpoint is used
+    from app.utils.firebase_utils import stream_collection
+
+    def stream():
+        count = 0
+        try:
+            for document in stream_collection(
+                collection,
+                filters=filters,
+                order_by=order_by,
+                fields=fields,
+                page_size=page_size,
+                limit=limit,
+                start_after=start_after,
+            ):
+                count += 1
+                yield json.dumps(document, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming collection {collection}: {str(e)}")
+            capture_exception(e)
+            yield json.dumps({"error": str(e)}) + "\n"
+        logger.info(f"Streamed {count} documents from {collection}")
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,7 +1,11 @@
+import json
 from fastapi import APIRouter, HTTPException, status
-from sentry_sdk import capture_exception, capture_message
-from app.models import ImageAnalysisPayload,AdInsightsPayload
-from app.llm_controllers.gemini_controller import analyze_image,get_ad_details
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.utils.telemetry import capture_exception
+from app.models import ImageAnalysisPayload,AdInsightsPayload,AdInsightsBatchPayload,CarouselPayload
+from app.llm_controllers.gemini_controller import analyze_image,analyze_image_stream,get_ad_details,get_ad_details_batch,get_carousel_details,get_cache_stats,get_stats
+from app.llm_controllers.gemini_jobs import submit_job,get_job
+from app.utils.brand_rollups import get_brand_summary
 import logging
 
 # Configure logger
@@ -11,7 +15,7 @@ gemini_router = APIRouter()
 
 
 @gemini_router.post('/analyze', status_code=status.HTTP_200_OK)
-def queryVisionLLM(data: ImageAnalysisPayload):
+async def queryVisionLLM(data: ImageAnalysisPayload):
     """
     Analyze an advertisement image using Gemini LLM.
     
@@ -22,13 +26,16 @@ def queryVisionLLM(data: ImageAnalysisPayload):
         dict: Structured analysis of the image
     """
     try:
+        if data.async_mode:
+            job = await submit_job("analyze", data.model_dump(exclude={"async_mode"}))
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job)
         logger.info(f"Analyzing image from URL: {data.image_url}")
-        result = analyze_image(
+        result = await analyze_image(
             image_url=data.image_url,
-            prompt=data.prompt
+            prompt=data.prompt,
+            use_cache=data.use_cache,
         )
         logger.info("Image analysis completed successfully")
-        capture_message("Image analysis completed successfully")
         return result
     except HTTPException as http_ex:
         logger.error(f"HTTP error during image analysis: {str(http_ex)}")
@@ -40,8 +47,37 @@ def queryVisionLLM(data: ImageAnalysisPayload):
         raise HTTPException(status_code=500, detail=f"Failed to analyze image: {str(e)}")
 
 
+@gemini_router.post('/analyze/stream', status_code=status.HTTP_200_OK)
+async def queryVisionLLMStream(data: ImageAnalysisPayload):
+    """
+    Analyze an advertisement image using Gemini LLM, streaming the answer as server-sent events.
+
+    Args:
+        data: ImageAnalysisPayload containing the image URL and optional custom prompt
+
+    Returns:
+        StreamingResponse: SSE stream of "token" events with raw model text, "key" events
+        with each completed top-level field, then a final "result" or "error" event
+    """
+    logger.info(f"Streaming image analysis from URL: {data.image_url}")
+
+    async def stream():
+        async for event, payload in analyze_image_stream(
+            image_url=data.image_url,
+            prompt=data.prompt,
+            use_cache=data.use_cache,
+        ):
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @gemini_router.post('/get_ad_insights', status_code=status.HTTP_200_OK)
-def get_ad_insights(data: AdInsightsPayload):
+async def get_ad_insights(data: AdInsightsPayload):
     """
     Get ad insights from an advertisement image using Gemini LLM.
     
@@ -52,13 +88,16 @@ def get_ad_insights(data: AdInsightsPayload):
         dict: Structured ad insights from the image
     """
     try:
+        if data.async_mode:
+            job = await submit_job("get_ad_insights", data.model_dump(exclude={"async_mode"}))
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job)
         logger.info(f"Getting ad insights from URL: {data.image_url}")
-        result = get_ad_details(
+        result = await get_ad_details(
             image_url=data.image_url,
             brand_id=data.brand_id,
+            use_cache=data.use_cache,
         )
         logger.info("Ad insights analysis completed successfully")
-        capture_message("Image analysis completed successfully")
         return result
     except HTTPException as http_ex:
         logger.error(f"HTTP error during ad insights analysis: {str(http_ex)}")
@@ -69,6 +108,105 @@ def get_ad_insights(data: AdInsightsPayload):
         capture_exception(e)
         raise HTTPException(status_code=500, detail=f"Failed to analyze image: {str(e)}")
     
+@gemini_router.post('/get_ad_insights/batch', status_code=status.HTTP_200_OK)
+async def get_ad_insights_batch(data: AdInsightsBatchPayload):
+    """
+    Get ad insights for a batch of advertisement images using Gemini LLM.
+
+    Args:
+        data: AdInsightsBatchPayload containing the images to analyze and an optional concurrency limit
+
+    Returns:
+        StreamingResponse: One NDJSON line per image, {"index", "result", "error"}, in completion order
+    """
+    logger.info(f"Getting ad insights for a batch of {len(data.items)} images")
+
+    async def stream():
+        async for item in get_ad_details_batch(data.items, concurrency=data.concurrency):
+            yield json.dumps(item) + "\n"
+        logger.info("Batch ad insights analysis completed")
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@gemini_router.post('/get_ad_insights/carousel', status_code=status.HTTP_200_OK)
+async def get_carousel_insights(data: CarouselPayload):
+    """
+    Get ad insights for the images of a carousel or A/B variant set, several images per Gemini call.
+
+    Args:
+        data: CarouselPayload containing the image URLs, optional brand ID and optional pack size
+
+    Returns:
+        dict: Per-image insights in input order plus a comparison of the images in each pack
+    """
+    try:
+        logger.info(f"Getting carousel insights for {len(data.image_urls)} images")
+        result = await get_carousel_details(
+            image_urls=data.image_urls,
+            brand_id=data.brand_id,
+            use_cache=data.use_cache,
+            pack_size=data.pack_size,
+        )
+        logger.info("Carousel insights analysis completed successfully")
+        return result
+    except HTTPException as http_ex:
+        logger.error(f"HTTP error during carousel insights analysis: {str(http_ex)}")
+        capture_exception(http_ex)
+        raise http_ex
+    except Exception as e:
+        logger.error(f"Error during carousel insights analysis: {str(e)}")
+        capture_exception(e)
+        raise HTTPException(status_code=500, detail=f"Failed to analyze carousel: {str(e)}")
+
+@gemini_router.get('/jobs/{job_id}', status_code=status.HTTP_200_OK)
+async def get_job_status(job_id: str):
+    """
+    Get the status of an analysis queued with async_mode.
+
+    Args:
+        job_id: ID returned when the job was queued
+
+    Returns:
+        dict: Job status (queued, running, succeeded, failed), attempts, and result or error
+    """
+    return await get_job(job_id)
+
+@gemini_router.get('/brands/{brand_id}/summary', status_code=status.HTTP_200_OK)
+def brand_summary(brand_id: int):
+    """
+    Get the insight rollup of a brand: how many creatives were analyzed and
+    the distribution of sentiment, CTA, offers and the other categorical fields.
+
+    Args:
+        brand_id: Brand ID
+
+    Returns:
+        dict: Creative count and a histogram per field, read from the precomputed rollup
+    """
+    try:
+        summary = get_brand_summary(brand_id)
+    except Exception as e:
+        logger.error(f"Error reading the summary of brand {brand_id}: {str(e)}")
+        capture_exception(e)
+        raise HTTPException(status_code=500, detail=f"Failed to read brand summary: {str(e)}")
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No insights recorded for brand {brand_id}")
+    return summary
+
+@gemini_router.get('/cache/stats', status_code=status.HTTP_200_OK)
+def cache_stats():
+    """
+    Get hit/miss counters for the analysis result cache.
+    """
+    return get_cache_stats()
+
+@gemini_router.get('/stats', status_code=status.HTTP_200_OK)
+def pipeline_stats():
+    """
+    Get monitoring counters for the analysis pipeline (result cache, image preprocessing).
+    """
+    return get_stats()
+
 @gemini_router.get('/health', status_code=status.HTTP_200_OK)
 def health_check():
     """
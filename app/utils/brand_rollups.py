@@ -0,0 +1,504 @@
+"""Per-brand rollups of ad insights, kept up to date as analyses are recorded."""
+import os
+import re
+import time
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BRAND_ROLLUPS_ENABLED = os.environ.get("BRAND_ROLLUPS_ENABLED", "false").lower() == "true"
+AD_INSIGHTS_COLLECTION = os.environ.get("AD_INSIGHTS_COLLECTION", "ad_insights")
+BRAND_ROLLUPS_COLLECTION = os.environ.get("BRAND_ROLLUPS_COLLECTION", "brand_rollups")
+BRAND_ROLLUPS_FLUSH_INTERVAL = float(os.environ.get("BRAND_ROLLUPS_FLUSH_INTERVAL", "2.0"))
+BRAND_ROLLUPS_QUEUE_SIZE = int(os.environ.get("BRAND_ROLLUPS_QUEUE_SIZE", "10000"))
+BRAND_ROLLUPS_COMMIT_TIMEOUT = float(os.environ.get("BRAND_ROLLUPS_COMMIT_TIMEOUT", "60.0"))
+
+# Analyses applied per group; each becomes one insight write plus a share of the rollup writes
+MAX_GROUP_SIZE = 200
+
+# Histogram name -> AdInsights field with a fixed set of values
+CATEGORICAL_FIELDS = {
+    "contrast": "Contrast in Adv",
+    "gender": "Gender",
+    "headline_size": "Headline Size",
+    "subheadline_size": "Subheadline Size",
+    "engagement_prediction": "Engagement Prediction",
+}
+# Histogram name -> free-text field, counted by its normalized leading phrase
+TEXT_FIELDS = {
+    "sentiment": "Overall Sentiment",
+    "cta_button": "CTA Button",
+}
+# Histogram name -> free-text field, counted only by whether the model found one
+PRESENCE_FIELDS = {
+    "offer": "Offer in Adv",
+    "performance_claim": "Performance Claim",
+}
+NONE_VALUE = "None"
+# Longest free-text label kept, so one verbose answer cannot bloat the rollup document
+MAX_LABEL_LENGTH = 40
+
+
+def insight_document_id(image_url: str, brand_id: Optional[int]) -> str:
+    """
+    Get the insights document ID for an image, so analyzing it again overwrites its document.
+    """
+    return hashlib.sha256(f"{brand_id}|{image_url}".encode("utf-8")).hexdigest()[:32]
+
+
+def _label(value: Any) -> str:
+    """Normalize a free-text answer, e.g. "Positive, exciting" -> "positive"."""
+    if value is None:
+        return NONE_VALUE
+    text = re.split(r"[,;/\n]", str(value), maxsplit=1)[0]
+    text = re.sub(r"\s+", " ", text).strip().strip(".!").lower()[:MAX_LABEL_LENGTH].strip()
+    return NONE_VALUE if not text or text == "none" else text
+
+
+def insight_buckets(details: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Get the histogram bucket an insight falls into for every rollup histogram.
+
+    Args:
+        details (Dict[str, Any]): AdInsights fields by alias
+
+    Returns:
+        Dict[str, str]: Histogram name -> bucket
+    """
+    buckets = {}
+    for name, field in CATEGORICAL_FIELDS.items():
+        value = details.get(field)
+        buckets[name] = str(value) if value not in (None, "") else NONE_VALUE
+    for name, field in TEXT_FIELDS.items():
+        buckets[name] = _label(details.get(field))
+    for name, field in PRESENCE_FIELDS.items():
+        buckets[name] = "Present" if _label(details.get(field)) != NONE_VALUE else NONE_VALUE
+    return buckets
+
+
+def _new_rollup() -> Dict[str, Any]:
+    return {"count": 0, "histograms": {}}
+
+
+def _add(rollup: Dict[str, Any], buckets: Dict[str, str], sign: int):
+    rollup["count"] += sign
+    for name, bucket in buckets.items():
+        histogram = rollup["histograms"].setdefault(name, {})
+        histogram[bucket] = histogram.get(bucket, 0) + sign
+
+
+def _without_zeros(histograms: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    return {
+        name: {bucket: count for bucket, count in histogram.items() if count}
+        for name, histogram in histograms.items()
+    }
+
+
+class BrandRollups:
+    """
+    Stores tagged analyses and keeps the per-brand rollup documents up to date.
+
+    record() only queues the analysis; a background thread applies the queue
+    in groups of up to MAX_GROUP_SIZE, every flush_interval seconds. For each
+    group it reads the insight documents being replaced in one call, queues
+    the new insight documents and one merged increment per brand on the
+    BatchedWriter, and waits for them to commit before reading again. When
+    the queue is full, record() drops the analysis and counts it, since the
+    rollup can be rebuilt later.
+
+    Increments are not transactional with the insight writes, so a failed
+    commit can leave a rollup off by the affected analyses until it is rebuilt.
+
+    Args:
+        client: Firestore client, or a fake with collection()/get_all(). Defaults to firebase_utils.get_db()
+        writer: BatchedWriter for the writes. Defaults to firestore_batch.get_batched_writer()
+        insights_collection (str): Collection holding one document per analyzed creative
+        rollups_collection (str): Collection holding one rollup document per brand
+        flush_interval (float): Longest time an analysis waits before its group is applied
+        max_queue_size (int): Analyses buffered before new ones are dropped
+        commit_timeout (float): Longest wait for a group's writes to commit
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        writer: Any = None,
+        insights_collection: str = AD_INSIGHTS_COLLECTION,
+        rollups_collection: str = BRAND_ROLLUPS_COLLECTION,
+        flush_interval: float = BRAND_ROLLUPS_FLUSH_INTERVAL,
+        max_queue_size: int = BRAND_ROLLUPS_QUEUE_SIZE,
+        commit_timeout: float = BRAND_ROLLUPS_COMMIT_TIMEOUT,
+    ):
+        self._client = client
+        self._writer = writer
+        self.insights_collection = insights_collection
+        self.rollups_collection = rollups_collection
+        self.flush_interval = flush_interval
+        self.commit_timeout = commit_timeout
+        self._queue: "queue.Queue[Optional[Tuple[int, str, Dict[str, Any]]]]" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.recorded = 0
+        self.dropped = 0
+        # Applied analyses that changed a rollup, and re-analyses that left it as it was
+        self.applied = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.rollup_writes = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.utils.firebase_utils import get_db
+            self._client = get_db()
+        return self._client
+
+    @property
+    def writer(self):
+        if self._writer is None:
+            from app.utils.firestore_batch import get_batched_writer
+            self._writer = get_batched_writer()
+        return self._writer
+
+    def start(self):
+        """Start the background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="brand-rollups", daemon=True)
+            self._thread.start()
+
+    def record(self, brand_id: int, image_url: str, details: Dict[str, Any]) -> bool:
+        """
+        Queue an analysis for storage and for its brand's rollup.
+
+        Args:
+            brand_id (int): Brand the creative belongs to
+            image_url (str): Analyzed image
+            details (Dict[str, Any]): AdInsights fields by alias
+
+        Returns:
+            bool: False if the analysis was dropped because the queue is full or closed
+        """
+        if self._closed:
+            self.dropped += 1
+            return False
+        self.start()
+        try:
+            # Copied, since the caller may still change the result it returns
+            self._queue.put_nowait((brand_id, image_url, dict(details)))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Brand rollup queue is full, dropped the analysis of {image_url}")
+            return False
+        self.recorded += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every analysis queued so far has been applied and committed.
+
+        Returns:
+            bool: True if the queue drained in time
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0) -> bool:
+        """
+        Apply everything still queued and stop the background thread.
+
+        Returns:
+            bool: True if all analyses were applied before the timeout
+        """
+        self._closed = True
+        if self._thread is None:
+            return True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        drained = not self._thread.is_alive()
+        if not drained:
+            logger.error(f"Brand rollups closed with {self._queue.qsize()} analyses still queued")
+        return drained
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            items = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < MAX_GROUP_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                items.append(item)
+
+            self._apply_group(items)
+
+        # Apply anything queued after the stop marker
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.task_done()
+                continue
+            items.append(item)
+        for start in range(0, len(items), MAX_GROUP_SIZE):
+            self._apply_group(items[start:start + MAX_GROUP_SIZE])
+
+    def _apply_group(self, items: List[Tuple[int, str, Dict[str, Any]]]):
+        try:
+            self._apply(items)
+        except Exception as e:
+            self.failed += len(items)
+            self.last_error = str(e)
+            logger.error(f"Failed to apply {len(items)} analyses to the brand rollups: {e}")
+        finally:
+            for _ in items:
+                self._queue.task_done()
+
+    def _apply(self, items: List[Tuple[int, str, Dict[str, Any]]]):
+        from firebase_admin import firestore
+
+        document_ids = [insight_document_id(image_url, brand_id) for brand_id, image_url, _ in items]
+        collection = self.client.collection(self.insights_collection)
+        refs = [collection.document(document_id) for document_id in dict.fromkeys(document_ids)]
+        # Insights being replaced, so their counts can be moved instead of added again
+        latest = {
+            snapshot.id: snapshot.to_dict()
+            for snapshot in self.client.get_all(refs)
+            if snapshot.exists
+        }
+
+        deltas: Dict[int, Dict[str, Any]] = {}
+        unchanged = 0
+        for document_id, (brand_id, image_url, details) in zip(document_ids, items):
+            previous = latest.get(document_id)
+            buckets = insight_buckets(details)
+            if previous is not None and insight_buckets(previous) == buckets:
+                unchanged += 1
+            else:
+                delta = deltas.setdefault(brand_id, _new_rollup())
+                if previous is not None:
+                    _add(delta, insight_buckets(previous), -1)
+                _add(delta, buckets, 1)
+
+            data = dict(details)
+            data.update({"image_url": image_url, "brand_id": brand_id, "analyzed_at": time.time()})
+            latest[document_id] = data
+            self.writer.set(self.insights_collection, document_id, data)
+
+        for brand_id, delta in deltas.items():
+            histograms = _without_zeros(delta["histograms"])
+            update = {
+                "brand_id": brand_id,
+                "count": firestore.Increment(delta["count"]),
+                "histograms": {
+                    name: {bucket: firestore.Increment(count) for bucket, count in histogram.items()}
+                    for name, histogram in histograms.items()
+                    if histogram
+                },
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            }
+            self.writer.set(self.rollups_collection, str(brand_id), update, merge=True)
+            self.rollup_writes += 1
+
+        # The next group reads these insights back, so they must be committed first.
+        # Only this group's writes are waited for, not those other callers queue later.
+        if not self.writer.barrier().wait(self.commit_timeout):
+            raise TimeoutError(
+                f"Rollup writes were not committed within {self.commit_timeout:.0f}s; "
+                "rebuild the rollups if they drift"
+            )
+        self.applied += len(items) - unchanged
+        self.unchanged += unchanged
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and counters for monitoring."""
+        return {
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "applied": self.applied,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "rollup_writes": self.rollup_writes,
+            "last_error": self.last_error,
+        }
+
+
+_brand_rollups: Optional[BrandRollups] = None
+_rollups_lock = threading.Lock()
+
+
+def get_brand_rollups() -> BrandRollups:
+    """
+    Get the process-wide rollup recorder, creating it on first use.
+
+    Firebase is only initialized by the background thread, so the first
+    record() does not block the caller.
+    """
+    global _brand_rollups
+
+    with _rollups_lock:
+        if _brand_rollups is None:
+            _brand_rollups = BrandRollups()
+        return _brand_rollups
+
+
+def record_brand_insight(brand_id: int, image_url: str, details: Dict[str, Any]) -> bool:
+    """
+    Queue an analysis for storage and for its brand's rollup, if rollups are enabled.
+
+    Returns:
+        bool: True if the analysis was queued
+    """
+    if not BRAND_ROLLUPS_ENABLED or not brand_id:
+        return False
+    return get_brand_rollups().record(brand_id, image_url, details)
+
+
+def get_brand_rollup_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get the rollup recorder counters, or None if nothing was recorded in this process.
+    """
+    return _brand_rollups.stats() if _brand_rollups is not None else None
+
+
+def close_brand_rollups(timeout: Optional[float] = 30.0) -> bool:
+    """
+    Apply the queued analyses and stop the shared recorder, if it was ever used.
+
+    Call this before closing the batched writer, which commits the writes.
+
+    Returns:
+        bool: True if all analyses were applied before the timeout
+    """
+    global _brand_rollups
+
+    with _rollups_lock:
+        rollups, _brand_rollups = _brand_rollups, None
+    if rollups is None:
+        return True
+    return rollups.close(timeout)
+
+
+def get_brand_summary(brand_id: int, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Read a brand's precomputed rollup.
+
+    Args:
+        brand_id (int): Brand ID
+        use_cache (bool): Serve the read from the firebase_utils read cache when possible
+
+    Returns:
+        Optional[Dict[str, Any]]: Creative count and histograms, or None if the brand has no rollup
+    """
+    from app.utils.firebase_utils import get_document
+
+    rollup = get_document(BRAND_ROLLUPS_COLLECTION, str(brand_id), use_cache=use_cache)
+    if rollup is None:
+        return None
+    return {
+        "brand_id": brand_id,
+        "count": rollup.get("count", 0),
+        "histograms": _without_zeros(rollup.get("histograms") or {}),
+        "updated_at": rollup.get("updated_at"),
+    }
+
+
+def rebuild_rollups(brand_id: Optional[int] = None, page_size: int = 500) -> Dict[int, int]:
+    """
+    Recompute rollups from the stored insights, replacing the current documents.
+
+    Without a brand_id every rollup is rebuilt and rollups of brands with no
+    insights left are deleted. Analyses applied while the rebuild runs may
+    be missed, so run it while no new analyses are being recorded.
+
+    Args:
+        brand_id (Optional[int]): Only rebuild this brand's rollup
+        page_size (int): Insight documents fetched per round trip
+
+    Returns:
+        Dict[int, int]: Brand ID -> creative count
+    """
+    from firebase_admin import firestore
+    from app.utils.firebase_utils import add_document, delete_document, stream_collection
+
+    filters = [("brand_id", "==", brand_id)] if brand_id is not None else None
+    rollups: Dict[int, Dict[str, Any]] = {}
+    for insight in stream_collection(AD_INSIGHTS_COLLECTION, filters=filters, page_size=page_size):
+        if insight.get("brand_id") is None:
+            continue
+        _add(rollups.setdefault(insight["brand_id"], _new_rollup()), insight_buckets(insight), 1)
+
+    for rollup_brand_id, rollup in rollups.items():
+        add_document(
+            BRAND_ROLLUPS_COLLECTION,
+            {
+                "brand_id": rollup_brand_id,
+                "count": rollup["count"],
+                "histograms": rollup["histograms"],
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            },
+            document_id=str(rollup_brand_id),
+        )
+
+    if brand_id is None:
+        stale = [
+            document["id"]
+            for document in stream_collection(BRAND_ROLLUPS_COLLECTION, fields=["brand_id"], page_size=page_size)
+            if document.get("brand_id") not in rollups
+        ]
+    else:
+        stale = [str(brand_id)] if brand_id not in rollups else []
+    for document_id in stale:
+        delete_document(BRAND_ROLLUPS_COLLECTION, document_id)
+
+    return {rollup_brand_id: rollup["count"] for rollup_brand_id, rollup in rollups.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the per-brand insight rollups.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="Recompute rollups from the stored insights")
+    rebuild.add_argument("--brand-id", type=int, help="Only rebuild this brand")
+    rebuild.add_argument("--page-size", type=int, default=500, help="Insight documents fetched per round trip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.command == "rebuild":
+        counts = rebuild_rollups(args.brand_id, page_size=args.page_size)
+        logger.info(f"Rebuilt rollups for {len(counts)} brands from {sum(counts.values())} insights")
+
+
+if __name__ == "__main__":
+    main()
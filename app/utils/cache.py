@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache with optional per-entry TTL.
+
+    Args:
+        max_entries (int): Maximum number of entries kept before the least recently used is evicted
+        ttl (Optional[float]): Default time-to-live in seconds, or None for no expiry
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None):
+        """
+        Get a value from the cache.
+
+        Args:
+            key (str): Cache key
+            default (Any): Value returned on a miss
+
+        Returns:
+            Any: Cached value or default
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value in the cache, evicting the least recently used entries if full.
+
+        Args:
+            key (str): Cache key
+            value (Any): Value to store
+            ttl (Optional[float]): Time-to-live in seconds, defaults to the cache TTL
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        """Remove a key from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters for monitoring."""
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class DiskCache:
+    """
+    A size-bounded on-disk JSON cache with TTL, one file per key.
+
+    Entries are evicted oldest-first once the total size of the cache directory
+    exceeds max_bytes, down to low_water of max_bytes so that eviction does not
+    run again on the next write. Sizes and modification times are tracked in
+    memory; the directory is only walked on first use.
+
+    Args:
+        directory (str): Directory holding the cache files
+        max_bytes (int): Maximum total size of the cache files
+        ttl (Optional[float]): Default time-to-live in seconds, or None for no expiry
+        low_water (float): Fraction of max_bytes that eviction brings the cache down to
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        low_water: float = 0.9,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.low_water_bytes = int(max_bytes * low_water)
+        self._lock = threading.Lock()
+        # Path -> (size, mtime), loaded lazily
+        self._index: Optional[Dict[str, Tuple[int, float]]] = None
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+        self.scans = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _load_index(self) -> Dict[str, Tuple[int, float]]:
+        if self._index is None:
+            self.scans += 1
+            self._index = {path: (size, mtime) for path, size, mtime in self._entries()}
+            self._size = sum(size for size, _ in self._index.values())
+        return self._index
+
+    def _forget(self, path: str):
+        if self._index is not None:
+            entry = self._index.pop(path, None)
+            if entry is not None:
+                self._size -= entry[0]
+
+    def get_with_expiry(self, key: str, default: Any = None) -> Tuple[Any, Optional[float]]:
+        """
+        Get a value from the cache with its expiry time.
+
+        Args:
+            key (str): Cache key
+            default (Any): Value returned on a miss
+
+        Returns:
+            Tuple[Any, Optional[float]]: Cached value or default, and the epoch time
+            it expires at, None if it never does or on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return default, None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read cache entry {path}: {e}")
+            with self._lock:
+                self.errors += 1
+                self.misses += 1
+            return default, None
+
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            with self._lock:
+                self.expirations += 1
+                self.misses += 1
+            return default, None
+        with self._lock:
+            self.hits += 1
+        return entry.get("value"), expires_at
+
+    def get(self, key: str, default: Any = None):
+        """
+        Get a value from the cache.
+
+        Args:
+            key (str): Cache key
+            default (Any): Value returned on a miss
+
+        Returns:
+            Any: Cached value or default
+        """
+        return self.get_with_expiry(key, default)[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Store a JSON-serialisable value in the cache.
+
+        Args:
+            key (str): Cache key
+            value (Any): Value to store
+            ttl (Optional[float]): Time-to-live in seconds, defaults to the cache TTL
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = {"expires_at": time.time() + ttl if ttl else None, "value": value}
+        path = self._path(key)
+        try:
+            payload = json.dumps(entry)
+            with self._lock:
+                index = self._load_index()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+                self._forget(path)
+                stat = os.stat(path)
+                index[path] = (stat.st_size, stat.st_mtime)
+                self._size += stat.st_size
+                if self._size > self.max_bytes:
+                    self._evict()
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write cache entry {path}: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def _evict(self):
+        # Oldest-modified entries go first until we are under the low-water mark
+        for path, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._size <= self.low_water_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._forget(path)
+
+    def delete(self, key: str):
+        """Remove a key from the cache if present."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._forget(path)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._index = {}
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters for monitoring."""
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "entries": len(self._index) if self._index is not None else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "errors": self.errors,
+                "scans": self.scans,
+            }
+
+
+class TwoTierCache:
+    """
+    An in-process LRU cache backed by an optional on-disk cache.
+
+    Reads check memory first, then disk; disk hits are promoted into memory.
+    Writes go to both tiers.
+
+    Args:
+        memory (LRUCache): In-process tier
+        disk (Optional[DiskCache]): On-disk tier, or None to run memory-only
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key: str, default: Any = None):
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING and self.disk is not None:
+            value, expires_at = self.disk.get_with_expiry(key, _MISSING)
+            if value is not _MISSING:
+                self._promote(key, value, expires_at)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return value
+
+    def _promote(self, key: str, value: Any, expires_at: Optional[float]):
+        # Keep the disk entry's remaining lifetime instead of starting a fresh TTL
+        ttl = self.memory.ttl
+        if expires_at is not None:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            ttl = remaining if ttl is None else min(ttl, remaining)
+        self.memory.set(key, value, ttl)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return combined hit/miss counters for both tiers."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
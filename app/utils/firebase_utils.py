@@ -1,59 +1,61 @@
 import os
+import copy
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-from typing import Dict, Any, Optional, List, Union
+import threading
+from typing import Dict, Any, Iterator, Optional, List, Tuple, Union
 from dotenv import load_dotenv
+from app.utils.cache import LRUCache
 
 # Load environment variables from .env file
 load_dotenv()
 
 def create_firebase_credentials():
     """
-    Create firebase_credentials.json file from environment variables if it doesn't exist.
+    Build the service account credentials from environment variables, in memory.
+
+    A firebase_credentials.json in the project root is still used when present,
+    for local development. Nothing is written to disk.
+
+    Returns:
+        Union[str, Dict[str, Any]]: Path to the credentials file or the credentials dictionary
     """
     credentials_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'firebase_credentials.json')
-    
-    if not os.path.exists(credentials_path):
-        required_env_vars = [
-            'FIREBASE_TYPE',
-            'FIREBASE_PROJECT_ID',
-            'FIREBASE_PRIVATE_KEY_ID',
-            'FIREBASE_PRIVATE_KEY',
-            'FIREBASE_CLIENT_EMAIL',
-            'FIREBASE_CLIENT_ID',
-            'FIREBASE_AUTH_URI',
-            'FIREBASE_TOKEN_URI',
-            'FIREBASE_AUTH_PROVIDER_X509_CERT_URL',
-            'FIREBASE_CLIENT_X509_CERT_URL',
-            'FIREBASE_UNIVERSE_DOMAIN'
-        ]
-        
-        # Check if all required environment variables are present
-        missing_vars = [var for var in required_env_vars if not os.getenv(var)]
-        if missing_vars:
-            raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
-        
-        # Create credentials dictionary
-        credentials_dict = {
-            "type": os.getenv('FIREBASE_TYPE'),
-            "project_id": os.getenv('FIREBASE_PROJECT_ID'),
-            "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-            "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
-            "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-            "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-            "auth_uri": os.getenv('FIREBASE_AUTH_URI'),
-            "token_uri": os.getenv('FIREBASE_TOKEN_URI'),
-            "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL'),
-            "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL'),
-            "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN')
-        }
-        
-        # Write credentials to file
-        with open(credentials_path, 'w') as f:
-            json.dump(credentials_dict, f, indent=2)
-        
-        print(f"Created {credentials_path} from environment variables")
+    if os.path.exists(credentials_path):
+        return credentials_path
+
+    required_env_vars = [
+        'FIREBASE_TYPE',
+        'FIREBASE_PROJECT_ID',
+        'FIREBASE_PRIVATE_KEY_ID',
+        'FIREBASE_PRIVATE_KEY',
+        'FIREBASE_CLIENT_EMAIL',
+        'FIREBASE_CLIENT_ID',
+        'FIREBASE_AUTH_URI',
+        'FIREBASE_TOKEN_URI',
+        'FIREBASE_AUTH_PROVIDER_X509_CERT_URL',
+        'FIREBASE_CLIENT_X509_CERT_URL',
+        'FIREBASE_UNIVERSE_DOMAIN'
+    ]
+
+    # Check if all required environment variables are present
+    missing_vars = [var for var in required_env_vars if not os.getenv(var)]
+    if missing_vars:
+        raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+
+    # Create credentials dictionary
+    return {
+        "type": os.getenv('FIREBASE_TYPE'),
+        "project_id": os.getenv('FIREBASE_PROJECT_ID'),
+        "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+        "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
+        "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
+        "client_id": os.getenv('FIREBASE_CLIENT_ID'),
+        "auth_uri": os.getenv('FIREBASE_AUTH_URI'),
+        "token_uri": os.getenv('FIREBASE_TOKEN_URI'),
+        "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL'),
+        "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL'),
+        "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN')
+    }
 
 # Initialize Firebase Admin SDK
 def initialize_firebase():
@@ -63,23 +65,153 @@ def initialize_firebase():
     Returns:
         firestore.Client: Firestore client instance
     """
-    # Create credentials file if it doesn't exist
-    create_firebase_credentials()
-    
+    # firebase_admin pulls in the Firestore and gRPC stack, so it is only
+    # imported once a Firestore client is actually needed
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     # Check if Firebase app is already initialized
     if not firebase_admin._apps:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(os.path.dirname(current_dir))
-        credentials_path = os.path.join(project_root, 'firebase_credentials.json')
-        
-        cred = credentials.Certificate(credentials_path)
+        cred = credentials.Certificate(create_firebase_credentials())
         firebase_admin.initialize_app(cred)
     
     # Return Firestore client
     return firestore.client()
 
-# Get Firestore client
-db = initialize_firebase()
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """
+    Get the Firestore client, initializing Firebase on first use.
+
+    Returns:
+        firestore.Client: Firestore client instance
+    """
+    global _db
+
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = initialize_firebase()
+    return _db
+
+def __getattr__(name: str):
+    # Keep firebase_utils.db working for callers while creating it lazily
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _parse_collection_ttls(value: str) -> Dict[str, float]:
+    """Parse "brands=300,jobs=0" into {"brands": 300.0, "jobs": 0.0}."""
+    ttls = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, ttl = item.split("=", 1)
+            ttls[name.strip()] = float(ttl)
+    return ttls
+
+# Read-through cache for get_document and query_collection. A TTL of 0
+# disables caching for that collection.
+FIRESTORE_CACHE_DEFAULT_TTL = float(os.getenv("FIRESTORE_CACHE_DEFAULT_TTL", "60"))
+FIRESTORE_CACHE_TTLS = _parse_collection_ttls(os.getenv("FIRESTORE_CACHE_TTLS", ""))
+FIRESTORE_CACHE_MAX_ENTRIES = int(os.getenv("FIRESTORE_CACHE_MAX_ENTRIES", "4096"))
+
+read_cache = LRUCache(max_entries=FIRESTORE_CACHE_MAX_ENTRIES)
+
+# Cached value standing in for "document does not exist"
+_NOT_FOUND = {"__not_found__": True}
+
+# Query results are keyed by a per-collection generation, so any write to a
+# collection invalidates all of its cached queries in O(1). Document reads
+# check it too, so a read that raced a write does not cache what it fetched.
+_query_generations: Dict[str, int] = {}
+_generation_lock = threading.Lock()
+
+# Active snapshot listeners, keyed by (collection, document_id)
+_watches: Dict[tuple, Any] = {}
+
+def _collection_ttl(collection: str) -> float:
+    return FIRESTORE_CACHE_TTLS.get(collection, FIRESTORE_CACHE_DEFAULT_TTL)
+
+def _document_key(collection: str, document_id: str) -> tuple:
+    return ("doc", collection, document_id)
+
+def _query_key(collection: str, field: str, operator: str, value: Any, limit: Optional[int]) -> tuple:
+    normalized_value = json.dumps(value, sort_keys=True, default=str)
+    generation = _query_generations.get(collection, 0)
+    return ("query", collection, generation, field, operator.strip().lower(), normalized_value, limit or None)
+
+def invalidate_document(collection: str, document_id: Optional[str] = None):
+    """
+    Drop cached reads affected by a write to a collection.
+
+    Args:
+        collection (str): Collection name
+        document_id (Optional[str]): Written document, if known
+    """
+    # Bump first: a read still in flight will then see the new generation and
+    # not cache its result after the delete below
+    with _generation_lock:
+        _query_generations[collection] = _query_generations.get(collection, 0) + 1
+    if document_id is not None:
+        # Dropped even when watched, since the listener may not have seen the write yet
+        read_cache.delete(_document_key(collection, document_id))
+
+def _cache_document(collection: str, key: tuple, data: Optional[Dict[str, Any]], ttl: float, generation: int):
+    """Cache a document read unless the collection was written since it started."""
+    value = _NOT_FOUND if data is None else copy.deepcopy(data)
+    with _generation_lock:
+        if _query_generations.get(collection, 0) == generation:
+            read_cache.set(key, value, ttl=ttl)
+
+def get_read_cache_stats():
+    """
+    Get hit/miss counters for the Firestore read cache.
+
+    Returns:
+        dict: Cache statistics and the number of active snapshot listeners
+    """
+    stats = read_cache.stats()
+    stats["watched_documents"] = len(_watches)
+    return stats
+
+def watch_document(collection: str, document_id: str):
+    """
+    Keep a hot document fresh in the read cache with a Firestore snapshot listener.
+
+    While watched, the document never expires from the cache and every remote
+    change is applied as it happens.
+
+    Args:
+        collection (str): Collection name
+        document_id (str): Document ID
+    """
+    key = (collection, document_id)
+    if key in _watches:
+        return
+
+    def on_snapshot(snapshots, changes, read_time):
+        for snapshot in snapshots:
+            data = snapshot.to_dict() if snapshot.exists else _NOT_FOUND
+            read_cache.set(_document_key(collection, document_id), data, ttl=0)
+        with _generation_lock:
+            _query_generations[collection] = _query_generations.get(collection, 0) + 1
+
+    _watches[key] = get_db().collection(collection).document(document_id).on_snapshot(on_snapshot)
+
+def unwatch_document(collection: str, document_id: str):
+    """
+    Stop the snapshot listener started by watch_document.
+
+    Args:
+        collection (str): Collection name
+        document_id (str): Document ID
+    """
+    watch = _watches.pop((collection, document_id), None)
+    if watch is not None:
+        watch.unsubscribe()
+        read_cache.delete(_document_key(collection, document_id))
 
 def add_document(collection: str, data: Dict[str, Any], document_id: Optional[str] = None):
     """
@@ -96,36 +228,50 @@ def add_document(collection: str, data: Dict[str, Any], document_id: Optional[st
     try:
         if document_id:
             # Add document with specified ID
-            doc_ref = db.collection(collection).document(document_id)
+            doc_ref = get_db().collection(collection).document(document_id)
             doc_ref.set(data)
+            invalidate_document(collection, document_id)
             return document_id
         else:
             # Add document with auto-generated ID
-            doc_ref = db.collection(collection).add(data)
+            doc_ref = get_db().collection(collection).add(data)
+            invalidate_document(collection)
             return doc_ref[1].id
     except Exception as e:
         print(f"Error adding document to {collection}: {e}")
         raise e
 
-def get_document(collection: str, document_id: str):
+def get_document(collection: str, document_id: str, use_cache: bool = True):
     """
     Get a document from a Firestore collection.
     
     Args:
         collection (str): Collection name
         document_id (str): Document ID
+        use_cache (bool): Serve the read from the read-through cache when possible
         
     Returns:
         Dict[str, Any]: Document data or None if not found
     """
     try:
-        doc_ref = db.collection(collection).document(document_id)
+        ttl = _collection_ttl(collection)
+        key = _document_key(collection, document_id)
+        if use_cache and (ttl or (collection, document_id) in _watches):
+            cached = read_cache.get(key)
+            if cached is not None:
+                return None if cached is _NOT_FOUND else copy.deepcopy(cached)
+
+        generation = _query_generations.get(collection, 0)
+        doc_ref = get_db().collection(collection).document(document_id)
         doc = doc_ref.get()
-        
-        if doc.exists:
-            return doc.to_dict()
-        else:
-            return None
+        data = doc.to_dict() if doc.exists else None
+
+        if (collection, document_id) in _watches:
+            # Kept fresh by the snapshot listener, so it never expires
+            _cache_document(collection, key, data, 0, generation)
+        elif ttl:
+            _cache_document(collection, key, data, ttl, generation)
+        return data
     except Exception as e:
         print(f"Error getting document from {collection}: {e}")
         raise e
@@ -143,8 +289,9 @@ def update_document(collection: str, document_id: str, data: Dict[str, Any]):
         bool: True if successful
     """
     try:
-        doc_ref = db.collection(collection).document(document_id)
+        doc_ref = get_db().collection(collection).document(document_id)
         doc_ref.update(data)
+        invalidate_document(collection, document_id)
         return True
     except Exception as e:
         print(f"Error updating document in {collection}: {e}")
@@ -162,8 +309,9 @@ def delete_document(collection: str, document_id: str):
         bool: True if successful
     """
     try:
-        doc_ref = db.collection(collection).document(document_id)
+        doc_ref = get_db().collection(collection).document(document_id)
         doc_ref.delete()
+        invalidate_document(collection, document_id)
         return True
     except Exception as e:
         print(f"Error deleting document from {collection}: {e}")
@@ -174,7 +322,8 @@ def query_collection(
     field: str, 
     operator: str, 
     value: Any, 
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    use_cache: bool = True
 ):
     """
     Query documents from a Firestore collection.
@@ -185,12 +334,20 @@ def query_collection(
         operator (str): Operator for comparison (e.g., "==", ">", "<")
         value (Any): Value to compare
         limit (Optional[int]): Maximum number of documents to return
+        use_cache (bool): Serve the query from the read-through cache when possible
         
     Returns:
         List[Dict[str, Any]]: List of document data
     """
     try:
-        query = db.collection(collection).where(field, operator, value)
+        ttl = _collection_ttl(collection)
+        key = _query_key(collection, field, operator, value, limit)
+        if use_cache and ttl:
+            cached = read_cache.get(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+        query = get_db().collection(collection).where(field, operator, value)
         
         if limit:
             query = query.limit(limit)
@@ -202,8 +359,88 @@ def query_collection(
             data = doc.to_dict()
             data['id'] = doc.id
             result.append(data)
-            
+
+        if ttl:
+            read_cache.set(key, copy.deepcopy(result), ttl=ttl)
         return result
     except Exception as e:
         print(f"Error querying collection {collection}: {e}")
-        raise e 
\ No newline at end of file
+        raise e 
+
+
+def stream_collection(
+    collection: str,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+    order_by: Optional[List[str]] = None,
+    fields: Optional[List[str]] = None,
+    page_size: int = 500,
+    limit: Optional[int] = None,
+    start_after: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream documents from a Firestore collection, one page at a time.
+
+    Pages are fetched with cursor-based pagination (start_after the last
+    document of the previous page), so memory use is bounded by page_size
+    and the first documents are available before the query completes.
+    
+    Args:
+        collection (str): Collection name
+        filters (Optional[List[Tuple[str, str, Any]]]): (field, operator, value) where clauses
+        order_by (Optional[List[str]]): Fields to order by, prefixed with "-" for descending
+        fields (Optional[List[str]]): Field projection; only these fields are returned
+        page_size (int): Documents fetched per round trip
+        limit (Optional[int]): Maximum number of documents to return
+        start_after (Optional[str]): Document ID to resume after
+        
+    Yields:
+        Dict[str, Any]: Document data with its 'id'
+    """
+    from firebase_admin import firestore
+
+    try:
+        query = get_db().collection(collection)
+        for field, operator, value in filters or []:
+            query = query.where(field, operator, value)
+
+        order_fields = []
+        for order in order_by or []:
+            field = order.lstrip("-")
+            direction = firestore.Query.DESCENDING if order.startswith("-") else firestore.Query.ASCENDING
+            query = query.order_by(field, direction=direction)
+            order_fields.append(field)
+        # Order by document ID last so the cursor is unambiguous
+        query = query.order_by(firestore.FieldPath.document_id())
+
+        if fields:
+            # Cursor values come from the ordered fields, so they must be in the projection
+            query = query.select(list(dict.fromkeys(list(fields) + order_fields)))
+
+        cursor = None
+        if start_after:
+            cursor = get_db().collection(collection).document(start_after).get()
+            if not cursor.exists:
+                raise ValueError(f"start_after document {start_after} not found in {collection}")
+
+        returned = 0
+        while limit is None or returned < limit:
+            page_limit = page_size if limit is None else min(page_size, limit - returned)
+            page_query = query.limit(page_limit)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+
+            docs = list(page_query.stream())
+            for doc in docs:
+                data = doc.to_dict()
+                if fields:
+                    data = {key: value for key, value in data.items() if key in fields}
+                data['id'] = doc.id
+                yield data
+            returned += len(docs)
+
+            if len(docs) < page_limit:
+                break
+            cursor = docs[-1]
+    except Exception as e:
+        print(f"Error streaming collection {collection}: {e}")
+        raise e
@@ -0,0 +1,347 @@
+import os
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Firestore rejects batches with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+FIRESTORE_BATCH_SIZE = int(os.environ.get("FIRESTORE_BATCH_SIZE", str(MAX_BATCH_SIZE)))
+FIRESTORE_FLUSH_INTERVAL = float(os.environ.get("FIRESTORE_FLUSH_INTERVAL", "1.0"))
+FIRESTORE_WRITE_QUEUE_SIZE = int(os.environ.get("FIRESTORE_WRITE_QUEUE_SIZE", "10000"))
+FIRESTORE_ENQUEUE_TIMEOUT = float(os.environ.get("FIRESTORE_ENQUEUE_TIMEOUT", "5.0"))
+
+
+class WriteQueueFullError(Exception):
+    """
+    Raised when the write queue stays full for longer than the enqueue timeout.
+    """
+
+
+@dataclass
+class WriteOp:
+    """
+    A single queued Firestore write, or a barrier that is set once every write queued before it is done.
+    """
+    kind: str
+    collection: str
+    document_id: str
+    data: Optional[Dict[str, Any]] = None
+    merge: bool = False
+    done: Optional[threading.Event] = None
+
+
+@dataclass
+class BatchError:
+    """
+    A failed batch commit, passed to the error callback.
+    """
+    ops: List[WriteOp]
+    error: Exception
+    failed_at: float = field(default_factory=time.time)
+
+
+class BatchedWriter:
+    """
+    Write-behind Firestore writer.
+
+    Callers enqueue writes and return immediately; a background thread
+    commits them as WriteBatches of up to max_batch_size operations, as soon
+    as a batch is full or flush_interval seconds after its first write.
+    When the queue is full, enqueueing blocks for up to enqueue_timeout
+    seconds and then raises WriteQueueFullError.
+
+    Args:
+        client: Firestore client, or a fake with collection()/batch(). Defaults to firebase_utils.get_db()
+        max_batch_size (int): Operations per committed batch, at most 500
+        flush_interval (float): Longest time a write waits before its batch is committed
+        max_queue_size (int): Writes buffered before callers are blocked
+        enqueue_timeout (float): Seconds a caller waits for room in a full queue
+        on_error (Callable[[BatchError], None]): Called for every batch that fails to commit
+        on_commit (Callable[[List[WriteOp]], None]): Called with the ops of every committed batch
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        max_batch_size: int = FIRESTORE_BATCH_SIZE,
+        flush_interval: float = FIRESTORE_FLUSH_INTERVAL,
+        max_queue_size: int = FIRESTORE_WRITE_QUEUE_SIZE,
+        enqueue_timeout: float = FIRESTORE_ENQUEUE_TIMEOUT,
+        on_error: Optional[Callable[[BatchError], None]] = None,
+        on_commit: Optional[Callable[[List[WriteOp]], None]] = None,
+    ):
+        self._client = client
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.on_error = on_error
+        self.on_commit = on_commit
+        self._queue: "queue.Queue[Optional[WriteOp]]" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.enqueued = 0
+        self.committed = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.failed_ops = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.utils.firebase_utils import get_db
+            self._client = get_db()
+        return self._client
+
+    def start(self):
+        """Start the background flusher thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="firestore-batched-writer", daemon=True)
+            self._thread.start()
+
+    def set(self, collection: str, document_id: str, data: Dict[str, Any], merge: bool = False):
+        """Queue a set() of a document."""
+        self._put(WriteOp("set", collection, document_id, data, merge))
+
+    def update(self, collection: str, document_id: str, data: Dict[str, Any]):
+        """Queue an update() of an existing document."""
+        self._put(WriteOp("update", collection, document_id, data))
+
+    def delete(self, collection: str, document_id: str):
+        """Queue a delete() of a document."""
+        self._put(WriteOp("delete", collection, document_id))
+
+    def add(self, collection: str, data: Dict[str, Any]) -> str:
+        """
+        Queue a new document with an auto-generated ID.
+
+        Returns:
+            str: The ID the document will be written under
+        """
+        document_id = self.client.collection(collection).document().id
+        self._put(WriteOp("set", collection, document_id, data))
+        return document_id
+
+    def barrier(self) -> threading.Event:
+        """
+        Queue a marker behind every write queued so far.
+
+        Unlike flush(), waiting on it is not delayed by writes other callers
+        queue afterwards.
+
+        Returns:
+            threading.Event: Set once the earlier writes have been committed or have failed
+        """
+        done = threading.Event()
+        self._put(WriteOp("barrier", "", "", done=done))
+        return done
+
+    def _put(self, op: WriteOp):
+        if self._closed:
+            raise RuntimeError("BatchedWriter is closed")
+        self.start()
+        try:
+            self._queue.put(op, timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise WriteQueueFullError(
+                f"Firestore write queue is full ({self._queue.maxsize} pending writes)"
+            )
+        if op.kind != "barrier":
+            self.enqueued += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every write queued so far has been committed or has failed.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait
+
+        Returns:
+            bool: True if the queue drained in time
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0) -> bool:
+        """
+        Commit everything still queued and stop the flusher thread.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, including for room in a full queue
+
+        Returns:
+            bool: True if all writes were flushed before the timeout
+        """
+        if self._thread is None:
+            self._closed = True
+            return True
+        self._closed = True
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Firestore writer closed with {self._queue.qsize()} writes still queued")
+            return False
+        self._thread.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+        drained = not self._thread.is_alive()
+        if not drained:
+            logger.error(f"Firestore writer closed with {self._queue.qsize()} writes still queued")
+        return drained
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            op = self._queue.get()
+            if op is None:
+                self._queue.task_done()
+                break
+
+            ops = [op]
+            deadline = time.monotonic() + self.flush_interval
+            # A barrier has a caller waiting, so its batch is committed without waiting for more writes
+            while len(ops) < self.max_batch_size and ops[-1].kind != "barrier":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if op is None:
+                    # Commit what we have, then stop
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                ops.append(op)
+
+            self._commit(ops)
+
+        # Drain anything enqueued after the stop marker
+        remaining_ops = []
+        while True:
+            try:
+                op = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is None:
+                self._queue.task_done()
+                continue
+            remaining_ops.append(op)
+        for start in range(0, len(remaining_ops), self.max_batch_size):
+            self._commit(remaining_ops[start:start + self.max_batch_size])
+
+    def _commit(self, ops: List[WriteOp]):
+        barriers = [op for op in ops if op.kind == "barrier"]
+        if barriers:
+            ops = [op for op in ops if op.kind != "barrier"]
+            for _ in barriers:
+                self._queue.task_done()
+            if not ops:
+                for barrier in barriers:
+                    barrier.done.set()
+                return
+        try:
+            batch = self.client.batch()
+            for op in ops:
+                ref = self.client.collection(op.collection).document(op.document_id)
+                if op.kind == "set":
+                    batch.set(ref, op.data, merge=op.merge)
+                elif op.kind == "update":
+                    batch.update(ref, op.data)
+                elif op.kind == "delete":
+                    batch.delete(ref)
+            batch.commit()
+        except Exception as e:
+            self.failed_batches += 1
+            self.failed_ops += len(ops)
+            self.last_error = str(e)
+            logger.error(f"Failed to commit Firestore batch of {len(ops)} writes: {e}")
+            if self.on_error is not None:
+                try:
+                    self.on_error(BatchError(ops, e))
+                except Exception as callback_error:
+                    logger.error(f"Firestore batch error callback failed: {callback_error}")
+        else:
+            self.batches += 1
+            self.committed += len(ops)
+            # The batch is durable; a failing callback must not count it as failed
+            if self.on_commit is not None:
+                try:
+                    self.on_commit(ops)
+                except Exception as callback_error:
+                    logger.error(f"Firestore batch commit callback failed: {callback_error}")
+        finally:
+            for _ in ops:
+                self._queue.task_done()
+            for barrier in barriers:
+                barrier.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and commit counters for monitoring."""
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "committed": self.committed,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_ops": self.failed_ops,
+            "last_error": self.last_error,
+        }
+
+
+_batched_writer: Optional[BatchedWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_batched_writer() -> BatchedWriter:
+    """
+    Get the process-wide batched writer, creating it on first use.
+
+    Returns:
+        BatchedWriter: Shared writer backed by firebase_utils.get_db()
+    """
+    global _batched_writer
+
+    with _writer_lock:
+        if _batched_writer is None:
+            from app.utils import firebase_utils
+
+            def invalidate(ops: List[WriteOp]):
+                # Keep the firebase_utils read cache coherent with write-behind writes
+                for op in ops:
+                    firebase_utils.invalidate_document(op.collection, op.document_id)
+
+            _batched_writer = BatchedWriter(client=firebase_utils.get_db(), on_commit=invalidate)
+            _batched_writer.start()
+        return _batched_writer
+
+
+def close_batched_writer(timeout: Optional[float] = 30.0) -> bool:
+    """
+    Flush and stop the shared batched writer, if it was ever used.
+
+    Returns:
+        bool: True if all writes were flushed before the timeout
+    """
+    global _batched_writer
+
+    with _writer_lock:
+        writer, _batched_writer = _batched_writer, None
+    if writer is None:
+        return True
+    return writer.close(timeout)
@@ -0,0 +1,238 @@
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    A BK-tree over integer hashes under Hamming distance.
+
+    Nodes live in parallel lists and every node's parent precedes it, so the
+    tree can be written out and rebuilt in one linear pass. Adding a hash
+    that is already present replaces its value.
+    """
+
+    def __init__(self):
+        self.hashes: List[int] = []
+        self.values: List[Any] = []
+        self.parents: List[int] = []
+        self._children: List[Dict[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _append(self, value_hash: int, value: Any, parent: int, distance: int):
+        index = len(self.hashes)
+        self.hashes.append(value_hash)
+        self.values.append(value)
+        self.parents.append(parent)
+        self._children.append({})
+        if parent >= 0:
+            self._children[parent][distance] = index
+
+    def add(self, value_hash: int, value: Any):
+        """
+        Insert a hash, or replace the value stored for it.
+
+        Args:
+            value_hash (int): Hash to index
+            value (Any): Value returned by search()
+        """
+        if not self.hashes:
+            self._append(value_hash, value, -1, 0)
+            return
+        node = 0
+        while True:
+            distance = hamming_distance(value_hash, self.hashes[node])
+            if distance == 0:
+                self.values[node] = value
+                return
+            child = self._children[node].get(distance)
+            if child is None:
+                self._append(value_hash, value, node, distance)
+                return
+            node = child
+
+    def search(self, value_hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find every indexed hash within max_distance bits.
+
+        Args:
+            value_hash (int): Hash to look up
+            max_distance (int): Largest Hamming distance to accept
+
+        Returns:
+            List[Tuple[int, Any]]: (distance, value) pairs, closest first
+        """
+        if not self.hashes:
+            return []
+        matches = []
+        pending = [0]
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(value_hash, self.hashes[node])
+            if distance <= max_distance:
+                matches.append((distance, self.values[node]))
+            # By the triangle inequality only children in this distance band can match
+            for child_distance, child in self._children[node].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def nodes(self) -> List[list]:
+        """Nodes as [hash, value, parent, distance to parent] in insertion order."""
+        return [
+            [value_hash, value, parent, hamming_distance(value_hash, self.hashes[parent]) if parent >= 0 else 0]
+            for value_hash, value, parent in zip(self.hashes, self.values, self.parents)
+        ]
+
+    @classmethod
+    def from_nodes(cls, nodes: List[list]) -> "BKTree":
+        """Rebuild a tree from nodes(), linking children without re-walking the tree."""
+        tree = cls()
+        for value_hash, value, parent, distance in nodes:
+            tree._append(value_hash, value, parent, distance)
+        return tree
+
+
+class HammingIndex:
+    """
+    A thread-safe BK-tree index persisted to disk.
+
+    The index is stored as a snapshot of the tree plus an append-only log of
+    later additions. Loading links the snapshot in one pass and replays the
+    log; the log is folded into a new snapshot every compact_every additions
+    and on save().
+
+    Args:
+        path (Optional[str]): Snapshot file, or None to keep the index in memory only
+        compact_every (int): Log entries written before the snapshot is rewritten
+    """
+
+    def __init__(self, path: Optional[str] = None, compact_every: int = 1000):
+        self.path = path
+        self.log_path = f"{path}.log" if path else None
+        self.compact_every = compact_every
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self._log_entries = 0
+        self._loaded = False
+        self.lookups = 0
+        self.matches = 0
+
+    def load(self):
+        """
+        Read the snapshot and log from disk. Safe to call more than once.
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path:
+                return
+            try:
+                with open(self.path, "r") as f:
+                    self._tree = BKTree.from_nodes(json.load(f)["nodes"])
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable hash index {self.path}: {str(e)}")
+                self._tree = BKTree()
+
+            try:
+                with open(self.log_path, "r") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A torn final line from a crash mid-write
+                            continue
+                        self._tree.add(entry[0], entry[1])
+                        self._log_entries += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Ignoring unreadable hash index log {self.log_path}: {str(e)}")
+            logger.info(f"Loaded {len(self._tree)} hashes from {self.path}")
+
+    def add(self, value_hash: int, value: Any):
+        """
+        Index a hash and append it to the on-disk log.
+
+        Args:
+            value_hash (int): Hash to index
+            value (Any): JSON-serializable value returned by search()
+        """
+        self.load()
+        with self._lock:
+            self._tree.add(value_hash, value)
+            if not self.path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps([value_hash, value]) + "\n")
+                self._log_entries += 1
+                if self._log_entries >= self.compact_every:
+                    self._write_snapshot()
+            except OSError as e:
+                logger.warning(f"Failed to persist hash index entry: {str(e)}")
+
+    def search(self, value_hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find indexed values whose hash is within max_distance bits.
+
+        Returns:
+            List[Tuple[int, Any]]: (distance, value) pairs, closest first
+        """
+        self.load()
+        with self._lock:
+            self.lookups += 1
+            matches = self._tree.search(value_hash, max_distance)
+            if matches:
+                self.matches += 1
+            return matches
+
+    def _write_snapshot(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": 1, "nodes": self._tree.nodes()}, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+        # Everything in the log is now in the snapshot
+        open(self.log_path, "w").close()
+        self._log_entries = 0
+
+    def save(self):
+        """
+        Fold the log into a fresh snapshot.
+        """
+        if not self.path or not self._loaded:
+            return
+        with self._lock:
+            if self._log_entries == 0:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._write_snapshot()
+            except OSError as e:
+                logger.warning(f"Failed to save hash index {self.path}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the index size and lookup counters."""
+        return {
+            "entries": len(self._tree),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "path": self.path,
+        }
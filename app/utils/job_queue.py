@@ -0,0 +1,492 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Error stored on a job whose last attempt never reported back, e.g. because its worker was killed
+LEASE_EXPIRED_ERROR = "The worker running the last attempt stopped before it finished"
+
+
+class JobBackend:
+    """
+    Storage interface for the job queue.
+
+    Backends are synchronous; JobQueue calls them from worker threads. A job
+    is a dict with id, kind, payload, status, attempts, max_attempts, result,
+    error, created_at and updated_at.
+    """
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the next runnable job and mark it running.
+
+        A job is runnable when it is queued and due, or when it is running but
+        its lease has expired because the worker that held it died. An expired
+        job with no attempts left is marked failed instead of being claimed, so
+        a job that kills its worker is not retried forever.
+        """
+        raise NotImplementedError
+
+    def renew(self, job_id: str, attempt: int, lease_seconds: float) -> bool:
+        """
+        Extend the lease of a running job.
+
+        Returns:
+            bool: False if the attempt no longer owns the job, e.g. because its
+            lease expired and another worker claimed it
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: str, result: Any, attempt: Optional[int] = None) -> bool:
+        """
+        Mark the job succeeded.
+
+        With an attempt, only if that attempt still owns the job, so a job taken
+        over after its lease expired is not completed twice.
+
+        Returns:
+            bool: True if the job was updated
+        """
+        raise NotImplementedError
+
+    def fail(self, job_id: str, error: str, retry_at: Optional[float] = None, attempt: Optional[int] = None) -> bool:
+        """Requeue the job at retry_at, or mark it failed when retry_at is None. attempt is as for complete()."""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteJobBackend(JobBackend):
+    """
+    Job storage in a local SQLite database, so jobs survive a restart.
+
+    Args:
+        path (str): Database file path
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                result TEXT,
+                error TEXT,
+                available_at REAL NOT NULL,
+                locked_until REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, available_at)")
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), JOB_QUEUED, max_attempts, now, now, now),
+            )
+        return self.get(job_id)
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, locked_until = NULL, updated_at = ? "
+                    "WHERE status = ? AND locked_until < ? AND attempts >= max_attempts",
+                    (JOB_FAILED, LEASE_EXPIRED_ERROR, now, JOB_RUNNING, now),
+                ).rowcount
+                if expired:
+                    logger.error(f"Marked {expired} jobs failed: {LEASE_EXPIRED_ERROR}")
+                row = self._conn.execute(
+                    "SELECT id FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) "
+                    "OR (status = ? AND locked_until < ? AND attempts < max_attempts) "
+                    "ORDER BY available_at LIMIT 1",
+                    (JOB_QUEUED, now, JOB_RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, updated_at = ? WHERE id = ?",
+                    (JOB_RUNNING, now + lease_seconds, now, row["id"]),
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(job)
+
+    def _update_owned(self, job_id: str, attempt: Optional[int], assignments: str, values: tuple) -> bool:
+        sql = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        params = values + (job_id,)
+        if attempt is not None:
+            sql += " AND status = ? AND attempts = ?"
+            params += (JOB_RUNNING, attempt)
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount > 0
+
+    def renew(self, job_id: str, attempt: int, lease_seconds: float) -> bool:
+        now = time.time()
+        return self._update_owned(job_id, attempt, "locked_until = ?, updated_at = ?", (now + lease_seconds, now))
+
+    def complete(self, job_id: str, result: Any, attempt: Optional[int] = None) -> bool:
+        return self._update_owned(
+            job_id, attempt,
+            "status = ?, result = ?, error = NULL, locked_until = NULL, updated_at = ?",
+            (JOB_SUCCEEDED, json.dumps(result), time.time()),
+        )
+
+    def fail(self, job_id: str, error: str, retry_at: Optional[float] = None, attempt: Optional[int] = None) -> bool:
+        if retry_at is None:
+            return self._update_owned(
+                job_id, attempt,
+                "status = ?, error = ?, locked_until = NULL, updated_at = ?",
+                (JOB_FAILED, error, time.time()),
+            )
+        return self._update_owned(
+            job_id, attempt,
+            "status = ?, error = ?, available_at = ?, locked_until = NULL, updated_at = ?",
+            (JOB_QUEUED, error, retry_at, time.time()),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FirestoreJobBackend(JobBackend):
+    """
+    Job storage in a Firestore collection, for deployments without a persistent local disk.
+
+    Args:
+        collection (str): Collection holding one document per job
+    """
+
+    def __init__(self, collection: str = "jobs"):
+        # Imported lazily so the SQLite backend does not need Firebase credentials
+        from firebase_admin import firestore
+        from app.utils import firebase_utils
+
+        self.collection = collection
+        self._firestore = firestore
+        self._db = firebase_utils.get_db()
+        self._utils = firebase_utils
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "result": None,
+            "error": None,
+            "available_at": now,
+            "locked_until": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._utils.add_document(self.collection, job, document_id=job["id"])
+        return job
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        candidates = self._utils.query_collection(self.collection, "status", "==", JOB_QUEUED, limit=20, use_cache=False)
+        candidates = [job for job in candidates if job.get("available_at", 0) <= now]
+        candidates += [
+            job for job in self._utils.query_collection(self.collection, "status", "==", JOB_RUNNING, limit=20, use_cache=False)
+            if (job.get("locked_until") or 0) < now
+        ]
+        for candidate in sorted(candidates, key=lambda job: job.get("available_at", 0)):
+            job = self._claim_one(candidate["id"], lease_seconds)
+            if job is not None:
+                return job
+        return None
+
+    def _claim_one(self, job_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        ref = self._db.collection(self.collection).document(job_id)
+
+        @self._firestore.transactional
+        def claim_in_transaction(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            job = snapshot.to_dict()
+            now = time.time()
+            expired = job["status"] == JOB_RUNNING and (job.get("locked_until") or 0) < now
+            if expired and job.get("attempts", 0) >= job.get("max_attempts", 1):
+                transaction.update(ref, {
+                    "status": JOB_FAILED,
+                    "error": LEASE_EXPIRED_ERROR,
+                    "locked_until": None,
+                    "updated_at": now,
+                })
+                logger.error(f"Job {job_id} failed after {job.get('attempts', 0)} attempts: {LEASE_EXPIRED_ERROR}")
+                return None
+            runnable = (job["status"] == JOB_QUEUED and job.get("available_at", 0) <= now) or expired
+            if not runnable:
+                return None
+            job.update({
+                "status": JOB_RUNNING,
+                "attempts": job.get("attempts", 0) + 1,
+                "locked_until": now + lease_seconds,
+                "updated_at": now,
+            })
+            transaction.update(ref, {
+                key: job[key] for key in ("status", "attempts", "locked_until", "updated_at")
+            })
+            return job
+
+        return claim_in_transaction(self._db.transaction())
+
+    def _update_owned(self, job_id: str, attempt: Optional[int], data: Dict[str, Any]) -> bool:
+        if attempt is None:
+            self._utils.update_document(self.collection, job_id, data)
+            return True
+
+        ref = self._db.collection(self.collection).document(job_id)
+
+        @self._firestore.transactional
+        def update_in_transaction(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            job = snapshot.to_dict()
+            if job["status"] != JOB_RUNNING or job.get("attempts") != attempt:
+                return False
+            transaction.update(ref, data)
+            return True
+
+        updated = update_in_transaction(self._db.transaction())
+        if updated:
+            self._utils.invalidate_document(self.collection, job_id)
+        return updated
+
+    def renew(self, job_id: str, attempt: int, lease_seconds: float) -> bool:
+        now = time.time()
+        return self._update_owned(job_id, attempt, {"locked_until": now + lease_seconds, "updated_at": now})
+
+    def complete(self, job_id: str, result: Any, attempt: Optional[int] = None) -> bool:
+        return self._update_owned(job_id, attempt, {
+            "status": JOB_SUCCEEDED,
+            "result": result,
+            "error": None,
+            "locked_until": None,
+            "updated_at": time.time(),
+        })
+
+    def fail(self, job_id: str, error: str, retry_at: Optional[float] = None, attempt: Optional[int] = None) -> bool:
+        data = {"error": error, "locked_until": None, "updated_at": time.time()}
+        if retry_at is None:
+            data["status"] = JOB_FAILED
+        else:
+            data.update({"status": JOB_QUEUED, "available_at": retry_at})
+        return self._update_owned(job_id, attempt, data)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._utils.get_document(self.collection, job_id, use_cache=False)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Decide whether a failed job should be retried.
+
+    Client errors (4xx other than 429) are permanent; everything else is
+    treated as transient.
+    """
+    if isinstance(exc, HTTPException):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return True
+
+
+class JobQueue:
+    """
+    A pool of asyncio workers running jobs from a persistent backend.
+
+    Args:
+        backend (JobBackend): Job storage
+        handlers (Dict[str, Callable]): Coroutine per job kind, called with the job payload
+        workers (int): Number of concurrent workers
+        max_attempts (int): Attempts per job before it is marked failed
+        retry_backoff (float): Base delay in seconds between attempts, doubled each time
+        lease_seconds (float): How long a running job is held before another worker may take it over.
+            The lease is renewed every third of this while the job runs.
+        poll_interval (float): Idle wait between backend polls
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]],
+        workers: int = 4,
+        max_attempts: int = 3,
+        retry_backoff: float = 2.0,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 1.0,
+    ):
+        self.backend = backend
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self):
+        """Start the worker tasks."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"Started job queue with {self.workers} workers")
+
+    async def stop(self):
+        """Stop the workers. Jobs they were running are picked up again after their lease expires."""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.backend.close)
+        logger.info("Stopped job queue")
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Add a job to the queue.
+
+        Args:
+            kind (str): Handler name
+            payload (Dict[str, Any]): JSON-serialisable handler arguments
+
+        Returns:
+            Dict[str, Any]: The stored job
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await asyncio.to_thread(self.backend.enqueue, kind, payload, self.max_attempts)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by ID, or None if it does not exist."""
+        return await asyncio.to_thread(self.backend.get, job_id)
+
+    async def _worker(self, n: int):
+        while not self._stopping:
+            try:
+                job = await asyncio.to_thread(self.backend.claim, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job worker {n} failed to claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception as e:
+                # A transient backend error must not kill the worker; the job's lease
+                # expires and it is claimed again
+                logger.error(f"Job worker {n} failed to record the outcome of job {job['id']}: {str(e)}")
+
+    async def _renew_lease(self, job: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                owned = await asyncio.to_thread(self.backend.renew, job["id"], job["attempts"], self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of job {job['id']}: {str(e)}")
+                continue
+            if not owned:
+                logger.warning(f"Job {job['id']} attempt {job['attempts']} lost its lease")
+                return
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        attempt = job["attempts"]
+        renewer = asyncio.create_task(self._renew_lease(job))
+        try:
+            result = await self.handlers[job["kind"]](job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            if attempt < job["max_attempts"] and is_retryable(e):
+                delay = self.retry_backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                logger.warning(f"Job {job_id} attempt {attempt} failed, retrying in {delay:.1f}s: {error}")
+                recorded = await asyncio.to_thread(self.backend.fail, job_id, error, time.time() + delay, attempt)
+            else:
+                logger.error(f"Job {job_id} failed after {attempt} attempts: {error}")
+                recorded = await asyncio.to_thread(self.backend.fail, job_id, error, None, attempt)
+        else:
+            recorded = await asyncio.to_thread(self.backend.complete, job_id, result, attempt)
+            if recorded:
+                logger.info(f"Job {job_id} succeeded")
+        finally:
+            renewer.cancel()
+
+        if not recorded:
+            logger.warning(f"Job {job_id} attempt {attempt} finished after another worker took it over; outcome discarded")
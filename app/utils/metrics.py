@@ -0,0 +1,325 @@
+import math
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.utils.telemetry import start_span
+
+# Latency buckets in seconds, from a cache hit to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# Quantiles reported from the recent-observation window
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing counter.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    A cumulative-bucket histogram that also keeps a window of recent observations for p50/p95/p99.
+
+    The buckets are exported as a Prometheus histogram so they can be
+    aggregated across workers; the quantiles are exported as a separate
+    {name}_quantile gauge computed in-process over the last window_size
+    observations.
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        window_size: int = 1024,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.window_size = window_size
+        self._series: Dict[LabelValues, Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                    "recent": deque(maxlen=self.window_size),
+                }
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        """
+        Get p50/p95/p99 over the recent window.
+
+        Returns:
+            Dict[float, float]: Quantile to value, empty if nothing was observed
+        """
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            recent = sorted(series["recent"]) if series else []
+        return self._quantiles(recent)
+
+    @staticmethod
+    def _quantiles(recent: List[float]) -> Dict[float, float]:
+        if not recent:
+            return {}
+        return {q: recent[min(len(recent) - 1, int(math.ceil(q * len(recent))) - 1)] for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        lines = []
+        quantile_lines = []
+        with self._lock:
+            items = sorted(
+                (key, list(series["counts"]), series["sum"], series["count"], sorted(series["recent"]))
+                for key, series in self._series.items()
+            )
+        for key, counts, total, count, recent in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+            for q, value in self._quantiles(recent).items():
+                quantile_labels = _format_labels(self.labelnames, key, {"quantile": str(q)})
+                quantile_lines.append(f"{self.name}_quantile{quantile_labels} {_format_value(value)}")
+
+        if quantile_lines:
+            lines += [
+                f"# HELP {self.name}_quantile {self.help} (quantiles over the last {self.window_size} observations)",
+                f"# TYPE {self.name}_quantile gauge",
+            ] + quantile_lines
+        return lines
+
+
+class Registry:
+    """
+    A set of metrics plus collectors that turn existing stats dictionaries into gauges at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, **kwargs))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]):
+        """
+        Register a callable yielding (name, kind, help, labels, value) samples at scrape time.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+
+        families: Dict[str, Dict[str, Any]] = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                family = families.setdefault(name, {"kind": kind, "help": help_text, "samples": []})
+                family["samples"].append(
+                    f"{name}{_format_labels(list(labels.keys()), list(labels.values()))} {_format_value(float(value))}"
+                )
+        for name, family in families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(family["samples"])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.histogram(
+    "analysis_stage_duration_seconds",
+    "Time spent in each stage of an image analysis",
+    ["stage"],
+)
+request_duration = registry.histogram(
+    "analysis_request_duration_seconds",
+    "End-to-end time of an image analysis",
+    ["operation"],
+)
+analysis_errors = registry.counter(
+    "analysis_errors_total",
+    "Image analyses that failed, by HTTP status code",
+    ["operation", "status_code"],
+)
+near_duplicate_reuses = registry.counter(
+    "near_duplicate_reuses_total",
+    "Ad insights served from a perceptually similar image, by Hamming distance",
+    ["distance"],
+)
+gemini_tokens = registry.counter(
+    "gemini_tokens_total",
+    "Gemini tokens reported in response usage metadata",
+    ["type"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """
+    Time a pipeline stage into analysis_stage_duration_seconds and a Sentry span.
+
+    Args:
+        stage (str): Stage name, e.g. "download", "preprocess", "gemini", "parse"
+    """
+    start = time.perf_counter()
+    with start_span(op=f"analysis.{stage}"):
+        try:
+            yield
+        finally:
+            stage_duration.observe(time.perf_counter() - start, stage=stage)
+
+
+@contextmanager
+def observe_request(operation: str):
+    """
+    Time a whole analysis into analysis_request_duration_seconds and count its failures.
+
+    Args:
+        operation (str): Operation name, e.g. "analyze" or "get_ad_insights"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        analysis_errors.inc(operation=operation, status_code=getattr(e, "status_code", 500))
+        raise
+    finally:
+        request_duration.observe(time.perf_counter() - start, operation=operation)
+
+
+def record_token_usage(usage: Any):
+    """
+    Add a Gemini response's usage metadata to gemini_tokens_total.
+
+    Args:
+        usage: response.usage_metadata, may be None
+    """
+    if usage is None:
+        return
+    for token_type, attribute in (
+        ("prompt", "prompt_token_count"),
+        ("output", "candidates_token_count"),
+        ("cached", "cached_content_token_count"),
+        ("total", "total_token_count"),
+    ):
+        count = getattr(usage, attribute, None)
+        if count:
+            gemini_tokens.inc(count, type=token_type)
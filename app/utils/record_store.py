@@ -0,0 +1,272 @@
+import operator
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+_MISSING = object()
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class RecordStore:
+    """
+    A thread-safe in-memory table with a monotonic ID counter and hash indexes.
+
+    Records are stored as instances of a __slots__ class generated from the
+    declared fields, which takes far less memory than one dict per record.
+    Keys outside the declared fields are kept in a per-record overflow dict.
+
+    Filter queries on indexed fields are answered by intersecting the
+    matching ID sets, smallest first; any remaining filters are checked only
+    against those candidates. Queries with no indexed field fall back to a
+    scan.
+
+    IDs are never reused: deleting the newest record does not hand its ID
+    out again, unlike max(keys) + 1.
+
+    Args:
+        fields (Sequence[str]): Field names stored in the compact record layout
+        indexes (Sequence[str]): Fields to keep a hash index on, a subset of fields
+        name (str): Name of the generated record class, for debugging
+    """
+
+    def __init__(self, fields: Sequence[str], indexes: Sequence[str] = (), name: str = "Record"):
+        unknown = [field for field in indexes if field not in fields]
+        if unknown:
+            raise ValueError(f"Indexed fields must be declared fields: {', '.join(unknown)}")
+
+        self.fields = tuple(fields)
+        self.indexed_fields = tuple(indexes)
+        self._record_class = type(name, (), {"__slots__": self.fields + ("_extra",)})
+        self._field_set = frozenset(self.fields)
+        # Reads every declared field in one C-level call
+        getter = operator.attrgetter(*self.fields)
+        self._get_values = getter if len(self.fields) > 1 else (lambda record: (getter(record),))
+        self._records: Dict[int, Any] = {}
+        self._indexes: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in self.indexed_fields}
+        self._next_id = 1
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._records
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            return iter(list(self._records))
+
+    def next_id(self) -> int:
+        """
+        Get the ID the next insert without an explicit ID will receive. O(1).
+
+        Returns:
+            int: Next available ID
+        """
+        return self._next_id
+
+    def _to_record(self, data: Dict[str, Any]):
+        record = self._record_class()
+        extra = None
+        for field in self.fields:
+            setattr(record, field, data.get(field, _MISSING))
+        for key, value in data.items():
+            if key not in self._field_set:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        record._extra = extra
+        return record
+
+    def _to_dict(self, record) -> Dict[str, Any]:
+        data = {field: value for field, value in zip(self.fields, self._get_values(record)) if value is not _MISSING}
+        if record._extra:
+            data.update(record._extra)
+        return data
+
+    def _index(self, record_id: int, record):
+        for field in self.indexed_fields:
+            value = getattr(record, field)
+            # Unhashable values cannot equal a hashable filter value, so they
+            # are left out of the index; filters on them fall back to a scan
+            if value is not _MISSING and _hashable(value):
+                self._indexes[field].setdefault(value, set()).add(record_id)
+
+    def _unindex(self, record_id: int, record):
+        for field in self.indexed_fields:
+            value = getattr(record, field)
+            if value is _MISSING or not _hashable(value):
+                continue
+            ids = self._indexes[field].get(value)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._indexes[field][value]
+
+    def insert(self, data: Dict[str, Any], record_id: Optional[int] = None) -> int:
+        """
+        Add a record.
+
+        Args:
+            data (Dict[str, Any]): Field values
+            record_id (Optional[int]): Explicit ID, e.g. when loading existing data
+
+        Returns:
+            int: ID of the new record
+        """
+        with self._lock:
+            if record_id is None:
+                record_id = self._next_id
+            elif record_id in self._records:
+                raise KeyError(f"Record {record_id} already exists")
+            record = self._to_record(data)
+            self._records[record_id] = record
+            self._index(record_id, record)
+            if record_id >= self._next_id:
+                self._next_id = record_id + 1
+            return record_id
+
+    def insert_many(self, items: Iterable[Dict[str, Any]]) -> List[int]:
+        """
+        Add several records under one lock acquisition.
+
+        Returns:
+            List[int]: IDs of the new records, in order
+        """
+        with self._lock:
+            return [self.insert(data) for data in items]
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a record as a dict.
+
+        Returns:
+            Optional[Dict[str, Any]]: The record, or None if it does not exist
+        """
+        with self._lock:
+            record = self._records.get(record_id)
+            return self._to_dict(record) if record is not None else None
+
+    def update(self, record_id: int, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merge changes into a record, keeping indexes in step.
+
+        Returns:
+            Dict[str, Any]: The updated record
+
+        Raises:
+            KeyError: If the record does not exist
+        """
+        with self._lock:
+            record = self._records.get(record_id)
+            if record is None:
+                raise KeyError(f"Record {record_id} does not exist")
+            data = self._to_dict(record)
+            data.update(changes)
+            self._unindex(record_id, record)
+            record = self._to_record(data)
+            self._records[record_id] = record
+            self._index(record_id, record)
+            return data
+
+    def delete(self, record_id: int) -> bool:
+        """
+        Remove a record.
+
+        Returns:
+            bool: Whether the record existed
+        """
+        with self._lock:
+            record = self._records.pop(record_id, None)
+            if record is None:
+                return False
+            self._unindex(record_id, record)
+            return True
+
+    def _matcher(self, filters: Dict[str, Any]):
+        """Build a predicate for filters, resolving declared fields to attribute getters once per query."""
+        checks = [
+            (operator.attrgetter(field) if field in self._field_set else None, field, expected)
+            for field, expected in filters.items()
+        ]
+
+        def matches(record) -> bool:
+            for getter, field, expected in checks:
+                if getter is not None:
+                    value = getter(record)
+                else:
+                    value = record._extra.get(field, _MISSING) if record._extra else _MISSING
+                if value is _MISSING or value != expected:
+                    return False
+            return True
+
+        return matches
+
+    def filter(self, filters: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Find records whose fields equal every filter value.
+
+        Args:
+            filters (Optional[Dict[str, Any]]): Field to required value; empty or None returns everything
+            limit (Optional[int]): Maximum number of records to return
+
+        Returns:
+            Dict[int, Dict[str, Any]]: Matching records by ID. Indexed queries return
+            them in ID order, scans in insertion order.
+        """
+        filters = filters or {}
+        with self._lock:
+            candidate_sets = []
+            remaining = {}
+            for field, value in filters.items():
+                if field in self._indexes and _hashable(value):
+                    candidate_sets.append(self._indexes[field].get(value, set()))
+                else:
+                    remaining[field] = value
+
+            if candidate_sets:
+                candidate_sets.sort(key=len)
+                candidates = set(candidate_sets[0])
+                for ids in candidate_sets[1:]:
+                    if not candidates:
+                        break
+                    candidates &= ids
+                records = ((record_id, self._records[record_id]) for record_id in sorted(candidates))
+            else:
+                records = iter(self._records.items())
+
+            matches = self._matcher(remaining) if remaining else None
+            result = {}
+            for record_id, record in records:
+                if matches is not None and not matches(record):
+                    continue
+                result[record_id] = self._to_dict(record)
+                if limit is not None and len(result) >= limit:
+                    break
+            return result
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Number of records matching filters, without materializing them when only indexed fields are used."""
+        filters = filters or {}
+        with self._lock:
+            if not filters:
+                return len(self._records)
+            if all(field in self._indexes and _hashable(value) for field, value in filters.items()):
+                candidate_sets = sorted((self._indexes[field].get(value, set()) for field, value in filters.items()), key=len)
+                return len(set(candidate_sets[0]).intersection(*candidate_sets[1:]))
+            return len(self.filter(filters))
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the record count and the number of distinct values per index."""
+        with self._lock:
+            return {
+                "records": len(self._records),
+                "next_id": self._next_id,
+                "indexes": {field: len(index) for field, index in self._indexes.items()},
+            }
@@ -0,0 +1,69 @@
+import os
+import logging
+from contextlib import nullcontext
+from typing import Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+SENTRY_DSN = os.environ.get("SENTRY_DSN")
+SENTRY_ENVIRONMENT = os.environ.get("SENTRY_ENVIRONMENT")
+# Fraction of requests recorded as performance transactions
+SENTRY_TRACES_SAMPLE_RATE = float(os.environ.get("SENTRY_TRACES_SAMPLE_RATE", "0.05"))
+
+# sentry_sdk is only imported once Sentry is initialized, keeping it off the
+# cold-start import path
+_sentry = None
+
+
+def init_sentry():
+    """
+    Initialize Sentry if SENTRY_DSN is set. Called from the FastAPI lifespan.
+
+    Requests are sampled into performance transactions at
+    SENTRY_TRACES_SAMPLE_RATE; analysis stages show up as spans within them.
+    """
+    global _sentry
+
+    if _sentry is not None or not SENTRY_DSN:
+        return
+    import sentry_sdk
+
+    sentry_sdk.init(
+        dsn=SENTRY_DSN,
+        environment=SENTRY_ENVIRONMENT,
+        traces_sample_rate=SENTRY_TRACES_SAMPLE_RATE,
+    )
+    _sentry = sentry_sdk
+    logger.info(f"Initialized Sentry with traces sample rate {SENTRY_TRACES_SAMPLE_RATE}")
+
+
+def start_span(op: str, description: Optional[str] = None):
+    """
+    Start a Sentry span under the current transaction, if Sentry is initialized.
+
+    Args:
+        op: Span operation, e.g. "analysis.download"
+        description: Optional span description
+
+    Returns:
+        A context manager; a no-op one when Sentry is not initialized
+    """
+    if _sentry is None:
+        return nullcontext()
+    return _sentry.start_span(op=op, description=description)
+
+
+def capture_exception(error: BaseException):
+    """
+    Report an exception to Sentry, if it is initialized.
+
+    Args:
+        error: Exception to report
+    """
+    if _sentry is not None:
+        _sentry.capture_exception(error)
+
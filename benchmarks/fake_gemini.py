@@ -0,0 +1,365 @@
+"""
+A local stand-in for the Gemini generateContent REST API.
+
+Responses follow the shape google-genai parses, with configurable latency and
+injected errors, so the app can be load-tested offline by pointing
+GEMINI_BASE_URL at this server.
+
+It also implements countTokens and the cachedContents create/update/delete
+calls, rejects cached contents below cache_min_tokens like the real API, and
+counts how often each cached prompt prefix is referenced, so prompt caching
+can be checked offline.
+
+Usage:
+    python -m benchmarks.fake_gemini --port 8701 --latency-ms 800 --jitter-ms 200 --error-rate 0.02
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from aiohttp import web
+
+# A response that validates against app.models.AdInsights
+CANNED_INSIGHTS = {
+    "Product Name": "Acme Running Shoes",
+    "Position of product": "center",
+    "Position of logo": "top-left",
+    "Image Entities": ["shoe", "runner", "track"],
+    "Image Text Entities": ["RUN FASTER", "Shop now"],
+    "Offer in Adv": "Price slashed from $120 to $90",
+    "Performance Claim": "Lightest shoe we have ever made",
+    "Contrast in Adv": "High",
+    "Gender": "Unisex",
+    "Headline Size": "Large",
+    "Subheadline Size": "Medium",
+    "CTA Button": "Shop now",
+    "Engagement Prediction": "Likely",
+    "Brand Keywords": ["running", "lightweight", "performance"],
+    "Overall Sentiment": "exciting",
+    "Key Message": "Run faster in the lightest Acme shoe.",
+    "Recommendation": "Show the discounted price next to the CTA button.",
+}
+
+
+def canned_comparison(count: int) -> dict:
+    """A response that validates against app.models.VariantComparison for count images."""
+    return {
+        "Strongest Variant": 1,
+        "Ranking": list(range(1, count + 1)),
+        "Consistent Elements": ["logo top-left", "Shop now CTA"],
+        "Key Differences": ["background colour", "headline wording"],
+        "Recommendation": "Lead the carousel with the discounted price.",
+    }
+
+
+_ERROR_STATUS = {
+    400: "INVALID_ARGUMENT",
+    403: "PERMISSION_DENIED",
+    404: "NOT_FOUND",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+class FakeGemini:
+    """
+    Request handlers and counters for the fake Gemini API.
+
+    Args:
+        latency_ms (float): Mean response latency
+        jitter_ms (float): Standard deviation of the latency
+        slow_rate (float): Fraction of requests that take slow_ms instead, to model a latency tail
+        slow_ms (float): Latency of the slow requests
+        error_rate (float): Fraction of requests answered with an injected error
+        error_codes (list): HTTP status codes to pick injected errors from
+        stream_chunks (int): Number of SSE chunks a streamed response is split into
+        cache_min_tokens (int): Smallest cached content accepted; the real API's minimum is 4096 tokens for most models
+        seed (int): Random seed, so runs with the same settings inject the same errors
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        jitter_ms: float = 200.0,
+        slow_rate: float = 0.0,
+        slow_ms: float = 10000.0,
+        error_rate: float = 0.0,
+        error_codes=(429, 503),
+        stream_chunks: int = 8,
+        cache_min_tokens: int = 4096,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.stream_chunks = max(1, stream_chunks)
+        self.cache_min_tokens = cache_min_tokens
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.slow = 0
+        # Cached content name -> {"display_name", "tokens", "expires_at", "reuses"}
+        self.cached_contents = {}
+        self.cache_creates = 0
+        self.cache_updates = 0
+        self.cache_rejected = 0
+        self.cache_reuses = 0
+        self.token_counts = 0
+        self.inline_prompts = 0
+
+    async def _delay(self):
+        if self.slow_rate > 0 and self._random.random() < self.slow_rate:
+            self.slow += 1
+            await asyncio.sleep(self.slow_ms / 1000)
+            return
+        latency = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+
+    @staticmethod
+    def _error(code: int, message: str) -> web.Response:
+        return web.json_response(
+            {"error": {"code": code, "message": message, "status": _ERROR_STATUS.get(code, "UNKNOWN")}},
+            status=code,
+        )
+
+    def _injected_error(self):
+        if self.error_rate <= 0 or self._random.random() >= self.error_rate:
+            return None
+        self.errors += 1
+        return self._error(self._random.choice(self.error_codes), "Injected by fake_gemini")
+
+    @staticmethod
+    def _usage(body: bytes, text: str, cached_tokens: int = 0):
+        # Roughly four characters per token; an inline image counts as 258 tokens like the real API
+        prompt_tokens = 258 + len(body) // 4000 + cached_tokens
+        output_tokens = max(1, len(text) // 4)
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return usage
+
+    def _live_cache(self, name: str):
+        cached = self.cached_contents.get(name)
+        if cached is None or cached["expires_at"] <= time.time():
+            return None
+        return cached
+
+    @staticmethod
+    def _ttl_seconds(body: dict) -> float:
+        return float(str(body.get("ttl") or "3600s").rstrip("s"))
+
+    @staticmethod
+    def _cached_content(name: str, cached: dict) -> dict:
+        expire_time = datetime.fromtimestamp(cached["expires_at"], timezone.utc)
+        return {
+            "name": name,
+            "displayName": cached["display_name"],
+            "model": cached["model"],
+            "expireTime": expire_time.isoformat().replace("+00:00", "Z"),
+            "usageMetadata": {"totalTokenCount": cached["tokens"]},
+        }
+
+    @staticmethod
+    def _text_tokens(body: dict) -> int:
+        # Roughly four characters per token, counted the same way for countTokens and cachedContents
+        text = "".join(
+            part.get("text", "")
+            for content in body.get("contents") or []
+            for part in content.get("parts") or []
+        )
+        return max(1, len(text) // 4)
+
+    async def count_tokens(self, body: dict) -> web.Response:
+        self.token_counts += 1
+        images = self._image_count(body)
+        return web.json_response({"totalTokens": self._text_tokens(body) + 258 * images})
+
+    async def create_cache(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        tokens = self._text_tokens(body)
+        if tokens < self.cache_min_tokens:
+            self.cache_rejected += 1
+            return self._error(
+                400,
+                f"Cached content is too small. total_token_count={tokens}, min_total_token_count={self.cache_min_tokens}",
+            )
+        self.cache_creates += 1
+        name = f"cachedContents/fake-{self.cache_creates}"
+        self.cached_contents[name] = {
+            "display_name": body.get("displayName", ""),
+            "model": body.get("model", ""),
+            "tokens": tokens,
+            "expires_at": time.time() + self._ttl_seconds(body),
+            "reuses": 0,
+        }
+        return web.json_response(self._cached_content(name, self.cached_contents[name]))
+
+    async def update_cache(self, request: web.Request) -> web.Response:
+        name = f"cachedContents/{request.match_info['cache_id']}"
+        cached = self._live_cache(name)
+        if cached is None:
+            return self._error(404, f"CachedContent not found: {name}")
+        self.cache_updates += 1
+        cached["expires_at"] = time.time() + self._ttl_seconds(await request.json())
+        return web.json_response(self._cached_content(name, cached))
+
+    async def delete_cache(self, request: web.Request) -> web.Response:
+        name = f"cachedContents/{request.match_info['cache_id']}"
+        if self.cached_contents.pop(name, None) is None:
+            return self._error(404, f"CachedContent not found: {name}")
+        return web.json_response({})
+
+    @staticmethod
+    def _image_count(request: dict) -> int:
+        return sum(
+            1
+            for content in request.get("contents") or []
+            for part in content.get("parts") or []
+            if "inlineData" in part
+        )
+
+    @classmethod
+    def _response_text(cls, request: dict) -> str:
+        config = request.get("generationConfig") or {}
+        if config.get("responseMimeType") == "application/json":
+            properties = (config.get("responseSchema") or {}).get("properties") or {}
+            if "Images" in properties:
+                # A packed carousel request: one entry per inline image plus a comparison
+                count = cls._image_count(request)
+                return json.dumps({"Images": [CANNED_INSIGHTS] * count, "Comparison": canned_comparison(count)})
+            return json.dumps(CANNED_INSIGHTS)
+        # Free-form prompts get the fenced JSON a real model tends to return
+        return "```json\n" + json.dumps(CANNED_INSIGHTS, indent=2) + "\n```"
+
+    @staticmethod
+    def _candidate(text: str, finished: bool = True):
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finished:
+            candidate["finishReason"] = "STOP"
+        return candidate
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        model, _, method = request.match_info["model_method"].partition(":")
+        if method == "countTokens":
+            return await self.count_tokens(await request.json())
+        if method not in ("generateContent", "streamGenerateContent"):
+            raise web.HTTPNotFound()
+
+        body = await request.read()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self._delay()
+            error = self._injected_error()
+            if error is not None:
+                return error
+
+            payload = json.loads(body or b"{}")
+            cached_tokens = 0
+            if payload.get("cachedContent"):
+                cached = self._live_cache(payload["cachedContent"])
+                if cached is None:
+                    return self._error(403, "CachedContent not found (or permission denied)")
+                cached["reuses"] += 1
+                self.cache_reuses += 1
+                cached_tokens = cached["tokens"]
+            else:
+                self.inline_prompts += 1
+
+            text = self._response_text(payload)
+            usage = self._usage(body, text, cached_tokens)
+            if method == "generateContent":
+                return web.json_response({
+                    "candidates": [self._candidate(text)],
+                    "usageMetadata": usage,
+                    "modelVersion": model,
+                })
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            size = -(-len(text) // self.stream_chunks)
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            for index, piece in enumerate(pieces):
+                last = index == len(pieces) - 1
+                chunk = {"candidates": [self._candidate(piece, finished=last)], "modelVersion": model}
+                if last:
+                    chunk["usageMetadata"] = usage
+                await response.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "slow": self.slow,
+            "inline_prompts": self.inline_prompts,
+            "cache_creates": self.cache_creates,
+            "cache_updates": self.cache_updates,
+            "cache_rejected": self.cache_rejected,
+            "token_counts": self.token_counts,
+            "cache_reuses": self.cache_reuses,
+            "cached_contents": {
+                name: {"display_name": cached["display_name"], "tokens": cached["tokens"], "reuses": cached["reuses"]}
+                for name, cached in self.cached_contents.items()
+            },
+        })
+
+
+def create_app(fake: FakeGemini) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/{api_version}/models/{model_method}", fake.handle)
+    app.router.add_post("/{api_version}/cachedContents", fake.create_cache)
+    app.router.add_patch("/{api_version}/cachedContents/{cache_id}", fake.update_cache)
+    app.router.add_delete("/{api_version}/cachedContents/{cache_id}", fake.delete_cache)
+    app.router.add_get("/stats", fake.stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8701)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="Standard deviation of the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests answered after --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=10000.0, help="Latency of the slow requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-codes", default="429,503", help="Comma-separated status codes for injected errors")
+    parser.add_argument("--cache-min-tokens", type=int, default=4096, help="Reject smaller cached contents, as the real API does")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeGemini(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",") if code],
+        cache_min_tokens=args.cache_min_tokens,
+        seed=args.seed,
+    )
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}/")
+    web.run_app(create_app(fake), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
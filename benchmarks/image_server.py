@@ -0,0 +1,100 @@
+"""
+Serve a fixed, generated corpus of ad creatives over local HTTP.
+
+The corpus is rendered with PIL from a seed, so every run downloads the
+same bytes without network access.
+
+Usage:
+    python -m benchmarks.image_server --port 8702 --count 24
+"""
+import os
+import random
+import argparse
+import tempfile
+from typing import List
+from aiohttp import web
+
+# Common ad placements (width, height) and the format they are usually delivered in
+CREATIVE_SIZES = [
+    (1080, 1080, "JPEG"),
+    (1200, 628, "JPEG"),
+    (1080, 1920, "JPEG"),
+    (300, 250, "PNG"),
+    (728, 90, "PNG"),
+    (2400, 2400, "JPEG"),
+]
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "adzcrypt", "benchmark_corpus")
+
+
+def build_corpus(directory: str = DEFAULT_CORPUS_DIR, count: int = 24, seed: int = 0) -> List[str]:
+    """
+    Render the creative corpus into a directory, reusing files from an earlier run.
+
+    Args:
+        directory (str): Where to write the images
+        count (int): Number of creatives
+        seed (int): Random seed for the layouts
+
+    Returns:
+        List[str]: File names of the creatives, in a stable order
+    """
+    from PIL import Image, ImageDraw
+
+    directory = os.path.join(directory, f"seed{seed}")
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for index in range(count):
+        width, height, image_format = CREATIVE_SIZES[index % len(CREATIVE_SIZES)]
+        extension = "jpg" if image_format == "JPEG" else "png"
+        name = f"creative_{index:03d}_{width}x{height}.{extension}"
+        names.append(name)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            continue
+
+        rng = random.Random(seed * 100003 + index)
+        image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        # Product block, logo, headline bars and a CTA button
+        for _ in range(rng.randint(6, 14)):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            x1 = min(width, x0 + rng.randint(width // 20, width // 2))
+            y1 = min(height, y0 + rng.randint(height // 20, height // 2))
+            color = tuple(rng.randrange(256) for _ in range(3))
+            if rng.random() < 0.5:
+                draw.ellipse((x0, y0, x1, y1), fill=color)
+            else:
+                draw.rectangle((x0, y0, x1, y1), fill=color)
+        draw.text((width // 20, height // 20), f"SALE {rng.randint(10, 70)}% OFF", fill=(255, 255, 255))
+        draw.rectangle((width // 3, height * 4 // 5, width * 2 // 3, height * 9 // 10), fill=(230, 40, 40))
+        draw.text((width // 3 + 8, height * 4 // 5 + 4), "Shop now", fill=(255, 255, 255))
+
+        save_options = {"quality": 90} if image_format == "JPEG" else {}
+        image.save(path, image_format, **save_options)
+    return names
+
+
+def create_app(directory: str) -> web.Application:
+    app = web.Application()
+    app.router.add_static("/", directory)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8702)
+    parser.add_argument("--count", type=int, default=24, help="Number of creatives in the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=DEFAULT_CORPUS_DIR)
+    args = parser.parse_args()
+
+    names = build_corpus(args.directory, args.count, args.seed)
+    directory = os.path.join(args.directory, f"seed{args.seed}")
+    print(f"Serving {len(names)} creatives from {directory} on http://{args.host}:{args.port}/")
+    web.run_app(create_app(directory), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
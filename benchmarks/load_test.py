@@ -0,0 +1,464 @@
+"""
+Load-test the analysis endpoints offline and write a JSON report.
+
+Starts the fake Gemini API and the creative image server in-process, runs
+the app under uvicorn pointed at them, then drives /api/gemini/analyze and
+/api/gemini/get_ad_insights at each concurrency level. The report has
+throughput, latency percentiles, the server's memory high-water mark and a
+per-stage breakdown taken from /metrics, so runs can be compared across
+commits.
+
+App settings (GEMINI_MAX_RPS, GEMINI_CONCURRENCY_*, IMAGE_*, ...) are read
+from the environment as usual.
+
+Usage:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --concurrency 1,8,32 --requests 200 --latency-ms 800 --error-rate 0.02
+    python -m benchmarks.load_test --endpoints get_ad_insights --use-cache --output bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+import aiohttp
+from aiohttp import web
+from benchmarks.fake_gemini import FakeGemini, create_app as create_gemini_app
+from benchmarks.image_server import DEFAULT_CORPUS_DIR, build_corpus, create_app as create_image_app
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    "analyze": "/api/gemini/analyze",
+    "get_ad_insights": "/api/gemini/get_ad_insights",
+}
+
+ANALYZE_PROMPT = "Analyze this advertisement image and return its marketing elements as a JSON object."
+
+# Settings copied into the report so runs are comparable
+_REPORTED_ENV_PREFIXES = ("GEMINI_", "HTTP_", "IMAGE_", "RESULT_CACHE_", "BATCH_")
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.999999) - 1))]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=10
+        )
+        return completed.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _memory_high_water_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a process, from /proc on Linux or psutil elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        # psutil has no peak RSS on every platform; the current RSS is the best available
+        info = psutil.Process(pid).memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except psutil.Error:
+        return None
+
+
+class LocalServices:
+    """
+    Run the fake Gemini API and the image server on a background event loop.
+    """
+
+    def __init__(self, fake: FakeGemini, corpus_dir: str):
+        self.fake = fake
+        self.corpus_dir = corpus_dir
+        self.gemini_url = None
+        self.image_url = None
+        self._loop = asyncio.new_event_loop()
+        self._runners = []
+        self._thread = threading.Thread(target=self._loop.run_forever, name="benchmark-services", daemon=True)
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        port = _free_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        self._runners.append(runner)
+        return f"http://127.0.0.1:{port}"
+
+    def start(self):
+        self._thread.start()
+        self.gemini_url = asyncio.run_coroutine_threadsafe(
+            self._serve(create_gemini_app(self.fake)), self._loop
+        ).result()
+        self.image_url = asyncio.run_coroutine_threadsafe(
+            self._serve(create_image_app(self.corpus_dir)), self._loop
+        ).result()
+
+    def stop(self):
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class AppServer:
+    """
+    Run the FastAPI app under uvicorn in a child process.
+    """
+
+    def __init__(self, env: Dict[str, str], log_path: str):
+        self.env = env
+        self.log_path = log_path
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def start(self, timeout: float = 60.0):
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning", "--no-access-log"],
+            cwd=PROJECT_ROOT,
+            env=self.env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"App server exited with status {self.process.returncode}, see {self.log_path}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise SystemExit("App server did not start in time")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process is not None:
+            self._log.close()
+
+
+def parse_metrics(text: str) -> Dict[str, List[Any]]:
+    """
+    Parse Prometheus text into {name: [(labels, value), ...]}.
+    """
+    metrics: Dict[str, List[Any]] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        labels = dict(_LABEL.findall(match.group(2) or ""))
+        metrics.setdefault(match.group(1), []).append((labels, float(match.group(3))))
+    return metrics
+
+
+def _histogram(metrics: Dict[str, List[Any]], name: str, label: str) -> Dict[str, Dict[str, Any]]:
+    """Collect {label value: {"buckets": {le: count}, "sum": s, "count": c}} for one histogram."""
+    series: Dict[str, Dict[str, Any]] = {}
+    for labels, value in metrics.get(f"{name}_bucket", []):
+        entry = series.setdefault(labels.get(label, ""), {"buckets": {}, "sum": 0.0, "count": 0.0})
+        entry["buckets"][float(labels["le"])] = value
+    for suffix in ("sum", "count"):
+        for labels, value in metrics.get(f"{name}_{suffix}", []):
+            series.setdefault(labels.get(label, ""), {"buckets": {}, "sum": 0.0, "count": 0.0})[suffix] = value
+    return series
+
+
+def _bucket_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Estimate a quantile from cumulative bucket counts, like PromQL's histogram_quantile."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] <= 0:
+        return None
+    rank = q * buckets[bounds[-1]]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_breakdown(before: Dict[str, List[Any]], after: Dict[str, List[Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-stage latency for the requests between two /metrics scrapes.
+    """
+    start = _histogram(before, "analysis_stage_duration_seconds", "stage")
+    end = _histogram(after, "analysis_stage_duration_seconds", "stage")
+    stages = {}
+    for stage, series in sorted(end.items()):
+        base = start.get(stage, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = series["count"] - base["count"]
+        if count <= 0:
+            continue
+        buckets = {bound: value - base["buckets"].get(bound, 0.0) for bound, value in series["buckets"].items()}
+        p50, p99 = _bucket_quantile(buckets, 0.5), _bucket_quantile(buckets, 0.99)
+        stages[stage] = {
+            "count": int(count),
+            "mean_ms": round((series["sum"] - base["sum"]) / count * 1000, 2),
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+        }
+    return stages
+
+
+def _counter_delta(before: Dict[str, List[Any]], after: Dict[str, List[Any]], name: str) -> Dict[str, float]:
+    def totals(metrics):
+        result = {}
+        for labels, value in metrics.get(name, []):
+            key = ",".join(f"{k}={v}" for k, v in sorted(labels.items())) or "total"
+            result[key] = value
+        return result
+
+    start, end = totals(before), totals(after)
+    return {key: end[key] - start.get(key, 0.0) for key in end if end[key] - start.get(key, 0.0)}
+
+
+async def _scrape(session: aiohttp.ClientSession, base_url: str) -> Dict[str, List[Any]]:
+    async with session.get(f"{base_url}/metrics") as response:
+        return parse_metrics(await response.text())
+
+
+async def run_level(
+    session: aiohttp.ClientSession,
+    app_url: str,
+    endpoint: str,
+    image_urls: List[str],
+    concurrency: int,
+    requests: int,
+    use_cache: bool,
+    unique_urls: bool,
+    sequence: int,
+) -> Dict[str, Any]:
+    """
+    Send a fixed number of requests to one endpoint from concurrency workers.
+    """
+    latencies: List[float] = []
+    status_codes: Dict[str, int] = {}
+    next_index = 0
+
+    def payload(index: int) -> Dict[str, Any]:
+        image_url = image_urls[index % len(image_urls)]
+        if unique_urls:
+            # A distinct URL per request defeats URL coalescing; the bytes stay the same
+            image_url = f"{image_url}?run={sequence}&request={index}"
+        if endpoint == "analyze":
+            return {"image_url": image_url, "prompt": ANALYZE_PROMPT, "use_cache": use_cache}
+        return {"image_url": image_url, "brand_id": 1, "use_cache": use_cache}
+
+    async def worker():
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{app_url}{ENDPOINTS[endpoint]}", json=payload(index)) as response:
+                    await response.read()
+                    code = str(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            status_codes[code] = status_codes.get(code, 0) + 1
+
+    before = await _scrape(session, app_url)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    after = await _scrape(session, app_url)
+
+    succeeded = status_codes.get("200", 0)
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "succeeded": succeeded,
+        "failed": requests - succeeded,
+        "status_codes": status_codes,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(succeeded / duration, 2) if duration else None,
+        "latency_ms": {
+            "mean": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else None,
+            "p50": round(_percentile(latencies_ms, 0.5), 2) if latencies_ms else None,
+            "p95": round(_percentile(latencies_ms, 0.95), 2) if latencies_ms else None,
+            "p99": round(_percentile(latencies_ms, 0.99), 2) if latencies_ms else None,
+            "max": round(max(latencies_ms), 2) if latencies_ms else None,
+        },
+        "stages": stage_breakdown(before, after),
+        "gemini_tokens": _counter_delta(before, after, "gemini_tokens_total"),
+        "gemini_retries": _counter_delta(before, after, "gemini_retries_total").get("total", 0.0),
+        "result_cache_hits": _counter_delta(before, after, "result_cache_hits_total").get("total", 0.0),
+    }
+
+
+async def drive(args, app: AppServer, image_urls: List[str]) -> List[Dict[str, Any]]:
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    results = []
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        sequence = 0
+        if args.warmup:
+            await run_level(session, app.url, args.endpoints[0], image_urls, 1, args.warmup, False, True, sequence)
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                sequence += 1
+                result = await run_level(
+                    session, app.url, endpoint, image_urls, concurrency, args.requests,
+                    args.use_cache, not args.repeat_urls, sequence,
+                )
+                result["memory_high_water_mb"] = _memory_high_water_mb(app.process.pid)
+                results.append(result)
+                print(
+                    f"{endpoint:>16} c={concurrency:<4} {result['throughput_rps']} req/s  "
+                    f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms  "
+                    f"failed={result['failed']}  rss_hwm={result['memory_high_water_mb']}MB"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="analyze,get_ad_insights", help="Comma-separated: analyze, get_ad_insights")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--use-cache", action="store_true", help="Let the app serve results from its result cache")
+    parser.add_argument("--repeat-urls", action="store_true", help="Reuse corpus URLs so identical in-flight requests coalesce")
+    parser.add_argument("--corpus-size", type=int, default=24, help="Number of creatives served")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Fake Gemini mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="Fake Gemini latency standard deviation")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of fake Gemini calls answered after --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=10000.0, help="Fake Gemini latency of the slow calls")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake Gemini calls that fail")
+    parser.add_argument("--error-codes", default="429,503", help="Status codes for injected errors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+    unknown = [endpoint for endpoint in args.endpoints if endpoint not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+
+    names = build_corpus(args.corpus_dir, args.corpus_size, args.seed)
+    fake = FakeGemini(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",") if code],
+        seed=args.seed,
+    )
+    services = LocalServices(fake, os.path.join(args.corpus_dir, f"seed{args.seed}"))
+    services.start()
+
+    work_dir = tempfile.mkdtemp(prefix="adzcrypt-bench-")
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env.update({
+        "GEMINI_BASE_URL": services.gemini_url,
+        "RESULT_CACHE_DIR": os.path.join(work_dir, "results"),
+        "JOB_BACKEND": "sqlite",
+        "JOB_DB_PATH": os.path.join(work_dir, "jobs.db"),
+        "SENTRY_DSN": "",
+        "NO_PROXY": "127.0.0.1,localhost",
+        "no_proxy": "127.0.0.1,localhost",
+    })
+    app = AppServer(env, os.path.join(work_dir, "server.log"))
+    print(f"App server log: {app.log_path}")
+    app.start()
+    try:
+        image_urls = [f"{services.image_url}/{name}" for name in names]
+        results = asyncio.run(drive(args, app, image_urls))
+        memory = _memory_high_water_mb(app.process.pid)
+    finally:
+        app.stop()
+        services.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "config": {
+            "requests_per_level": args.requests,
+            "use_cache": args.use_cache,
+            "repeat_urls": args.repeat_urls,
+            "corpus_size": args.corpus_size,
+            "fake_gemini": {
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "slow_rate": args.slow_rate,
+                "slow_ms": args.slow_ms,
+                "error_rate": args.error_rate,
+                "error_codes": fake.error_codes,
+            },
+            "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith(_REPORTED_ENV_PREFIXES)
+                    and key != "GEMINI_API_KEY"},
+        },
+        "fake_gemini": {
+            "requests": fake.requests,
+            "injected_errors": fake.errors,
+            "max_in_flight": fake.max_in_flight,
+            "slow": fake.slow,
+        },
+        "server_memory_high_water_mb": memory,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
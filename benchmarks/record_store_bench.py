@@ -0,0 +1,173 @@
+"""
+Compare RecordStore with the dict-scan helpers it replaces.
+
+The baseline is the former get_next_id (max over keys per insert) and
+filter_data (full scan per query) from app/utils.py. For each table size the
+benchmark times next-ID lookups, single- and multi-field filters, updates and
+the memory used per record.
+
+Usage:
+    python -m benchmarks.record_store_bench
+    python -m benchmarks.record_store_bench --sizes 10000,100000,1000000 --output record_store.json
+"""
+import gc
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from typing import Any, Callable, Dict
+from app.utils.record_store import RecordStore
+
+FIELDS = ("brand_id", "status", "channel", "name", "score")
+INDEXES = ("brand_id", "status", "channel")
+STATUSES = ("queued", "running", "succeeded", "failed")
+CHANNELS = ("instagram", "facebook", "youtube", "display", "search", "tiktok")
+
+
+def get_next_id(db_dict):
+    """Baseline: the former app/utils.py helper."""
+    if not db_dict:
+        return 1
+    return max(db_dict.keys()) + 1
+
+
+def filter_data(data_dict, filters):
+    """Baseline: the former app/utils.py helper."""
+    if not filters:
+        return data_dict
+
+    result = {}
+    for key, item in data_dict.items():
+        matches = True
+        for filter_key, filter_value in filters.items():
+            if filter_key not in item or item[filter_key] != filter_value:
+                matches = False
+                break
+        if matches:
+            result[key] = item
+    return result
+
+
+def make_rows(size: int, seed: int):
+    rng = random.Random(seed)
+    brands = max(10, size // 100)
+    return [
+        {
+            "brand_id": rng.randrange(brands),
+            "status": rng.choice(STATUSES),
+            "channel": rng.choice(CHANNELS),
+            "name": f"creative-{index}",
+            "score": rng.random(),
+        }
+        for index in range(size)
+    ]
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    """Median wall time of fn in microseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return round(samples[len(samples) // 2], 2)
+
+
+def _memory(build: Callable[[], Any]):
+    gc.collect()
+    tracemalloc.start()
+    structure = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, current
+
+
+def run(size: int, repeat: int, seed: int) -> Dict[str, Any]:
+    rows = make_rows(size, seed)
+
+    baseline, baseline_bytes = _memory(lambda: {index + 1: dict(row) for index, row in enumerate(rows)})
+    store, store_bytes = _memory(lambda: _build_store(rows))
+    _, unindexed_bytes = _memory(lambda: _build_store(rows, indexes=()))
+
+    rng = random.Random(seed + 1)
+    brand = rows[rng.randrange(size)]["brand_id"]
+    queries = {
+        "single_field": {"brand_id": brand},
+        "two_fields": {"brand_id": brand, "status": "succeeded"},
+        "three_fields": {"status": "failed", "channel": "tiktok", "brand_id": brand},
+        "broad": {"status": "succeeded"},
+        "unindexed": {"name": f"creative-{size // 2}"},
+    }
+
+    result = {
+        "records": size,
+        "memory_bytes_per_record": {
+            "dict": round(baseline_bytes / size, 1),
+            "record_store": round(unindexed_bytes / size, 1),
+            "record_store_with_indexes": round(store_bytes / size, 1),
+        },
+        "next_id_us": {
+            "get_next_id": _time(lambda: get_next_id(baseline), repeat),
+            "record_store": _time(store.next_id, repeat),
+        },
+        "filter_us": {},
+    }
+    for name, filters in queries.items():
+        expected = filter_data(baseline, filters)
+        actual = store.filter(filters)
+        if list(expected) != list(actual):
+            raise AssertionError(f"RecordStore disagrees with filter_data for {filters}")
+        result["filter_us"][name] = {
+            "matches": len(actual),
+            "filter_data": _time(lambda: filter_data(baseline, filters), repeat),
+            "record_store": _time(lambda: store.filter(filters), repeat),
+        }
+
+    record_ids = [rng.randrange(1, size + 1) for _ in range(repeat)]
+    updates = iter(record_ids)
+    result["update_us"] = _time(lambda: store.update(next(updates), {"status": rng.choice(STATUSES)}), repeat)
+    return result
+
+
+def _build_store(rows, indexes=INDEXES):
+    store = RecordStore(FIELDS, indexes, name="Creative")
+    store.insert_many(rows)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated table sizes")
+    parser.add_argument("--repeat", type=int, default=15, help="Timed runs per operation; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        result = run(size, args.repeat, args.seed)
+        results.append(result)
+        print(f"\n{size} records")
+        memory = result["memory_bytes_per_record"]
+        print(
+            f"  memory/record   dict {memory['dict']:>10.1f} B   store {memory['record_store']:>10.1f} B  "
+            f"(+indexes {memory['record_store_with_indexes']:.1f} B)"
+        )
+        next_id = result["next_id_us"]
+        print(f"  next id         scan {next_id['get_next_id']:>10.1f} us  store {next_id['record_store']:>10.2f} us")
+        for name, timings in result["filter_us"].items():
+            print(
+                f"  filter {name:<12} scan {timings['filter_data']:>10.1f} us  "
+                f"store {timings['record_store']:>10.1f} us  ({timings['matches']} matches)"
+            )
+        print(f"  update          store {result['update_us']:>10.1f} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+Analyze a whole library of ad images offline, without going through the HTTP API.
+
+Reads rows with an image_url and optional brand_id from a JSONL or CSV file
+and runs get_ad_details for each through a pool of workers. Results go to a
+JSONL file or to a Firestore collection in batched writes.
+
+Progress is checkpointed as rows finish, so an interrupted run started again
+with the same arguments skips every row that was already written. With
+--output the output file is the checkpoint. With --collection a separate
+checkpoint log records each row once its batch is committed. Rows that
+failed are recorded too and are only retried with --retry-failed. The first
+Ctrl+C (or SIGTERM) stops after the rows in flight; a second one aborts.
+
+Usage:
+    python bulk_analyze.py images.csv --output insights.jsonl --parallelism 16
+    python bulk_analyze.py images.jsonl --collection ad_insights --checkpoint images.checkpoint.jsonl
+"""
+import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import signal
+import logging
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger("bulk_analyze")
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 10.0
+
+
+class CheckpointMismatchError(Exception):
+    """
+    Raised when a checkpointed row no longer matches the input, e.g. because rows were inserted.
+    """
+
+
+def _parse_brand_id(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    return int(value) if value.lstrip("-").isdigit() else None
+
+
+def read_rows(path: str, input_format: Optional[str] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Stream input rows with their 0-based row numbers.
+
+    Args:
+        path (str): JSONL or CSV file with an image_url column and optional brand_id
+        input_format (Optional[str]): "jsonl" or "csv", detected from the extension when None
+
+    Yields:
+        Tuple[int, Dict[str, Any]]: Row number and {"image_url", "brand_id"}, or
+        {"error": str} for a row that cannot be parsed
+    """
+    if input_format is None:
+        input_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if input_format == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (line for line in f if line.strip())
+        for row_number, row in enumerate(rows):
+            if input_format != "csv":
+                try:
+                    row = json.loads(row)
+                except ValueError as e:
+                    yield row_number, {"error": f"Invalid JSON: {str(e)}"}
+                    continue
+            if not isinstance(row, dict) or not row.get("image_url"):
+                yield row_number, {"error": "Row has no image_url"}
+                continue
+            yield row_number, {"image_url": str(row["image_url"]).strip(), "brand_id": _parse_brand_id(row.get("brand_id"))}
+
+
+def read_checkpoint(path: str, retry_failed: bool = False) -> Dict[int, str]:
+    """
+    Load the rows recorded in a checkpoint or output file.
+
+    A torn last line, left by a crash mid-write, is cut off so appending
+    resumes on a clean line.
+
+    Args:
+        path (str): JSONL file of {"row", "image_url", ...} records
+        retry_failed (bool): Leave out rows recorded with an error, so they run again
+
+    Returns:
+        Dict[int, str]: Row number to the image URL it was recorded with
+    """
+    completed: Dict[int, str] = {}
+    if not os.path.exists(path):
+        return completed
+
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if retry_failed and record.get("error") is not None:
+                completed.pop(record["row"], None)
+                continue
+            completed[record["row"]] = record.get("image_url")
+
+    if valid_bytes < os.path.getsize(path):
+        logger.warning(f"Discarding a partly written record at the end of {path}")
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return completed
+
+
+class JsonlSink:
+    """
+    Write one JSON line per row. The output file doubles as the checkpoint.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def completed(self, retry_failed: bool) -> Dict[int, str]:
+        return read_checkpoint(self.path, retry_failed)
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Flushed per row so a crash loses at most the row being written
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FirestoreSink:
+    """
+    Write results to a Firestore collection through a BatchedWriter.
+
+    Documents are keyed by a hash of the image URL and brand, so a row that
+    is analyzed twice overwrites its own document. A row is appended to the
+    checkpoint log only after the batch holding it commits, or straight away
+    if it failed before reaching Firestore.
+    """
+
+    def __init__(self, collection: str, checkpoint_path: str, client: Any = None):
+        self.collection = collection
+        self.checkpoint_path = checkpoint_path
+        self._client = client
+        self._writer = None
+        self._checkpoint = None
+        self._lock = threading.Lock()
+        # Document ID -> checkpoint records waiting for their batch to commit
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+
+    def completed(self, retry_failed: bool) -> Dict[int, str]:
+        return read_checkpoint(self.checkpoint_path, retry_failed)
+
+    def open(self):
+        from app.utils.firestore_batch import BatchedWriter
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        self._checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+        if self._client is None:
+            from app.utils.firebase_utils import get_db
+            self._client = get_db()
+        self._writer = BatchedWriter(client=self._client, on_commit=self._on_commit)
+        self._writer.start()
+
+    @staticmethod
+    def document_id(image_url: str, brand_id: Optional[int]) -> str:
+        # Same IDs as the brand rollup insights, so both collections can be joined
+        from app.utils.brand_rollups import insight_document_id
+        return insight_document_id(image_url, brand_id)
+
+    def _record(self, records: List[Dict[str, Any]]):
+        with self._lock:
+            for record in records:
+                self._checkpoint.write(json.dumps(record) + "\n")
+            self._checkpoint.flush()
+
+    def _on_commit(self, ops):
+        committed = []
+        with self._lock:
+            for op in ops:
+                pending = self._pending.get(op.document_id)
+                if pending:
+                    # The same image can appear on several rows; each write commits one of them
+                    committed.append(pending.pop(0))
+                    if not pending:
+                        del self._pending[op.document_id]
+        self._record(committed)
+
+    def write(self, record: Dict[str, Any]):
+        checkpoint_record = {key: record[key] for key in ("row", "image_url") if key in record}
+        if record.get("result") is None:
+            checkpoint_record["error"] = record.get("error")
+            self._record([checkpoint_record])
+            return
+
+        document_id = self.document_id(record["image_url"], record.get("brand_id"))
+        data = dict(record["result"])
+        data.update({"image_url": record["image_url"], "analyzed_at": time.time()})
+        if record.get("brand_id") is not None:
+            data["brand_id"] = record["brand_id"]
+        with self._lock:
+            self._pending.setdefault(document_id, []).append(checkpoint_record)
+        self._writer.set(self.collection, document_id, data)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            stats = self._writer.stats()
+            if stats["failed_ops"]:
+                logger.error(
+                    f"{stats['failed_ops']} Firestore writes failed ({stats['last_error']}); "
+                    "run again with the same arguments to retry them"
+                )
+            self._writer = None
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            self._checkpoint = None
+
+
+class Progress:
+    """Counters for the run, logged every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.skipped = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.stopped = False
+        self._last_report = self.started
+
+    def maybe_report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        done = self.succeeded + self.failed
+        elapsed = max(now - self.started, 1e-9)
+        logger.info(
+            f"{done} analyzed ({self.failed} failed), {self.skipped} skipped from the checkpoint, "
+            f"{done / elapsed:.1f} images/s"
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 1),
+            "images_per_second": round((self.succeeded + self.failed) / elapsed, 2) if elapsed else None,
+            "stopped": self.stopped,
+        }
+
+
+async def _analyze(row_number: int, row: Dict[str, Any], use_cache: bool) -> Dict[str, Any]:
+    from app.llm_controllers.gemini_controller import get_ad_details
+
+    record = {"row": row_number, "image_url": row.get("image_url"), "brand_id": row.get("brand_id")}
+    if "error" in row:
+        record["error"] = {"status_code": status.HTTP_400_BAD_REQUEST, "detail": row["error"]}
+        return record
+    try:
+        record["result"] = await get_ad_details(
+            image_url=row["image_url"],
+            brand_id=row["brand_id"],
+            use_cache=use_cache,
+        )
+    except HTTPException as http_ex:
+        record["error"] = {"status_code": http_ex.status_code, "detail": http_ex.detail}
+    except Exception as e:
+        record["error"] = {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": str(e)}
+    return record
+
+
+async def run(args, sink) -> Dict[str, Any]:
+    """
+    Analyze every input row not already in the checkpoint.
+
+    Returns:
+        dict: Succeeded, failed and skipped counts and throughput
+    """
+    from app.utils.telemetry import init_sentry
+    from app.utils.brand_rollups import close_brand_rollups
+    from app.utils.firestore_batch import close_batched_writer
+    from app.llm_controllers.gemini_controller import (
+        close_clients,
+        init_clients,
+        load_near_duplicate_index,
+        save_near_duplicate_index,
+    )
+
+    completed = await asyncio.to_thread(sink.completed, args.retry_failed)
+    if completed:
+        logger.info(f"Resuming: {len(completed)} rows already recorded")
+
+    init_sentry()
+    await init_clients()
+    await load_near_duplicate_index()
+    await asyncio.to_thread(sink.open)
+
+    progress = Progress()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.parallelism * 2)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def request_stop():
+        # The first signal lets in-flight rows finish and be checkpointed; a second one aborts
+        logger.info("Stopping after the rows in flight; press Ctrl+C again to abort")
+        progress.stopped = True
+        stop.set()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+
+    try:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, request_stop)
+    except NotImplementedError:
+        # Windows event loops: Ctrl+C aborts, the checkpoint is still consistent
+        pass
+
+    async def produce():
+        # Rows are streamed so a large input is never held in memory
+        for row_number, row in read_rows(args.input, args.format):
+            if stop.is_set():
+                break
+            if row_number in completed:
+                if completed[row_number] not in (None, row.get("image_url")):
+                    raise CheckpointMismatchError(
+                        f"Row {row_number} of {args.input} does not match the checkpoint; "
+                        "the input changed since the interrupted run"
+                    )
+                progress.skipped += 1
+                continue
+            await queue.put((row_number, row))
+        for _ in range(args.parallelism):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if stop.is_set():
+                # Drain the queue so the producer can finish; these rows run on resume
+                continue
+            record = await _analyze(item[0], item[1], not args.no_cache)
+            sink.write(record)
+            if record.get("result") is not None:
+                progress.succeeded += 1
+            else:
+                progress.failed += 1
+                logger.info(f"Row {record['row']} failed: {record['error']['detail']}")
+            progress.maybe_report()
+
+    workers = [asyncio.ensure_future(work()) for _ in range(args.parallelism)]
+    producer = asyncio.ensure_future(produce())
+    tasks = [producer] + workers
+    try:
+        # A failing sink write kills its worker; without the others noticing, the
+        # producer would block on a full queue forever
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        # Never close the clients under a worker that is still analyzing
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(sink.close)
+        await close_clients()
+        await save_near_duplicate_index()
+        # Rollup updates recorded by get_ad_details when BRAND_ROLLUPS_ENABLED is set
+        await asyncio.to_thread(close_brand_rollups)
+        await asyncio.to_thread(close_batched_writer)
+    progress.maybe_report(force=True)
+    return progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL or CSV file with image_url and optional brand_id")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format, detected from the extension by default")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output", help="JSONL file to append results to")
+    destination.add_argument("--collection", help="Firestore collection to write results to")
+    parser.add_argument("--checkpoint", help="Checkpoint log for --collection, defaults to <input>.checkpoint.jsonl")
+    parser.add_argument("--parallelism", type=int, default=8, help="Images analyzed at the same time")
+    parser.add_argument("--retry-failed", action="store_true", help="Analyze rows that failed in an earlier run again")
+    parser.add_argument("--no-cache", action="store_true", help="Skip the result cache and near-duplicate reuse")
+    parser.add_argument("--verbose", action="store_true", help="Log every request, not just progress")
+    args = parser.parse_args()
+    args.parallelism = max(1, args.parallelism)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not args.verbose:
+        # The app's loggers log every request at INFO; keep only progress and problems
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(lambda record: record.levelno >= logging.WARNING or record.name == logger.name)
+
+    if args.output:
+        sink = JsonlSink(args.output)
+    else:
+        sink = FirestoreSink(args.collection, args.checkpoint or f"{args.input}.checkpoint.jsonl")
+
+    try:
+        summary = asyncio.run(run(args, sink))
+    except CheckpointMismatchError as e:
+        parser.exit(2, f"{str(e)}\n")
+    except Exception as e:
+        # e.g. the output file or Firestore stopped accepting writes; recorded rows are kept
+        logger.exception("Bulk analysis failed")
+        parser.exit(1, f"Failed: {str(e)}; run the same command again to resume\n")
+    except KeyboardInterrupt:
+        sys.stderr.write("Interrupted; run the same command again to resume\n")
+        raise SystemExit(130)
+    print(json.dumps(summary))
+    if summary["stopped"]:
+        sys.stderr.write("Stopped; run the same command again to resume\n")
+        raise SystemExit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Summarize `python -X importtime` for the app's cold-start import path.
+
+Usage:
+    python scripts/importtime_report.py
+    python scripts/importtime_report.py --module main --top 30 --json importtime.json
+    python scripts/importtime_report.py --max-total-ms 800   # exit 1 on regression
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str):
+    """
+    Import module in a fresh interpreter with -X importtime and parse the timings.
+
+    Args:
+        module (str): Module to import, e.g. "app.main"
+
+    Returns:
+        list: One dict per imported module with self_us, cumulative_us and depth
+    """
+    env = dict(os.environ)
+    # The app must import without real credentials
+    env.setdefault("GEMINI_API_KEY", "importtime")
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=project_root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"Importing {module} failed")
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self_us": int(match.group(1)),
+                "cumulative_us": int(match.group(2)),
+                "depth": len(match.group(3)) // 2,
+            })
+    return entries
+
+
+def summarize(entries, module: str, top: int):
+    root = next((entry for entry in entries if entry["module"] == module), None)
+    by_package = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0) + entry["self_us"]
+
+    return {
+        "module": module,
+        "total_ms": round(root["cumulative_us"] / 1000, 1) if root else None,
+        "modules_imported": len(entries),
+        "top_cumulative": [
+            {"module": entry["module"], "cumulative_ms": round(entry["cumulative_us"] / 1000, 1)}
+            for entry in sorted(entries, key=lambda entry: entry["cumulative_us"], reverse=True)[:top]
+        ],
+        "top_packages_self": [
+            {"package": package, "self_ms": round(self_us / 1000, 1)}
+            for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--top", type=int, default=20, help="Number of rows to show")
+    parser.add_argument("--runs", type=int, default=3, help="Imports to run; the fastest is reported")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path")
+    parser.add_argument("--max-total-ms", type=float, help="Exit with status 1 if the import takes longer")
+    args = parser.parse_args()
+
+    # The first run also compiles bytecode, so keep the fastest of several runs
+    reports = [summarize(measure(args.module), args.module, args.top) for _ in range(max(1, args.runs))]
+    report = min(reports, key=lambda report: report["total_ms"] or 0)
+
+    print(f"import {report['module']}: {report['total_ms']} ms, {report['modules_imported']} modules")
+    print("\nSlowest imports (cumulative):")
+    for row in report["top_cumulative"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    print("\nSlowest top-level packages (self time):")
+    for row in report["top_packages_self"]:
+        print(f"  {row['self_ms']:>9.1f} ms  {row['package']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_total_ms is not None and report["total_ms"] > args.max_total_ms:
+        print(f"\nImport time {report['total_ms']} ms exceeds the {args.max_total_ms} ms budget")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
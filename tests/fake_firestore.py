@@ -0,0 +1,182 @@
+"""
+An in-memory stand-in for the parts of the Firestore client BatchedWriter
+and the firebase_utils document helpers use.
+"""
+import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FakeDocumentReference:
+    def __init__(self, collection: str, document_id: str, client: Optional["FakeFirestore"] = None):
+        self.collection = collection
+        self.id = document_id
+        self._client = client
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.collection, self.id
+
+    def get(self) -> "FakeSnapshot":
+        snapshot = self._client.get_all([self])[0]
+        if self._client.after_read is not None:
+            # Runs after the document was read but before the caller sees it
+            self._client.after_read()
+        return snapshot
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._client._apply([("set", self, data, merge)])
+
+    def update(self, data: Dict[str, Any]):
+        self._client._apply([("update", self, data, False)])
+
+    def delete(self):
+        self._client._apply([("delete", self, None, False)])
+
+    def on_snapshot(self, callback) -> "FakeWatch":
+        return self._client._watch(self, callback)
+
+
+class FakeWatch:
+    def __init__(self, client: "FakeFirestore", key: Tuple[str, str], callback):
+        self._client = client
+        self.key = key
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client.watches.remove(self)
+
+
+class FakeSnapshot:
+    def __init__(self, document_id: str, data: Optional[Dict[str, Any]]):
+        self.id = document_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+
+def _is_transform(value: Any, name: str) -> bool:
+    return type(value).__module__.startswith("google.cloud.firestore") and type(value).__name__ == name
+
+
+def _merge(current: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply data over current like set(merge=True): nested maps merge, Increment adds, SERVER_TIMESTAMP is now."""
+    merged = dict(current)
+    for key, value in data.items():
+        if isinstance(value, dict):
+            existing = merged.get(key)
+            merged[key] = _merge(existing if isinstance(existing, dict) else {}, value)
+        elif _is_transform(value, "Increment"):
+            existing = merged.get(key)
+            merged[key] = (existing if isinstance(existing, (int, float)) else 0) + value.value
+        elif _is_transform(value, "Sentinel"):
+            merged[key] = time.time()
+        else:
+            merged[key] = value
+    return merged
+
+
+class FakeCollectionReference:
+    def __init__(self, name: str, client: Optional["FakeFirestore"] = None):
+        self.name = name
+        self._client = client
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self.name, document_id or uuid.uuid4().hex[:20], self._client)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self._client = client
+        self._writes: List[Tuple[str, FakeDocumentReference, Optional[Dict[str, Any]], bool]] = []
+
+    def set(self, ref: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(("set", ref, data, merge))
+
+    def update(self, ref: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append(("update", ref, data, False))
+
+    def delete(self, ref: FakeDocumentReference):
+        self._writes.append(("delete", ref, None, False))
+
+    def commit(self):
+        self._client._apply(self._writes)
+
+
+class FakeFirestore:
+    """
+    Documents live in a dict keyed by (collection, document_id).
+
+    Set fail_commits to make the next commits raise, and hold the commit
+    gate (clear it) to make commits block until it is set again. Snapshot
+    listeners are called as writes commit, unless hold_snapshots is set, in
+    which case they wait for deliver_snapshots().
+    """
+
+    def __init__(self):
+        self.documents: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.commits: List[int] = []
+        self.reads = 0
+        self.fail_commits = 0
+        self.commit_gate = threading.Event()
+        self.commit_gate.set()
+        self.after_read = None
+        self.watches: List[FakeWatch] = []
+        self.hold_snapshots = False
+        self._pending: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(name, self)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def get_all(self, refs):
+        with self._lock:
+            self.reads += len(refs)
+            return [FakeSnapshot(ref.id, self.documents.get(ref.key)) for ref in refs]
+
+    def get(self, collection: str, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.documents.get((collection, document_id))
+
+    def _apply(self, writes):
+        self.commit_gate.wait()
+        with self._lock:
+            if self.fail_commits:
+                self.fail_commits -= 1
+                raise RuntimeError("commit failed")
+            # A batch is atomic: apply to a copy and keep it only if every write succeeds
+            documents = dict(self.documents)
+            for kind, ref, data, merge in writes:
+                if kind == "set":
+                    documents[ref.key] = _merge(documents.get(ref.key, {}) if merge else {}, data)
+                elif kind == "update":
+                    if ref.key not in documents:
+                        raise KeyError(f"No document to update: {ref.collection}/{ref.id}")
+                    documents[ref.key] = {**documents[ref.key], **data}
+                elif kind == "delete":
+                    documents.pop(ref.key, None)
+            self.documents = documents
+            self.commits.append(len(writes))
+        self._pending.extend(ref.key for _, ref, _, _ in writes)
+        if not self.hold_snapshots:
+            self.deliver_snapshots()
+
+    def _watch(self, ref: FakeDocumentReference, callback) -> FakeWatch:
+        watch = FakeWatch(self, ref.key, callback)
+        self.watches.append(watch)
+        # Like Firestore, the first snapshot carries the current state
+        callback([FakeSnapshot(ref.id, self.get(*ref.key))], [], None)
+        return watch
+
+    def deliver_snapshots(self):
+        pending, self._pending = self._pending, []
+        for key in dict.fromkeys(pending):
+            snapshot = FakeSnapshot(key[1], self.get(*key))
+            for watch in [watch for watch in self.watches if watch.key == key]:
+                watch.callback([snapshot], [], None)
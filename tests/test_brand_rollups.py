@@ -0,0 +1,179 @@
+import pytest
+
+from app.utils import firebase_utils
+from app.utils.brand_rollups import (
+    AD_INSIGHTS_COLLECTION,
+    BRAND_ROLLUPS_COLLECTION,
+    BrandRollups,
+    insight_document_id,
+    rebuild_rollups,
+)
+from app.utils.firestore_batch import BatchedWriter
+from tests.fake_firestore import FakeFirestore
+
+
+def _insights(**overrides):
+    details = {
+        "Contrast in Adv": "High",
+        "Gender": "Unisex",
+        "Headline Size": "Large",
+        "Subheadline Size": "Medium",
+        "Engagement Prediction": "Likely",
+        "Overall Sentiment": "Exciting, upbeat",
+        "CTA Button": "Shop now",
+        "Offer in Adv": "20% off",
+        "Performance Claim": None,
+    }
+    details.update(overrides)
+    return details
+
+
+@pytest.fixture
+def client():
+    return FakeFirestore()
+
+
+@pytest.fixture
+def rollups(client):
+    writer = BatchedWriter(client=client, flush_interval=0.01)
+    recorder = BrandRollups(client=client, writer=writer, flush_interval=0.01, commit_timeout=5)
+    yield recorder
+    recorder.close(timeout=5)
+    writer.close(timeout=5)
+
+
+def _apply(rollups, *analyses):
+    for brand_id, image_url, details in analyses:
+        assert rollups.record(brand_id, image_url, details)
+    assert rollups.flush(timeout=5)
+
+
+def _rollup(client, brand_id):
+    document = client.get(BRAND_ROLLUPS_COLLECTION, str(brand_id))
+    return document["count"], {
+        name: {bucket: count for bucket, count in histogram.items() if count}
+        for name, histogram in document["histograms"].items()
+    }
+
+
+def test_first_analyses_are_counted(client, rollups):
+    _apply(
+        rollups,
+        (1, "https://example.com/a.jpg", _insights()),
+        (1, "https://example.com/b.jpg", _insights(Gender="Female", **{"Offer in Adv": "None"})),
+        (2, "https://example.com/c.jpg", _insights()),
+    )
+
+    count, histograms = _rollup(client, 1)
+    assert count == 2
+    assert histograms["gender"] == {"Unisex": 1, "Female": 1}
+    assert histograms["offer"] == {"Present": 1, "None": 1}
+    assert histograms["sentiment"] == {"exciting": 2}
+    assert _rollup(client, 2)[0] == 1
+    stored = client.get(AD_INSIGHTS_COLLECTION, insight_document_id("https://example.com/a.jpg", 1))
+    assert stored["brand_id"] == 1 and stored["Gender"] == "Unisex"
+
+
+def test_reanalysis_moves_counts_instead_of_adding_them(client, rollups):
+    _apply(rollups, (1, "https://example.com/a.jpg", _insights()))
+    _apply(
+        rollups,
+        (1, "https://example.com/a.jpg", _insights(Gender="Male", **{"CTA Button": "Learn more"})),
+    )
+
+    count, histograms = _rollup(client, 1)
+    assert count == 1
+    assert histograms["gender"] == {"Male": 1}
+    assert histograms["cta_button"] == {"learn more": 1}
+    assert rollups.stats()["applied"] == 2
+
+
+def test_reanalysis_within_one_group_is_counted_once(client, rollups):
+    _apply(
+        rollups,
+        (1, "https://example.com/a.jpg", _insights()),
+        (1, "https://example.com/a.jpg", _insights(Gender="Female")),
+    )
+
+    count, histograms = _rollup(client, 1)
+    assert count == 1
+    assert histograms["gender"] == {"Female": 1}
+
+
+def test_unchanged_reanalysis_writes_no_increment(client, rollups):
+    _apply(rollups, (1, "https://example.com/a.jpg", _insights()))
+    writes = rollups.stats()["rollup_writes"]
+    _apply(rollups, (1, "https://example.com/a.jpg", _insights(**{"Key Message": "reworded"})))
+
+    assert rollups.stats()["rollup_writes"] == writes
+    assert rollups.stats()["unchanged"] == 1
+    assert _rollup(client, 1)[0] == 1
+
+
+@pytest.fixture
+def firestore_helpers(client, monkeypatch):
+    """Point the firebase_utils helpers rebuild_rollups uses at the fake."""
+
+    def stream_collection(collection, filters=None, fields=None, page_size=500, **kwargs):
+        for (name, document_id), data in list(client.documents.items()):
+            if name != collection:
+                continue
+            if filters and any(data.get(field) != value for field, _, value in filters):
+                continue
+            yield {**data, "id": document_id}
+
+    def add_document(collection, data, document_id=None):
+        batch = client.batch()
+        batch.set(client.collection(collection).document(document_id), data)
+        batch.commit()
+
+    def delete_document(collection, document_id):
+        batch = client.batch()
+        batch.delete(client.collection(collection).document(document_id))
+        batch.commit()
+
+    monkeypatch.setattr(firebase_utils, "stream_collection", stream_collection)
+    monkeypatch.setattr(firebase_utils, "add_document", add_document)
+    monkeypatch.setattr(firebase_utils, "delete_document", delete_document)
+
+
+def test_rebuild_matches_the_incremental_totals(client, rollups, firestore_helpers):
+    _apply(
+        rollups,
+        (1, "https://example.com/a.jpg", _insights()),
+        (1, "https://example.com/b.jpg", _insights(Gender="Female")),
+        (2, "https://example.com/c.jpg", _insights(**{"Performance Claim": "Fastest ever"})),
+    )
+    _apply(
+        rollups,
+        (1, "https://example.com/a.jpg", _insights(**{"Contrast in Adv": "Low"})),
+        (2, "https://example.com/d.jpg", _insights()),
+    )
+    incremental = {brand_id: _rollup(client, brand_id) for brand_id in (1, 2)}
+
+    assert rebuild_rollups() == {1: 2, 2: 2}
+    assert {brand_id: _rollup(client, brand_id) for brand_id in (1, 2)} == incremental
+
+
+def test_rebuild_deletes_rollups_of_brands_without_insights(client, rollups, firestore_helpers):
+    _apply(rollups, (3, "https://example.com/a.jpg", _insights()))
+    client.documents.pop((AD_INSIGHTS_COLLECTION, insight_document_id("https://example.com/a.jpg", 3)))
+
+    assert rebuild_rollups() == {}
+    assert client.get(BRAND_ROLLUPS_COLLECTION, "3") is None
+
+
+def test_group_gives_up_after_the_commit_timeout(client):
+    writer = BatchedWriter(client=client, flush_interval=0.01)
+    recorder = BrandRollups(client=client, writer=writer, flush_interval=0.01, commit_timeout=0.2)
+    try:
+        client.commit_gate.clear()
+        recorder.record(1, "https://example.com/a.jpg", _insights())
+        # The group's writes cannot commit, so it gives up after the commit timeout
+        assert recorder.flush(timeout=5)
+        assert recorder.stats()["failed"] == 1
+        assert "not committed" in recorder.stats()["last_error"]
+    finally:
+        client.commit_gate.set()
+        recorder.close(timeout=5)
+        writer.close(timeout=5)
@@ -0,0 +1,128 @@
+import json
+import asyncio
+import argparse
+
+import pytest
+from fastapi import HTTPException
+
+import bulk_analyze
+from app.llm_controllers import gemini_controller
+
+
+class Calls(list):
+    """Image URLs analyzed, plus the URLs whose analysis should fail."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Replace the model call and client lifecycle."""
+    calls = Calls()
+
+    async def get_ad_details(image_url, brand_id=None, use_cache=True):
+        calls.append(image_url)
+        if image_url in calls.failing:
+            raise HTTPException(status_code=502, detail="Gemini API unavailable")
+        return {"Product Name": image_url.rsplit("/", 1)[-1]}
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(gemini_controller, "get_ad_details", get_ad_details)
+    for name in ("init_clients", "close_clients", "load_near_duplicate_index", "save_near_duplicate_index"):
+        monkeypatch.setattr(gemini_controller, name, noop)
+    return calls
+
+
+def _input(tmp_path, count):
+    path = tmp_path / "images.jsonl"
+    with open(path, "w") as f:
+        for n in range(count):
+            f.write(json.dumps({"image_url": f"https://example.com/{n}.jpg", "brand_id": n % 3}) + "\n")
+    return str(path)
+
+
+def _args(input_path, parallelism=4, retry_failed=False):
+    return argparse.Namespace(
+        input=input_path, format=None, parallelism=parallelism, retry_failed=retry_failed, no_cache=False
+    )
+
+
+def _records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def _run(args, sink):
+    return asyncio.run(asyncio.wait_for(bulk_analyze.run(args, sink), timeout=10))
+
+
+def test_resume_skips_recorded_rows_and_drops_a_torn_line(tmp_path, analyzed):
+    input_path = _input(tmp_path, 6)
+    output = tmp_path / "out.jsonl"
+    # An interrupted run recorded rows 0 and 2 and crashed while writing row 3
+    with open(output, "w") as f:
+        f.write(json.dumps({"row": 0, "image_url": "https://example.com/0.jpg", "result": {}}) + "\n")
+        f.write(json.dumps({"row": 2, "image_url": "https://example.com/2.jpg", "result": {}}) + "\n")
+        f.write('{"row": 3, "image_url": "https://exa')
+
+    summary = _run(_args(input_path), bulk_analyze.JsonlSink(str(output)))
+
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (4, 0, 2)
+    assert sorted(analyzed) == [f"https://example.com/{n}.jpg" for n in (1, 3, 4, 5)]
+    assert sorted(record["row"] for record in _records(output)) == [0, 1, 2, 3, 4, 5]
+
+    analyzed.clear()
+    summary = _run(_args(input_path), bulk_analyze.JsonlSink(str(output)))
+    assert (summary["succeeded"], summary["skipped"]) == (0, 6)
+    assert analyzed == []
+
+
+def test_resume_rejects_an_input_that_changed(tmp_path, analyzed):
+    input_path = _input(tmp_path, 3)
+    output = tmp_path / "out.jsonl"
+    with open(output, "w") as f:
+        f.write(json.dumps({"row": 1, "image_url": "https://example.com/other.jpg", "result": {}}) + "\n")
+
+    with pytest.raises(bulk_analyze.CheckpointMismatchError):
+        _run(_args(input_path), bulk_analyze.JsonlSink(str(output)))
+
+
+def test_failed_rows_run_again_only_with_retry_failed(tmp_path, analyzed):
+    input_path = _input(tmp_path, 4)
+    output = str(tmp_path / "out.jsonl")
+    analyzed.failing.add("https://example.com/2.jpg")
+
+    summary = _run(_args(input_path), bulk_analyze.JsonlSink(output))
+    assert (summary["succeeded"], summary["failed"]) == (3, 1)
+    failed = [record for record in _records(output) if record.get("error")]
+    assert [(record["row"], record["error"]["status_code"]) for record in failed] == [(2, 502)]
+
+    analyzed.clear()
+    analyzed.failing.clear()
+    summary = _run(_args(input_path), bulk_analyze.JsonlSink(output))
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (0, 0, 4)
+
+    summary = _run(_args(input_path, retry_failed=True), bulk_analyze.JsonlSink(output))
+    assert (summary["succeeded"], summary["skipped"]) == (1, 3)
+    assert analyzed == ["https://example.com/2.jpg"]
+    # The retried row's success supersedes its earlier failure
+    assert bulk_analyze.read_checkpoint(output, retry_failed=True).keys() == {0, 1, 2, 3}
+
+
+class FailingSink(bulk_analyze.JsonlSink):
+    def write(self, record):
+        raise OSError("No space left on device")
+
+
+def test_sink_failure_stops_the_run_instead_of_hanging(tmp_path, analyzed):
+    input_path = _input(tmp_path, 50)
+    sink = FailingSink(str(tmp_path / "out.jsonl"))
+
+    # TimeoutError is an OSError too, so match the sink's own error
+    with pytest.raises(OSError, match="No space left"):
+        _run(_args(input_path, parallelism=2), sink)
+    assert len(analyzed) < 50
@@ -0,0 +1,84 @@
+import time
+
+from app.utils.cache import DiskCache, LRUCache, TwoTierCache
+
+VALUE = "x" * 200
+
+
+def test_disk_cache_evicts_oldest_down_to_the_low_water_mark(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10_000, low_water=0.5)
+
+    evicting_writes = 0
+    for n in range(300):
+        before = cache.evictions
+        cache.set(f"{n:04d}", VALUE)
+        evicting_writes += cache.evictions > before
+        assert cache.stats()["bytes"] <= 10_000
+
+    assert cache.get("0299") == VALUE
+    assert cache.get("0000") is None
+    # Each eviction frees half the cache, so most writes at capacity evict nothing
+    entries_per_eviction = cache.evictions // evicting_writes
+    assert entries_per_eviction >= 10
+    assert evicting_writes <= 300 // entries_per_eviction
+
+
+def test_disk_cache_walks_the_directory_once(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=5_000)
+    for n in range(200):
+        cache.set(f"{n:04d}", VALUE)
+        cache.get(f"{n:04d}")
+    cache.delete("0199")
+
+    assert cache.stats()["scans"] == 1
+    on_disk = sum(path.stat().st_size for path in tmp_path.rglob("*.json"))
+    assert cache.stats()["bytes"] == on_disk
+
+
+def test_disk_cache_index_is_rebuilt_from_existing_files(tmp_path):
+    first = DiskCache(str(tmp_path), max_bytes=1_000_000)
+    for n in range(5):
+        first.set(f"{n:04d}", VALUE)
+    first.set("0000", "replaced")
+
+    second = DiskCache(str(tmp_path), max_bytes=1_000_000)
+    second.set("0005", VALUE)
+    assert second.stats()["entries"] == 6
+    assert second.stats()["bytes"] == sum(path.stat().st_size for path in tmp_path.rglob("*.json"))
+    assert second.get("0000") == "replaced"
+
+
+def test_disk_cache_expires_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=60)
+    cache.set("fresh", 1)
+    cache.set("stale", 2, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("fresh") == 1
+    assert cache.get("stale") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    assert stats["entries"] == 1
+
+
+def test_promoted_disk_hit_keeps_its_remaining_ttl(tmp_path):
+    disk = DiskCache(str(tmp_path), ttl=100)
+    disk.set("key", {"a": 1})
+    _, disk_expires_at = disk.get_with_expiry("key")
+
+    cache = TwoTierCache(LRUCache(ttl=1000), disk)
+    assert cache.get("key") == {"a": 1}
+
+    memory_expires_at, _ = cache.memory._data["key"]
+    assert abs(memory_expires_at - disk_expires_at) < 1.0
+    assert cache.stats()["hits"] == 1
+
+
+def test_promoted_disk_hit_never_outlives_the_memory_ttl(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.set("key", "value")
+
+    cache = TwoTierCache(LRUCache(ttl=5), disk)
+    assert cache.get("key") == "value"
+    memory_expires_at, _ = cache.memory._data["key"]
+    assert memory_expires_at <= time.time() + 5
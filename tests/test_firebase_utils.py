@@ -0,0 +1,90 @@
+import pytest
+
+from app.utils import firebase_utils
+from tests.fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeFirestore()
+    monkeypatch.setattr(firebase_utils, "_db", client)
+    monkeypatch.setattr(firebase_utils, "FIRESTORE_CACHE_DEFAULT_TTL", 60.0)
+    monkeypatch.setattr(firebase_utils, "FIRESTORE_CACHE_TTLS", {})
+    firebase_utils.read_cache.clear()
+    yield client
+    for collection, document_id in list(firebase_utils._watches):
+        firebase_utils.unwatch_document(collection, document_id)
+    firebase_utils.read_cache.clear()
+
+
+def _put(client, document_id, data):
+    # A write from another process: the local cache is not told about it
+    batch = client.batch()
+    batch.set(client.collection("brands").document(document_id), data)
+    batch.commit()
+
+
+def test_reads_are_cached_until_a_local_write(client):
+    _put(client, "b1", {"name": "Acme"})
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme"}
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme"}
+    assert client.reads == 1
+
+    firebase_utils.update_document("brands", "b1", {"name": "Acme Inc"})
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme Inc"}
+    firebase_utils.delete_document("brands", "b1")
+    assert firebase_utils.get_document("brands", "b1") is None
+    assert client.reads == 3
+
+
+def test_cached_copy_cannot_be_mutated_by_the_caller(client):
+    _put(client, "b1", {"name": "Acme"})
+    firebase_utils.get_document("brands", "b1")["name"] = "changed"
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme"}
+
+
+def test_read_that_races_a_write_does_not_cache_stale_data(client):
+    _put(client, "b1", {"name": "Acme"})
+
+    def write_during_read():
+        client.after_read = None
+        firebase_utils.update_document("brands", "b1", {"name": "Acme Inc"})
+
+    client.after_read = write_during_read
+    # The in-flight read returns what it fetched, but must not cache it
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme"}
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme Inc"}
+
+
+def test_watched_document_is_served_from_the_listener(client):
+    _put(client, "b1", {"name": "Acme"})
+    firebase_utils.watch_document("brands", "b1")
+
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme"}
+    _put(client, "b1", {"name": "Remote edit"})
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Remote edit"}
+    assert client.reads == 0
+    assert firebase_utils.get_read_cache_stats()["watched_documents"] == 1
+
+
+def test_local_write_to_a_watched_document_is_seen_before_the_listener_fires(client):
+    _put(client, "b1", {"name": "Acme"})
+    firebase_utils.watch_document("brands", "b1")
+    client.hold_snapshots = True
+
+    firebase_utils.update_document("brands", "b1", {"name": "Acme Inc"})
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme Inc"}
+
+    client.deliver_snapshots()
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Acme Inc"}
+    assert client.reads == 1
+
+
+def test_unwatched_document_is_read_again(client):
+    _put(client, "b1", {"name": "Acme"})
+    firebase_utils.watch_document("brands", "b1")
+    firebase_utils.unwatch_document("brands", "b1")
+
+    _put(client, "b1", {"name": "Remote edit"})
+    assert firebase_utils.get_document("brands", "b1") == {"name": "Remote edit"}
+    assert client.watches == []
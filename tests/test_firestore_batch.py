@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from app.utils.firestore_batch import BatchedWriter, WriteQueueFullError
+from tests.fake_firestore import FakeFirestore
+
+
+def _writer(client, **kwargs):
+    kwargs.setdefault("flush_interval", 0.01)
+    return BatchedWriter(client=client, **kwargs)
+
+
+def test_writes_are_committed_in_batches_of_at_most_max_batch_size():
+    client = FakeFirestore()
+    writer = _writer(client, max_batch_size=4, flush_interval=0.2)
+
+    for index in range(10):
+        writer.set("ads", f"ad-{index}", {"index": index})
+    assert writer.flush(timeout=5)
+
+    assert client.get("ads", "ad-7") == {"index": 7}
+    assert sum(client.commits) == 10
+    assert max(client.commits) <= 4
+    assert writer.stats()["committed"] == 10
+    assert writer.close(timeout=5)
+
+
+def test_set_merge_update_delete_and_add():
+    client = FakeFirestore()
+    writer = _writer(client)
+
+    writer.set("brands", "b1", {"name": "Acme", "tier": "gold"})
+    writer.set("brands", "b1", {"tier": "silver"}, merge=True)
+    writer.set("brands", "b2", {"name": "Other"})
+    writer.update("brands", "b2", {"active": False})
+    writer.set("brands", "b3", {"name": "Gone"})
+    writer.delete("brands", "b3")
+    document_id = writer.add("brands", {"name": "New"})
+    assert writer.close(timeout=5)
+
+    assert client.get("brands", "b1") == {"name": "Acme", "tier": "silver"}
+    assert client.get("brands", "b2") == {"name": "Other", "active": False}
+    assert client.get("brands", "b3") is None
+    assert client.get("brands", document_id) == {"name": "New"}
+
+
+def test_failed_batch_is_reported_and_later_batches_still_commit():
+    client = FakeFirestore()
+    client.fail_commits = 1
+    errors = []
+    writer = _writer(client, on_error=errors.append)
+
+    writer.set("ads", "lost", {"n": 1})
+    assert writer.flush(timeout=5)
+    writer.set("ads", "kept", {"n": 2})
+    assert writer.close(timeout=5)
+
+    assert [op.document_id for op in errors[0].ops] == ["lost"]
+    assert client.get("ads", "lost") is None
+    assert client.get("ads", "kept") == {"n": 2}
+    stats = writer.stats()
+    assert (stats["failed_batches"], stats["failed_ops"], stats["committed"]) == (1, 1, 1)
+    assert stats["last_error"] == "commit failed"
+
+
+def test_commit_callback_runs_after_accounting_and_cannot_fail_the_batch():
+    client = FakeFirestore()
+    errors = []
+    seen = []
+
+    def on_commit(ops):
+        seen.append((len(ops), writer.committed, writer.batches))
+        raise RuntimeError("cache invalidation failed")
+
+    writer = _writer(client, on_commit=on_commit, on_error=errors.append)
+    writer.set("ads", "a1", {"n": 1})
+    assert writer.close(timeout=5)
+
+    assert seen == [(1, 1, 1)]
+    assert errors == []
+    assert writer.stats()["failed_batches"] == 0
+    assert client.get("ads", "a1") == {"n": 1}
+
+
+def test_close_returns_within_timeout_when_the_queue_is_full():
+    client = FakeFirestore()
+    client.commit_gate.clear()
+    writer = _writer(client, max_batch_size=1, max_queue_size=1, enqueue_timeout=5)
+    try:
+        writer.set("ads", "a1", {"n": 1})
+        # The flusher is stuck committing a1, so a2 fills the queue
+        writer.set("ads", "a2", {"n": 2})
+
+        started = time.monotonic()
+        assert writer.close(timeout=0.2) is False
+        assert time.monotonic() - started < 1.0
+    finally:
+        client.commit_gate.set()
+
+
+def test_enqueue_times_out_on_a_full_queue_and_fails_after_close():
+    client = FakeFirestore()
+    client.commit_gate.clear()
+    writer = _writer(client, max_batch_size=1, max_queue_size=1, enqueue_timeout=0.05)
+    try:
+        writer.set("ads", "a1", {"n": 1})
+        writer.set("ads", "a2", {"n": 2})
+        with pytest.raises(WriteQueueFullError):
+            writer.set("ads", "a3", {"n": 3})
+    finally:
+        client.commit_gate.set()
+    assert writer.close(timeout=5)
+
+    with pytest.raises(RuntimeError):
+        writer.set("ads", "a4", {"n": 4})
+    assert client.get("ads", "a2") == {"n": 2}
+
+
+def test_barrier_is_set_once_earlier_writes_are_committed():
+    client = FakeFirestore()
+    client.commit_gate.clear()
+    # A long flush interval: the barrier must not wait for its batch to fill up
+    writer = _writer(client, flush_interval=30)
+    try:
+        writer.set("ads", "a1", {"n": 1})
+        done = writer.barrier()
+        writer.set("ads", "a2", {"n": 2})
+        assert not done.wait(0.05)
+
+        client.commit_gate.set()
+        assert done.wait(5)
+        assert client.get("ads", "a1") == {"n": 1}
+        assert writer.stats()["enqueued"] == 2
+    finally:
+        client.commit_gate.set()
+        assert writer.close(timeout=5)
+    assert writer.stats()["committed"] == 2
@@ -0,0 +1,82 @@
+import json
+import random
+
+from app.utils.hash_index import BKTree, HammingIndex, hamming_distance
+
+
+def _flip(value_hash, bits):
+    for bit in bits:
+        value_hash ^= 1 << bit
+    return value_hash
+
+
+def test_search_matches_a_linear_scan_at_every_threshold():
+    rng = random.Random(7)
+    base = rng.getrandbits(64)
+    # Clusters of near neighbours plus unrelated hashes, so every branch of the tree is used
+    hashes = [_flip(base, rng.sample(range(64), rng.randint(0, 12))) for _ in range(300)]
+    hashes += [rng.getrandbits(64) for _ in range(300)]
+    tree = BKTree()
+    for value_hash in hashes:
+        tree.add(value_hash, f"{value_hash:016x}")
+
+    unique = set(hashes)
+    for max_distance in (0, 1, 4, 8, 16):
+        for query in (base, _flip(base, [3, 40]), rng.getrandbits(64)):
+            expected = sorted(
+                (hamming_distance(query, value_hash), f"{value_hash:016x}")
+                for value_hash in unique
+                if hamming_distance(query, value_hash) <= max_distance
+            )
+            matches = tree.search(query, max_distance)
+            assert sorted(matches) == expected
+            assert [distance for distance, _ in matches] == sorted(distance for distance, _ in matches)
+
+
+def test_threshold_is_inclusive():
+    tree = BKTree()
+    tree.add(0, "zero")
+    tree.add(_flip(0, range(8)), "eight bits away")
+    tree.add(_flip(0, range(9)), "nine bits away")
+
+    assert tree.search(0, 8) == [(0, "zero"), (8, "eight bits away")]
+    assert tree.search(_flip(0, [63]), 0) == []
+
+
+def test_adding_a_known_hash_replaces_its_value():
+    tree = BKTree()
+    tree.add(0b1010, "old")
+    tree.add(0b1011, "neighbour")
+    tree.add(0b1010, "new")
+
+    assert len(tree) == 2
+    assert tree.search(0b1010, 0) == [(0, "new")]
+
+
+def test_tree_round_trips_through_its_nodes():
+    rng = random.Random(3)
+    tree = BKTree()
+    for n in range(200):
+        tree.add(rng.getrandbits(64), n)
+
+    rebuilt = BKTree.from_nodes(json.loads(json.dumps(tree.nodes())))
+    query = tree.hashes[17]
+    assert rebuilt.search(query, 20) == tree.search(query, 20)
+
+
+def test_index_reloads_from_snapshot_and_log(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = HammingIndex(path, compact_every=3)
+    for n in range(5):
+        index.add(_flip(0, [n]), f"ad-{n}")
+    # Three entries went into the snapshot; the other two are only in the log
+    with open(f"{path}.log", "a") as f:
+        f.write('[12, "to')
+
+    reloaded = HammingIndex(path)
+    assert reloaded.search(0, 1) == [(1, f"ad-{n}") for n in range(5)]
+    assert reloaded.stats()["entries"] == 5
+
+    reloaded.save()
+    assert open(f"{path}.log").read() == ""
+    assert len(HammingIndex(path).search(0, 1)) == 5
@@ -0,0 +1,152 @@
+import time
+import asyncio
+import sqlite3
+from app.utils.job_queue import (
+    JOB_FAILED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    LEASE_EXPIRED_ERROR,
+    JobQueue,
+    SQLiteJobBackend,
+)
+
+
+def _backend(tmp_path):
+    return SQLiteJobBackend(str(tmp_path / "jobs.db"))
+
+
+def test_expired_lease_is_reclaimed_while_attempts_remain(tmp_path):
+    backend = _backend(tmp_path)
+    job = backend.enqueue("ad_insights", {"image_url": "https://example.com/a.jpg"}, max_attempts=2)
+
+    first = backend.claim(lease_seconds=0)
+    time.sleep(0.01)
+    second = backend.claim(lease_seconds=60)
+
+    assert first["id"] == second["id"] == job["id"]
+    assert second["status"] == JOB_RUNNING
+    assert second["attempts"] == 2
+    backend.close()
+
+
+def test_expired_lease_without_attempts_left_fails_the_job(tmp_path):
+    backend = _backend(tmp_path)
+    job = backend.enqueue("ad_insights", {"image_url": "https://example.com/a.jpg"}, max_attempts=1)
+
+    assert backend.claim(lease_seconds=0)["attempts"] == 1
+    time.sleep(0.01)
+
+    # The worker died holding the last attempt; the job must not be claimed again
+    assert backend.claim(lease_seconds=60) is None
+    stored = backend.get(job["id"])
+    assert stored["status"] == JOB_FAILED
+    assert stored["error"] == LEASE_EXPIRED_ERROR
+    assert stored["attempts"] == 1
+    backend.close()
+
+
+def test_live_lease_is_not_reclaimed(tmp_path):
+    backend = _backend(tmp_path)
+    backend.enqueue("ad_insights", {"image_url": "https://example.com/a.jpg"}, max_attempts=3)
+
+    assert backend.claim(lease_seconds=60) is not None
+    assert backend.claim(lease_seconds=60) is None
+    backend.close()
+
+
+def test_stale_attempt_cannot_complete_a_reclaimed_job(tmp_path):
+    backend = _backend(tmp_path)
+    job = backend.enqueue("ad_insights", {"image_url": "https://example.com/a.jpg"}, max_attempts=3)
+
+    first = backend.claim(lease_seconds=0)
+    time.sleep(0.01)
+    second = backend.claim(lease_seconds=60)
+
+    assert backend.complete(job["id"], {"from": "first"}, attempt=first["attempts"]) is False
+    assert backend.fail(job["id"], "late", None, attempt=first["attempts"]) is False
+    assert backend.get(job["id"])["status"] == JOB_RUNNING
+    assert backend.complete(job["id"], {"from": "second"}, attempt=second["attempts"]) is True
+    assert backend.get(job["id"])["result"] == {"from": "second"}
+    backend.close()
+
+
+def test_renewed_lease_is_not_reclaimed(tmp_path):
+    backend = _backend(tmp_path)
+    job = backend.enqueue("ad_insights", {"image_url": "https://example.com/a.jpg"}, max_attempts=3)
+
+    claimed = backend.claim(lease_seconds=0.05)
+    assert backend.renew(job["id"], claimed["attempts"], lease_seconds=60) is True
+    time.sleep(0.1)
+    assert backend.claim(lease_seconds=60) is None
+    assert backend.renew(job["id"], claimed["attempts"] + 1, lease_seconds=60) is False
+    backend.close()
+
+
+class FlakyBackend(SQLiteJobBackend):
+    """Raises on the first complete(), like a locked database or a Firestore timeout."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.complete_errors = 1
+
+    def complete(self, job_id, result, attempt=None):
+        if self.complete_errors:
+            self.complete_errors -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().complete(job_id, result, attempt)
+
+
+def test_worker_survives_backend_errors(tmp_path):
+    backend = FlakyBackend(str(tmp_path / "jobs.db"))
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload["n"])
+        return {"n": payload["n"]}
+
+    async def main():
+        queue = JobQueue(backend, {"echo": handler}, workers=1, lease_seconds=0.3, poll_interval=0.02)
+        await queue.start()
+        jobs = [await queue.enqueue("echo", {"n": n}) for n in range(2)]
+        try:
+            for _ in range(200):
+                stored = [await queue.get(job["id"]) for job in jobs]
+                if all(job["status"] == JOB_SUCCEEDED for job in stored):
+                    return stored
+                await asyncio.sleep(0.02)
+            raise AssertionError(f"Jobs did not finish: {stored}")
+        finally:
+            await queue.stop()
+
+    stored = asyncio.run(main())
+    # The job whose outcome could not be recorded ran again after its lease expired
+    assert sorted(calls) == [0, 0, 1]
+    assert sorted(job["attempts"] for job in stored) == [1, 2]
+
+
+def test_slow_job_keeps_its_lease_and_runs_once(tmp_path):
+    backend = _backend(tmp_path)
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        await asyncio.sleep(0.5)
+        return "done"
+
+    async def main():
+        queue = JobQueue(backend, {"slow": handler}, workers=2, lease_seconds=0.15, poll_interval=0.02)
+        await queue.start()
+        job = await queue.enqueue("slow", {})
+        try:
+            for _ in range(100):
+                stored = await queue.get(job["id"])
+                if stored["status"] == JOB_SUCCEEDED:
+                    return stored
+                await asyncio.sleep(0.02)
+            raise AssertionError(f"Job did not finish: {stored}")
+        finally:
+            await queue.stop()
+
+    stored = asyncio.run(main())
+    assert len(calls) == 1
+    assert stored["attempts"] == 1
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from app.llm_controllers.json_stream import IncrementalJSONObjectParser
+
+DOCUMENT = {
+    "Product Name": 'The "Ultra" Blender',
+    "Key Message": "Blend {anything}, [really] anything, in 10s",
+    "Escapes": "back\\slash \\\" and a tab\t and é",
+    "Colors": {"primary": "#ff0000", "palette": ["red", {"name": "white, bright"}], "empty": {}},
+    "Offers": [[1, 2], [], {"percent": 20}],
+    "CTA Button": None,
+    "Score": -1.5e3,
+    "Has Logo": True,
+}
+
+
+def _feed(text, chunk_size):
+    parser = IncrementalJSONObjectParser()
+    members = []
+    for start in range(0, len(text), chunk_size):
+        members.extend(parser.feed(text[start:start + chunk_size]))
+    return parser, members
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 100_000])
+def test_members_match_the_whole_object_for_any_chunking(chunk_size):
+    text = "```json\n" + json.dumps(DOCUMENT, indent=2) + "\n```"
+    parser, members = _feed(text, chunk_size)
+
+    assert members == list(DOCUMENT.items())
+    assert parser.done and parser.result == DOCUMENT
+
+
+def test_key_split_across_chunks_is_emitted_once_complete():
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"Prod') == []
+    assert parser.feed('uct Na') == []
+    assert parser.feed('me": "Bl') == []
+    # A member is complete only once the following comma arrives
+    assert parser.feed('ender"') == []
+    assert parser.feed(', "Gen') == [("Product Name", "Blender")]
+    assert parser.feed('der": "Unisex"}') == [("Gender", "Unisex")]
+    assert parser.result == {"Product Name": "Blender", "Gender": "Unisex"}
+
+
+def test_escaped_quote_split_from_its_backslash():
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"Headline": "Say \\') == []
+    assert parser.feed('"hi\\", }{ ",') == [("Headline", 'Say "hi", }{ ')]
+    assert parser.feed('"Size": "Large"}') == [("Size", "Large")]
+
+
+def test_nested_object_is_emitted_only_when_closed():
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"Colors": {"primary": "red", ') == []
+    assert parser.feed('"accents": ["a", "b"]}, ') == [("Colors", {"primary": "red", "accents": ["a", "b"]})]
+    assert parser.feed('"Done": true}') == [("Done", True)]
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"a": 1}\n```\n{"b": 2}') == [("a", 1)]
+    assert parser.feed('{"c": 3}') == []
+    assert parser.result == {"a": 1}
+
+
+def test_malformed_member_is_skipped_without_stopping_the_stream():
+    parser = IncrementalJSONObjectParser()
+    members = parser.feed('{"a": 1, "b": nope, "c": [3]}')
+
+    assert members == [("a", 1), ("c", [3])]
+    assert parser.done and parser.result is None
@@ -0,0 +1,63 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.llm_controllers.image_processing import PERCEPTUAL_HASHES
+from app.utils.hash_index import hamming_distance
+
+# The default NEAR_DUPLICATE_MAX_DISTANCE
+MAX_DISTANCE = 8
+
+
+def _ad(variant=0, size=(600, 400)):
+    """A synthetic creative: a gradient background with a few solid shapes."""
+    width, height = size
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    if variant == 0:
+        draw.rectangle([width * 0.1, height * 0.15, width * 0.45, height * 0.6], fill=(220, 40, 40))
+        draw.ellipse([width * 0.55, height * 0.2, width * 0.9, height * 0.8], fill=(30, 30, 200))
+        draw.rectangle([width * 0.1, height * 0.75, width * 0.5, height * 0.9], fill=(250, 250, 250))
+    else:
+        draw.ellipse([width * 0.05, height * 0.5, width * 0.4, height * 0.95], fill=(250, 250, 250))
+        draw.rectangle([width * 0.5, height * 0.05, width * 0.95, height * 0.4], fill=(10, 10, 10))
+    return image
+
+
+def _encode(image, image_format="PNG", **kwargs):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **kwargs)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("name", sorted(PERCEPTUAL_HASHES))
+def test_hash_is_stable_across_re_encoding_and_resizing(name):
+    image_hash = PERCEPTUAL_HASHES[name]
+    original = image_hash(_encode(_ad()))
+
+    copies = [
+        _encode(_ad(), "JPEG", quality=95),
+        _encode(_ad(), "JPEG", quality=40),
+        # Re-encoded twice, as happens when an ad is downloaded and re-uploaded
+        _encode(Image.open(BytesIO(_encode(_ad(), "JPEG", quality=70))), "JPEG", quality=60),
+        _encode(_ad(size=(300, 200))),
+        _encode(_ad(size=(1200, 800)), "JPEG", quality=85),
+        _encode(_ad(), "WEBP", quality=75),
+    ]
+    for copy in copies:
+        assert hamming_distance(original, image_hash(copy)) <= MAX_DISTANCE
+
+
+@pytest.mark.parametrize("name", sorted(PERCEPTUAL_HASHES))
+def test_different_creatives_are_far_apart(name):
+    image_hash = PERCEPTUAL_HASHES[name]
+    assert hamming_distance(image_hash(_encode(_ad(0))), image_hash(_encode(_ad(1)))) > MAX_DISTANCE
+
+
+@pytest.mark.parametrize("name", sorted(PERCEPTUAL_HASHES))
+def test_hash_is_deterministic_and_64_bits(name):
+    image_bytes = _encode(_ad(), "JPEG", quality=80)
+    value = PERCEPTUAL_HASHES[name](image_bytes)
+    assert value == PERCEPTUAL_HASHES[name](image_bytes)
+    assert 0 <= value < 1 << 64
@@ -0,0 +1,170 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from google import genai
+from google.genai import types
+
+from app.llm_controllers.prompt_cache import PromptCache
+from app.llm_controllers.prompts import PromptTemplate
+from benchmarks.fake_gemini import FakeGemini, create_app
+
+MODEL = "gemini-2.0-flash"
+SHORT_PREFIX = PromptTemplate("short", "Describe the ad. " * 40)
+LONG_PREFIX = PromptTemplate("long", "Describe every element of the ad in detail. " * 500)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def _run(fake: FakeGemini, scenario):
+    """Serve the fake in-process and run scenario(client, stats) against it."""
+
+    async def main():
+        runner = web.AppRunner(create_app(fake))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        base_url = f"http://127.0.0.1:{port}/"
+        client = genai.Client(api_key="test", http_options=types.HttpOptions(base_url=base_url))
+
+        async def stats():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{base_url}stats") as response:
+                    return await response.json()
+
+        try:
+            await scenario(client, stats)
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def _fake(**kwargs) -> FakeGemini:
+    kwargs.setdefault("latency_ms", 0)
+    kwargs.setdefault("jitter_ms", 0)
+    return FakeGemini(**kwargs)
+
+
+def test_prefix_is_created_once_and_reused_by_generate_calls():
+    cache = PromptCache(enabled=True, min_tokens=4096)
+
+    async def scenario(client, stats):
+        names = [await cache.resolve(client, MODEL, LONG_PREFIX) for _ in range(3)]
+        assert len(set(names)) == 1 and names[0] is not None
+        for _ in range(2):
+            await client.aio.models.generate_content(
+                model=MODEL,
+                contents="image goes here",
+                config=types.GenerateContentConfig(cached_content=names[0]),
+            )
+
+        served = await stats()
+        assert served["token_counts"] == 1
+        assert served["cache_creates"] == 1
+        assert served["cache_reuses"] == 2
+        assert served["cached_contents"][names[0]]["reuses"] == 2
+        assert cache.stats()["created"] == 1
+        assert cache.stats()["referenced"] == 3
+
+        await cache.close(client)
+        assert (await stats())["cached_contents"] == {}
+
+    _run(_fake(), scenario)
+
+
+def test_prefix_below_the_minimum_is_sent_inline_without_create_attempts():
+    clock = FakeClock()
+    cache = PromptCache(enabled=True, min_tokens=4096, retry_seconds=60, clock=clock)
+
+    async def scenario(client, stats):
+        for _ in range(3):
+            assert await cache.resolve(client, MODEL, SHORT_PREFIX) is None
+            clock.advance(3600)
+
+        served = await stats()
+        assert served["token_counts"] == 1
+        assert served["cache_creates"] == 0
+        assert served["cache_rejected"] == 0
+        assert cache.stats()["below_minimum"] == 1
+        assert cache.stats()["inline"] == 3
+        assert cache.stats()["failures"] == 0
+
+    _run(_fake(), scenario)
+
+
+def test_ttl_is_extended_near_expiry():
+    clock = FakeClock()
+    cache = PromptCache(enabled=True, ttl_seconds=600, refresh_margin_seconds=60, clock=clock)
+
+    async def scenario(client, stats):
+        name = await cache.resolve(client, MODEL, LONG_PREFIX)
+        clock.advance(500)
+        assert await cache.resolve(client, MODEL, LONG_PREFIX) == name
+        assert (await stats())["cache_updates"] == 0
+
+        clock.advance(60)
+        assert await cache.resolve(client, MODEL, LONG_PREFIX) == name
+        served = await stats()
+        assert (served["cache_creates"], served["cache_updates"]) == (1, 1)
+        assert cache.stats()["refreshed"] == 1
+
+    _run(_fake(), scenario)
+
+
+def test_rejected_create_falls_back_inline_until_the_retry_interval():
+    clock = FakeClock()
+    # Without a token count, the API's own minimum rejects the create
+    cache = PromptCache(enabled=True, retry_seconds=600, min_tokens=0, clock=clock)
+
+    async def scenario(client, stats):
+        assert await cache.resolve(client, MODEL, SHORT_PREFIX) is None
+        clock.advance(599)
+        assert await cache.resolve(client, MODEL, SHORT_PREFIX) is None
+        assert (await stats())["cache_rejected"] == 1
+
+        clock.advance(1)
+        assert await cache.resolve(client, MODEL, SHORT_PREFIX) is None
+        served = await stats()
+        assert (served["cache_rejected"], served["cache_creates"], served["token_counts"]) == (2, 0, 0)
+        assert cache.stats()["failures"] == 2
+
+    _run(_fake(), scenario)
+
+
+def test_invalidated_prefix_is_recreated():
+    cache = PromptCache(enabled=True, min_tokens=4096)
+
+    async def scenario(client, stats):
+        first = await cache.resolve(client, MODEL, LONG_PREFIX)
+        await client.aio.caches.delete(name=first)
+        cache.invalidate(MODEL, LONG_PREFIX, first)
+
+        second = await cache.resolve(client, MODEL, LONG_PREFIX)
+        assert second is not None and second != first
+        served = await stats()
+        assert (served["cache_creates"], served["token_counts"]) == (2, 1)
+        assert cache.stats()["invalidated"] == 1
+
+    _run(_fake(), scenario)
+
+
+def test_disabled_cache_never_calls_the_api():
+    cache = PromptCache(enabled=False, min_tokens=4096)
+
+    async def scenario(client, stats):
+        assert await cache.resolve(client, MODEL, LONG_PREFIX) is None
+        served = await stats()
+        assert (served["cache_creates"], served["token_counts"]) == (0, 0)
+
+    _run(_fake(), scenario)
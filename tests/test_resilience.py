@@ -0,0 +1,322 @@
+import asyncio
+
+import pytest
+
+from app.llm_controllers.resilience import (
+    AIMDLimiter,
+    CallPolicy,
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgePolicy,
+    TokenBucket,
+    classify_error,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+def test_token_bucket_refills_at_rate_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=4.0, clock=clock)
+
+    asyncio.run(bucket.acquire(4.0))
+    assert bucket.stats()["available"] == 0
+
+    clock.advance(1.0)
+    assert bucket.stats()["available"] == 2.0
+
+    clock.advance(10.0)
+    assert bucket.stats()["available"] == 4.0
+    assert bucket.waits == 0
+
+
+def test_token_bucket_adjust_charges_and_refunds():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=10.0, clock=clock)
+
+    bucket.adjust(15.0)
+    assert bucket.stats()["available"] == -5.0
+
+    clock.advance(3.0)
+    bucket.adjust(-1.0)
+    assert bucket.stats()["available"] == -1.0
+
+    bucket.adjust(-100.0)
+    assert bucket.stats()["available"] == 10.0
+
+
+def test_aimd_halves_once_per_cooldown_and_grows_additively():
+    clock = FakeClock()
+    limiter = AIMDLimiter(initial=16, minimum=2, maximum=32, backoff=0.5, cooldown=1.0, clock=clock)
+
+    limiter.on_throttle()
+    assert limiter.limit == 8
+
+    # A burst of 429s inside the cooldown lowers the limit only once
+    clock.advance(0.5)
+    limiter.on_throttle()
+    assert limiter.limit == 8
+    assert limiter.throttled == 2
+
+    clock.advance(0.5)
+    limiter.on_throttle()
+    assert limiter.limit == 4
+
+    # Additive increase: about one step per limit's worth of successes
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.9 < limiter.limit < 5.0
+    limiter.on_success()
+    assert limiter.stats()["limit"] == 5
+
+
+def test_aimd_respects_minimum_and_maximum():
+    clock = FakeClock()
+    limiter = AIMDLimiter(initial=3, minimum=2, maximum=4, cooldown=1.0, clock=clock)
+
+    for _ in range(5):
+        limiter.on_throttle()
+        clock.advance(1.0)
+    assert limiter.limit == 2
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 4
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0, clock=clock)
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(10.0)
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(20.0)
+
+    # After the timeout one probe goes through and others are held back
+    clock.advance(20.0)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "opened": 1, "rejected": 2}
+
+
+def test_circuit_breaker_failed_probe_reopens_for_a_full_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5.0, clock=clock)
+
+    breaker.before_call()
+    breaker.record_failure()
+    clock.advance(5.0)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(4.0)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.advance(1.0)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_circuit_breaker_ignored_outcome_releases_the_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5.0, clock=clock)
+
+    breaker.before_call()
+    breaker.record_failure()
+    clock.advance(5.0)
+    breaker.before_call()
+    breaker.record_ignored()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_hedge_records_a_lower_bound_for_the_cancelled_request():
+    policy = HedgePolicy(percentile=0.5, budget=1.0, min_delay=0.02, min_samples=3)
+    for _ in range(3):
+        policy.record("insights:1", 0.01)
+    durations = iter([5.0, 0.0])
+
+    async def request():
+        await asyncio.sleep(next(durations))
+        return "ok"
+
+    async def main():
+        result = await policy.call("insights:1", request)
+        # Let the cancelled primary run its cleanup
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "ok"
+    assert (policy.fired, policy.won) == (1, 1)
+    samples = sorted(policy._latencies["insights:1"])
+    # The backup's own latency and the primary's time until it was cancelled
+    assert len(samples) == 5
+    assert samples[-1] >= 0.02
+
+
+class FlakyCall:
+    """Fails with the given errors in order, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    async def __call__(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _policy(clock=None, failure_threshold=5, max_attempts=4, concurrency=8):
+    clock = clock or FakeClock()
+    return CallPolicy(
+        requests_per_second=None,
+        tokens_per_minute=None,
+        concurrency=AIMDLimiter(concurrency, cooldown=1.0, clock=clock),
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=30.0, clock=clock),
+        max_attempts=max_attempts,
+        base_delay=0,
+        max_delay=0,
+    )
+
+
+def test_call_retries_retryable_errors_until_success():
+    policy = _policy()
+    fn = FlakyCall(APIError(503), ConnectionResetError())
+
+    assert asyncio.run(policy.call(fn)) == "ok"
+    assert fn.attempts == 3
+    assert (policy.calls, policy.retries, policy.failures) == (1, 2, 0)
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_does_not_retry_client_errors():
+    policy = _policy()
+    fn = FlakyCall(APIError(400))
+
+    with pytest.raises(APIError):
+        asyncio.run(policy.call(fn))
+    assert fn.attempts == 1
+    assert policy.failures == 1
+    assert policy.concurrency.in_flight == 0
+
+
+def test_repeated_server_errors_open_the_breaker():
+    policy = _policy(failure_threshold=2, max_attempts=2)
+    fn = FlakyCall(APIError(503), APIError(503))
+
+    with pytest.raises(APIError):
+        asyncio.run(policy.call(fn))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.call(FlakyCall()))
+
+
+def test_throttling_lowers_the_concurrency_limit_without_opening_the_breaker():
+    policy = _policy(failure_threshold=1, concurrency=8)
+    fn = FlakyCall(APIError(429))
+
+    assert asyncio.run(policy.call(fn)) == "ok"
+    assert policy.concurrency.throttled == 1
+    assert 4 < policy.concurrency.limit < 5
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def _half_open_policy(clock):
+    policy = _policy(clock, failure_threshold=1, max_attempts=1, concurrency=1)
+    with pytest.raises(APIError):
+        asyncio.run(policy.call(FlakyCall(APIError(503))))
+    clock.advance(30.0)
+    return policy
+
+
+def test_probe_cancelled_while_waiting_for_a_limiter_is_released():
+    clock = FakeClock()
+    policy = _half_open_policy(clock)
+
+    async def main():
+        # Another call holds the only concurrency slot, so the probe waits for it
+        await policy.concurrency.acquire()
+        probe = asyncio.ensure_future(policy.call(FlakyCall()))
+        await asyncio.sleep(0.01)
+        assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        await policy.concurrency.release()
+        return await policy.call(FlakyCall())
+
+    assert asyncio.run(main()) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_cancelled_during_the_call_is_released():
+    clock = FakeClock()
+    policy = _half_open_policy(clock)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def main():
+        probe = asyncio.ensure_future(policy.call(hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await policy.call(FlakyCall())
+
+    assert asyncio.run(main()) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+    assert policy.concurrency.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    "exc, expected",
+    [
+        (APIError(429), (True, True)),
+        (APIError(503), (True, False)),
+        (APIError(500), (True, False)),
+        (APIError(400), (False, False)),
+        (APIError(404), (False, False)),
+        (asyncio.TimeoutError(), (True, False)),
+        (ConnectionResetError(), (True, False)),
+        (ValueError("bad schema"), (False, False)),
+    ],
+)
+def test_classify_error(exc, expected):
+    assert classify_error(exc) == expected
+
+
+def test_classify_error_treats_http_transport_errors_as_retryable():
+    transport_error = type("ReadTimeout", (Exception,), {"__module__": "httpx"})
+    assert classify_error(transport_error()) == (True, False)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+class Upstream:
+    """Counts calls and blocks each one until released."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"call": self.calls}
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flight = SingleFlight()
+
+    async def main():
+        upstream = Upstream()
+        callers = [asyncio.ensure_future(flight.do("ad-1", upstream)) for _ in range(5)]
+        other = asyncio.ensure_future(flight.do("ad-2", upstream))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return upstream, await asyncio.gather(*callers), await other
+
+    upstream, results, other = asyncio.run(main())
+    assert upstream.calls == 2
+    assert all(result is results[0] for result in results)
+    assert other is not results[0]
+    assert flight.stats() == {"in_flight": 0, "calls": 6, "executions": 2, "coalesced": 4}
+
+
+def test_failed_leader_fails_its_waiters_but_not_later_calls():
+    flight = SingleFlight()
+
+    async def main():
+        upstream = Upstream(ConnectionError("upstream reset"))
+        callers = [asyncio.ensure_future(flight.do("ad-1", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+        # The failure is not cached: the next call runs the work again
+        return upstream, outcomes, await flight.do("ad-1", upstream)
+
+    upstream, outcomes, retried = asyncio.run(main())
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert retried == {"call": 2}
+    assert upstream.calls == 2
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_does_not_cancel_the_work_for_waiters():
+    flight = SingleFlight()
+
+    async def main():
+        upstream = Upstream()
+        leader = asyncio.ensure_future(flight.do("ad-1", upstream))
+        waiter = asyncio.ensure_future(flight.do("ad-1", upstream))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        upstream.release.set()
+        return upstream, await waiter
+
+    upstream, result = asyncio.run(main())
+    assert result == {"call": 1}
+    assert upstream.calls == 1